@@ -1,47 +1,338 @@
 import os
 import re
 import json
+import gzip
+import hashlib
 from datetime import datetime
-from collections import Counter
-import statistics
+from collections import Counter, OrderedDict
+from collections.abc import Sequence
+import math
+import heapq
+import bisect
+import zlib
+import threading
+import pickle
+import sqlite3
+import time
+import atexit
+import argparse
+import multiprocessing
+import asyncio
+import random
+import functools
+import unicodedata
+import mmap
+import contextlib
+import itertools
+import platform
+import tempfile
+import shutil
+import tracemalloc
+from array import array
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 # vou tentar importar essas bibliotecas de inicio 
+# (o NLTK não entra aqui - ele é opcional e só é carregado quando alguém precisa)
 try:
-    import nltk
     from PyPDF2 import PdfReader
 except ImportError as e:
     print(f"❌ Falta alguma biblioteca: {e}")
-    print("💡 Tenta: pip install nltk PyPDF2")
+    print("💡 Tenta: pip install PyPDF2")
     exit()
 
+# NumPy é opcional - sem ele a busca semântica fica desligada e o resto funciona igual
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Trava de arquivo entre processos: fcntl no Linux/Mac, msvcrt no Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 # Configurações - vou deixar aqui em cima pra ficar fácil de achar
 PASTA_INPUTS = "./inputs/"
-ARQUIVO_HISTORICO = "historico_conversas.json" 
+ARQUIVO_HISTORICO = "historico_conversas.jsonl"  # uma conversa por linha, só acrescenta
+ARQUIVO_HISTORICO_ANTIGO = "historico_conversas.json"  # formato antigo, migra sozinho
+HISTORICO_FSYNC_LOTE = 8  # faz fsync a cada N conversas (e sempre ao sair)
+HISTORICO_MAX_MB = 5  # passou disso, o arquivo é rotacionado
+HISTORICO_ROTACOES = 3  # quantos arquivos antigos (.1, .2, ...) manter
 ARQUIVO_CHAVES = "api_keys.json"
 MAX_PREVIEW = 300
+RESUMO_SENTENCAS = 5  # frases no resumo do modo sem IA
+RESUMO_TERMOS_POR_SENTENCA = 20  # no grafo do resumo, cada frase só liga pelos seus N termos mais fortes
+RESUMO_DF_MAX = 0.2  # termo em mais que essa fração das frases vira "hub" e fica de fora do grafo
 CONTEXTO_BUSCA = 100
+USAR_NLTK = False  # True usa o NLTK na análise, se ele e os dados dele já estiverem instalados (ou --nltk)
+PASTA_CACHE = "./.cache_chatbot/"
+CACHE_MAX_MB = 200  # limite do cache de extrações em disco
+VERSAO_CACHE = 2  # muda isso se o formato das extrações mudar
+WORKERS_EXTRACAO = 0  # processos pra extrair PDF; 0 = um por núcleo, 1 = sem paralelismo
+PAGINAS_MIN_PARALELO = 40  # abaixo disso abrir processos custa mais do que ganha
+ARMAZEM_MAPEADO = True  # guarda o texto extraído num arquivo binário aberto com mmap (abre na hora)
+LIMITE_CONTEXTO_TOKENS = 1500  # tokens de documento no prompt (o modelo pode limitar ainda mais)
+TAMANHO_TRECHO = 800  # tamanho dos trechos que o modo com IA ranqueia
+SOBREPOSICAO_TRECHO = 200
+USAR_VETORES = True  # busca semântica junto com o BM25 (precisa do numpy)
+EMBEDDER_PADRAO = "hashing"  # "hashing" roda offline; "openai" usa a API de embeddings
+DIMENSAO_EMBEDDING = 256
+IVF_MIN_VETORES = 50000  # a partir daqui o índice vetorial particiona em grupos (IVF)
+IVF_SONDAGENS = 8  # quantos grupos olhar em cada consulta
+VETORES_COMPACTAR = 0.2  # fração de linhas de documentos removidos que dispara a compactação do índice vetorial
+MODELO_IA = "gpt-3.5-turbo"
+MAX_TOKENS_RESPOSTA = 800
+TEMPERATURA = 0.3
+# Janela de contexto (em tokens) de cada modelo - o que não estiver aqui usa a do padrão
+JANELA_MODELOS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "padrao": 4096
+}
+CACHE_TOKENS_MAX = 50000  # contagens de tokens guardadas (por texto e por trecho de documento)
+MEMORIA_TOKENS = 1000  # quanto a conversa anterior (resumo + últimas trocas) pode ocupar no prompt
+MEMORIA_TURNOS_LITERAIS = 3  # últimas perguntas/respostas que vão inteiras; as antigas viram resumo
+MEMORIA_RESUMIR_COM_IA = True  # False resume localmente (sem gastar chamada da API)
+CACHE_RESPOSTAS_TTL = 7 * 24 * 3600  # segundos até uma resposta guardada vencer
+CACHE_RESPOSTAS_MAX = 5000  # respostas guardadas no máximo (sai a usada há mais tempo)
+CACHE_RESPOSTAS_APROXIMADO = False  # ignora maiúsculas e espaços extras na pergunta
+MAX_EM_VOO = 8  # chamadas simultâneas à API no motor assíncrono
+LIMITE_RPM = 500  # requisições por minuto permitidas pela conta
+LIMITE_TPM = 200000  # tokens por minuto permitidos pela conta
+TENTATIVAS_API = 5  # tentativas em 429/5xx antes de desistir
+VIGIAR_PASTA = True  # pré-processa em segundo plano o que aparecer/mudar na pasta inputs
+INTERVALO_VIGIA = 2.0  # segundos entre cada olhada na pasta
+WORKERS_INGESTAO = 2  # threads pré-processando arquivos em segundo plano
+TENTATIVAS_INGESTAO = 3  # quantas vezes o vigia tenta um arquivo que deu erro antes de esperar ele mudar
+POOL_MB = 256  # memória (estimada) que os documentos carregados podem ocupar no modo interativo
+SERVIDOR_HOST = "127.0.0.1"
+SERVIDOR_PORTA = 8080
+SERVIDOR_POOL_MB = 512  # memória (estimada) que os documentos carregados podem ocupar no servidor
+SERVIDOR_MAX_CORPO = 1024 * 1024  # tamanho máximo do corpo de uma requisição
+SERVIDOR_MAX_CABECALHOS = 100  # quantos cabeçalhos uma requisição pode ter
+SERVIDOR_MAX_BYTES_CABECALHOS = 16 * 1024  # tamanho somado dos cabeçalhos
+SERVIDOR_TIMEOUT = 30  # segundos esperando cada parte da requisição (linha, cabeçalhos, corpo)
+BYTES_POR_CARACTERE = 12  # estimativa de memória por caractere de documento (texto, índices, trechos)
+METRICAS_ATIVAS = False  # mede tempos e contadores (liga também com --metricas ou pelo menu)
+ARQUIVO_METRICAS = "metricas_chatbot"  # vira .json e .prom na exportação
 
 # Criar pasta se não existir - isso sempre esqueço
 if not os.path.exists(PASTA_INPUTS):
     os.makedirs(PASTA_INPUTS)
     print(f"📁 Criada pasta {PASTA_INPUTS}")
 
+# Métricas: tempos e contadores dos pontos quentes (extração, análise, OpenAI, histórico)
+# Desligado, cada ponto medido custa só um "if" - dá pra deixar no código sem medo
+class Metricas:
+    def __init__(self, ativo=False):
+        self.ativo = ativo
+        self.trava = threading.Lock()
+        self.contadores = Counter()
+        self.tempos = {}  # nome -> [chamadas, total_segundos, maior]
+        self.inicio = time.time()
+        self.perfil = None
+    
+    def contar(self, nome, quantidade=1):
+        if not self.ativo:
+            return
+        with self.trava:
+            self.contadores[nome] += quantidade
+    
+    def registrar_tempo(self, nome, segundos):
+        with self.trava:
+            registro = self.tempos.get(nome)
+            if registro is None:
+                self.tempos[nome] = [1, segundos, segundos]
+            else:
+                registro[0] += 1
+                registro[1] += segundos
+                registro[2] = max(registro[2], segundos)
+    
+    def medir(self, nome):
+        """Pra usar com "with" em volta de um bloco"""
+        if not self.ativo:
+            return _SEM_MEDICAO
+        return self._medir(nome)
+    
+    @contextlib.contextmanager
+    def _medir(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_tempo(nome, time.perf_counter() - inicio)
+    
+    def cronometrado(self, nome):
+        """Decorador: mede cada chamada da função (se as métricas estiverem ligadas)"""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def medida(*args, **kwargs):
+                if not self.ativo:
+                    return funcao(*args, **kwargs)
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    self.registrar_tempo(nome, time.perf_counter() - inicio)
+            return medida
+        return decorador
+    
+    def zerar(self):
+        with self.trava:
+            self.contadores.clear()
+            self.tempos.clear()
+            self.inicio = time.time()
+    
+    def relatorio(self):
+        with self.trava:
+            contadores = dict(self.contadores)
+            tempos = {
+                nome: {
+                    'chamadas': chamadas,
+                    'total_s': round(total, 6),
+                    'media_ms': round(total / chamadas * 1000, 3),
+                    'max_ms': round(maior * 1000, 3)
+                }
+                for nome, (chamadas, total, maior) in sorted(self.tempos.items())
+            }
+        derivados = {}
+        extracao = tempos.get('extracao')
+        if extracao and extracao['total_s']:
+            derivados['paginas_por_segundo'] = round(contadores.get('paginas_extraidas', 0) / extracao['total_s'], 2)
+        for cache in ('cache_extracao', 'cache_respostas'):
+            acertos = contadores.get(f'{cache}.acertos', 0)
+            total = acertos + contadores.get(f'{cache}.falhas', 0)
+            if total:
+                derivados[f'{cache}.taxa_acerto'] = round(acertos / total, 4)
+        return {
+            'desde': datetime.fromtimestamp(self.inicio).isoformat(),
+            'contadores': contadores,
+            'tempos': tempos,
+            'derivados': derivados
+        }
+    
+    @staticmethod
+    def _nome_prometheus(nome):
+        return "chatbot_" + re.sub(r'[^a-zA-Z0-9_]', '_', nome)
+    
+    def texto_prometheus(self):
+        """Mesmo conteúdo do relatório, no formato texto que o Prometheus lê"""
+        dados = self.relatorio()
+        linhas = []
+        for nome, valor in sorted(dados['contadores'].items()):
+            metrica = self._nome_prometheus(nome) + "_total"
+            linhas += [f"# TYPE {metrica} counter", f"{metrica} {valor}"]
+        for nome, tempo in dados['tempos'].items():
+            metrica = self._nome_prometheus(nome) + "_segundos"
+            linhas += [
+                f"# TYPE {metrica} summary",
+                f"{metrica}_count {tempo['chamadas']}",
+                f"{metrica}_sum {tempo['total_s']}"
+            ]
+        for nome, valor in sorted(dados['derivados'].items()):
+            metrica = self._nome_prometheus(nome)
+            linhas += [f"# TYPE {metrica} gauge", f"{metrica} {valor}"]
+        return "\n".join(linhas) + "\n"
+    
+    def exportar(self, base=None):
+        base = base or ARQUIVO_METRICAS
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.relatorio(), f, indent=2, ensure_ascii=False)
+        with open(base + ".prom", "w", encoding="utf-8") as f:
+            f.write(self.texto_prometheus())
+        return base + ".json", base + ".prom"
+    
+    def mostrar(self):
+        dados = self.relatorio()
+        print(f"\n📈 Métricas desde {dados['desde'][:19]}")
+        print("=" * 50)
+        if not dados['tempos'] and not dados['contadores']:
+            print("📭 Nada medido ainda" + ("" if self.ativo else " (métricas desligadas)"))
+            return
+        if dados['tempos']:
+            print("⏱️  Tempos:")
+            for nome, tempo in dados['tempos'].items():
+                print(f"   {nome}: {tempo['chamadas']}x, média {tempo['media_ms']} ms, "
+                      f"máx {tempo['max_ms']} ms, total {tempo['total_s']:.3f} s")
+        if dados['contadores']:
+            print("🔢 Contadores:")
+            for nome, valor in sorted(dados['contadores'].items()):
+                print(f"   {nome}: {valor}")
+        for nome, valor in dados['derivados'].items():
+            print(f"📊 {nome}: {valor}")
+    
+    def iniciar_perfil(self):
+        import cProfile
+        if self.perfil is None:
+            self.perfil = cProfile.Profile()
+            self.perfil.enable()
+    
+    def parar_perfil(self, arquivo=None, mostrar=15):
+        """Para o cProfile, salva o .prof (abre no snakeviz/pstats) e mostra as funções mais caras"""
+        if self.perfil is None:
+            return None
+        import pstats
+        self.perfil.disable()
+        arquivo = arquivo or ARQUIVO_METRICAS + ".prof"
+        self.perfil.dump_stats(arquivo)
+        if mostrar:
+            pstats.Stats(self.perfil).sort_stats("cumulative").print_stats(mostrar)
+        self.perfil = None
+        return arquivo
+
+_SEM_MEDICAO = contextlib.nullcontext()
+metricas = Metricas(ativo=METRICAS_ATIVAS)
+
+# Quanto a API cobrou; no streaming sem "usage" conta localmente
+def contar_tokens_api(parametros, resposta_texto, uso=None):
+    if not metricas.ativo:
+        return
+    if uso is not None:
+        metricas.contar('tokens_enviados', uso.prompt_tokens)
+        metricas.contar('tokens_recebidos', uso.completion_tokens)
+    else:
+        contador = obter_contador_tokens(parametros["model"])
+        metricas.contar('tokens_enviados', contador.contar_mensagens(parametros["messages"]))
+        metricas.contar('tokens_recebidos', contador.contar(resposta_texto))
+
 # Essa parte do NLTK é meio chata, mas vamos la
+# Não roda mais sozinha no import - só com "python chatbot.py --baixar-nltk"
 def setup_nltk():
-    """Tenta configurar o NLTK, se der erro, paciência"""
+    """Baixa os recursos do NLTK (precisa de internet)"""
     try:
-        nltk.data.find('tokenizers/punkt')
-    except:
-        try:
-            print("📥 Baixando recursos do NLTK...")
-            nltk.download('punkt', quiet=True)
-            nltk.download('stopwords', quiet=True)
-        except Exception as e:
-            print(f"⚠️  Deu pau no NLTK: {e}")
-            return False
+        import nltk
+    except ImportError:
+        print("❌ NLTK não instalado")
+        print("💡 Tenta: pip install nltk")
+        return False
+    try:
+        print("📥 Baixando recursos do NLTK...")
+        for recurso in ('punkt', 'punkt_tab', 'stopwords'):
+            nltk.download(recurso, quiet=True)
+    except Exception as e:
+        print(f"⚠️  Deu pau no NLTK: {e}")
+        return False
+    _recursos_nltk.cache_clear()
     return True
 
-# Chama a função - se não rodar, o programa continua mesmo assim
-setup_nltk()
+@functools.lru_cache(maxsize=None)
+def _recursos_nltk():
+    """Carrega o NLTK uma vez por processo; None se não estiver instalado ou faltar dado local.
+    Nunca tenta baixar nada daqui."""
+    try:
+        from nltk.tokenize import sent_tokenize, word_tokenize
+        from nltk.corpus import stopwords
+        
+        todas_stopwords = frozenset(stopwords.words('portuguese')) | frozenset(stopwords.words('english'))
+        sent_tokenize("Teste. Teste.")  # se faltar o punkt, estoura aqui e não no meio da análise
+        return sent_tokenize, word_tokenize, todas_stopwords
+    except Exception:
+        return None
 
 # Aqui eu criei um fallback pro quando o NLTK não funciona
 # Fiz na mão mesmo, não sei se tá 100% mas funciona
@@ -60,6 +351,51 @@ class TokenizadorManual:
         stopwords = {'o', 'a', 'e', 'de', 'do', 'da', 'em', 'um', 'uma', 'para', 'com', 'os', 'as', 'se', 'que', 'por'}
         return [p for p in palavras if len(p) > 2 and p not in stopwords]
 
+# Caminho rápido e offline: mesmas regras do NLTK (só letras, 3+ letras, sem stopwords),
+# mas com regex compilada uma vez e stopwords PT+EN já embutidas
+class TokenizadorRegex(TokenizadorManual):
+    FIM_SENTENCA = re.compile(r'(?<=[.!?])\s+')
+    PALAVRA = re.compile(r'[^\W\d_]{3,}')
+    STOPWORDS = frozenset("""
+        que com para por uma uns umas dos das nos nas num numa pelo pela pelos pelas aos ele ela eles elas
+        seu sua seus suas meu minha meus minhas teu tua nosso nossa nossos nossas dele dela deles delas
+        este esta estes estas esse essa esses essas aquele aquela aqueles aquelas isto isso aquilo
+        como mas mais muito muita muitos muitas quando onde qual quais quem porque pois sem sob sobre
+        entre até após desde também já ainda nem não sim ser ter foi são está estão era eram será serão
+        tem têm tinha havia há seja sejam fosse pode podem deve devem faz fazer sido sendo estar estava
+        você vocês lhe lhes nós mesmo mesma mesmos mesmas outro outra outros outras todo toda todos
+        todas cada tal tão tanto quanto apenas só então assim aqui ali lá depois antes sempre nunca
+        the and for are but not you all any can had her was one our out has him his how its may new now
+        old see two who did get let she too use that with have this will your from they been more when
+        what were which their there would about into than them then these some could other only also
+        """.split())
+    
+    @classmethod
+    def dividir_sentencas(cls, texto):
+        partes = cls.FIM_SENTENCA.split(texto)
+        return [p.strip() for p in partes if p.strip()]
+    
+    @classmethod
+    def limites_sentencas(cls, texto):
+        """Mesmas sentenças do dividir_sentencas, mas como (inicio, fim) dentro do texto"""
+        limites = []
+        inicio = 0
+        for separador in itertools.chain(cls.FIM_SENTENCA.finditer(texto), (None,)):
+            fim = separador.start() if separador else len(texto)
+            parte = texto[inicio:fim]
+            a = inicio + len(parte) - len(parte.lstrip())
+            b = fim - (len(parte) - len(parte.rstrip()))
+            if a < b:
+                limites.append((a, b))
+            if separador:
+                inicio = separador.end()
+        return limites
+    
+    @classmethod
+    def extrair_palavras(cls, texto):
+        stopwords = cls.STOPWORDS
+        return [p for p in cls.PALAVRA.findall(texto.lower()) if p not in stopwords]
+
 # Classe pra gerenciar as chaves - salva num JSON
 class GerenciadorChaves:
     def __init__(self):
@@ -89,6 +425,10 @@ class GerenciadorChaves:
     def get_chave_openai(self):
         return self.chaves.get("openai", "").strip()
     
+    def get_url_base(self):
+        """URL de um servidor compatível com a OpenAI (local, fake pra teste...); vazio = API oficial"""
+        return (self.chaves.get("openai_base_url") or os.environ.get("OPENAI_BASE_URL", "")).strip() or None
+    
     def set_chave_openai(self, chave):
         chave = chave.strip()
         if not chave:
@@ -128,11 +468,459 @@ class GerenciadorChaves:
         print(f"OpenAI: {status}")
         print(f"Chave: {masked}")
 
+def arquivo_temporario(destino):
+    """Temporário com nome único ao lado do destino - duas threads gravando o mesmo arquivo não se atropelam"""
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(destino) or ".",
+                                             prefix=os.path.basename(destino) + ".", suffix=".tmp")
+    os.close(descritor)
+    return temporario
+
+@contextlib.contextmanager
+def trava_de_arquivo(caminho):
+    """Trava exclusiva entre processos (CLI, lote e servidor podem mexer na mesma pasta de cache)"""
+    with open(caminho, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # o LK_LOCK desiste depois de 10 tentativas
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Cache das extrações - reler um PDF de 400 páginas toda vez é muito lento
+# A chave é o hash do conteúdo, tamanho e mtime só servem pra não recalcular o hash sempre
+class CacheExtracao:
+    def __init__(self, pasta=None, limite_mb=CACHE_MAX_MB):
+        self.pasta = pasta or os.path.join(PASTA_CACHE, "extracoes")
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self.arquivo_indice = os.path.join(self.pasta, "indice.json")
+        os.makedirs(self.pasta, exist_ok=True)
+        self.indice = self._carregar_indice()
+        # Vários documentos carregam ao mesmo tempo (lote, ingestão, servidor) - o índice e o
+        # despejo só mexem um de cada vez. RLock porque chave() e guardar() chamam os outros
+        self.trava = threading.RLock()
+    
+    def _carregar_indice(self):
+        try:
+            with open(self.arquivo_indice, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _salvar_indice(self):
+        # Escreve num temporário e troca, assim não corrompe se cair no meio
+        with self.trava:
+            temporario = arquivo_temporario(self.arquivo_indice)
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(self.indice, f, ensure_ascii=False)
+            os.replace(temporario, self.arquivo_indice)
+    
+    def _caminho_entrada(self, chave):
+        return os.path.join(self.pasta, f"{chave}.json.gz")
+    
+    def caminho_extra(self, chave, sufixo):
+        """Caminho pra outros arquivos derivados do mesmo documento (índices etc.)"""
+        return os.path.join(self.pasta, f"{chave}.{sufixo}")
+    
+    @staticmethod
+    def calcular_hash(caminho):
+        sha = hashlib.sha256()
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(bloco)
+        return sha.hexdigest()
+    
+    def chave(self, caminho):
+        """Retorna a chave (hash do conteúdo) do arquivo, reaproveitando se tamanho e mtime não mudaram"""
+        caminho_abs = os.path.abspath(caminho)
+        info_arquivo = os.stat(caminho_abs)
+        with self.trava:
+            registro = self.indice.get(caminho_abs)
+        
+        if registro and registro["tamanho"] == info_arquivo.st_size and registro["mtime"] == info_arquivo.st_mtime_ns:
+            return registro["hash"]
+        
+        # O hash fica fora da trava - é a parte lenta e não mexe em nada compartilhado
+        novo_hash = self.calcular_hash(caminho_abs)
+        with self.trava:
+            registro = self.indice.get(caminho_abs)
+            if registro and registro["hash"] != novo_hash:
+                # O arquivo mudou - a entrada velha não serve mais pra ninguém
+                self._invalidar(registro["hash"], ignorar=caminho_abs)
+            
+            self.indice[caminho_abs] = {
+                "hash": novo_hash,
+                "tamanho": info_arquivo.st_size,
+                "mtime": info_arquivo.st_mtime_ns
+            }
+            self._salvar_indice()
+        return novo_hash
+    
+    def _invalidar(self, chave, ignorar=None):
+        with self.trava:
+            # Só apaga se nenhum outro arquivo com o mesmo conteúdo usa essa entrada
+            for caminho, registro in self.indice.items():
+                if caminho != ignorar and registro["hash"] == chave:
+                    return
+            # Leva junto tudo que foi derivado desse conteúdo (índices etc.)
+            for nome in os.listdir(self.pasta):
+                if nome.startswith(chave + ".") and not nome.endswith(".tmp"):
+                    try:
+                        os.remove(os.path.join(self.pasta, nome))
+                    except OSError:
+                        pass  # já sumiu (ou, no Windows, ainda está mapeado)
+        # ... inclusive os vetores desse conteúdo
+        if _indice_vetorial is not None:
+            _indice_vetorial.remover_hash(chave)
+    
+    def buscar(self, chave):
+        caminho = self._caminho_entrada(chave)
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️  Cache corrompido, vou extrair de novo: {e}")
+            self._invalidar(chave)
+            return None
+        
+        if entrada.get("versao") != VERSAO_CACHE:
+            return None
+        
+        # Atualiza o mtime pra servir de "último uso" no despejo
+        os.utime(caminho)
+        return entrada
+    
+    def guardar(self, chave, paginas, metadados, estatisticas):
+        entrada = {
+            "versao": VERSAO_CACHE,
+            "paginas": paginas,
+            "metadados": metadados,
+            "estatisticas": estatisticas
+        }
+        caminho = self._caminho_entrada(chave)
+        temporario = arquivo_temporario(caminho)
+        try:
+            # Comprime fora da trava; só a troca e o despejo precisam ser um de cada vez
+            with gzip.open(temporario, "wt", encoding="utf-8", compresslevel=6) as f:
+                json.dump(entrada, f, ensure_ascii=False, separators=(",", ":"))
+            with self.trava:
+                os.replace(temporario, caminho)
+        except Exception as e:
+            print(f"⚠️  Não consegui salvar no cache: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(temporario)
+            return
+        self._despejar()
+    
+    def guardar_mapeado(self, chave, paginas, metadados, estatisticas):
+        """Grava o documento mapeado (.doc1); com ele o .json.gz fica redundante e sai"""
+        documento = DocumentoMapeado.criar(self.caminho_extra(chave, "doc1"), paginas, metadados, estatisticas)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._caminho_entrada(chave))
+        self._despejar()
+        return documento
+    
+    def _tem_conteudo(self, chave):
+        return os.path.exists(self.caminho_extra(chave, "doc1")) or os.path.exists(self._caminho_entrada(chave))
+    
+    def _despejar(self):
+        """Remove os documentos usados há mais tempo até caber no limite.
+        Tudo que saiu do mesmo conteúdo (.doc1, .json.gz, índices) conta junto e sai junto; o último
+        uso é o do arquivo mexido mais recentemente - abrir só o .doc1 já vale pro documento todo"""
+        with self.trava:
+            grupos = {}  # hash -> [último uso, tamanho, [(nome, tamanho)]]
+            total = 0
+            for nome in os.listdir(self.pasta):
+                if nome == "indice.json" or nome.endswith(".tmp"):
+                    continue
+                try:
+                    info = os.stat(os.path.join(self.pasta, nome))
+                except FileNotFoundError:
+                    continue  # alguém apagou entre o listdir e o stat
+                grupo = grupos.setdefault(nome.split(".", 1)[0], [0, 0, []])
+                grupo[0] = max(grupo[0], info.st_mtime)
+                grupo[1] += info.st_size
+                grupo[2].append((nome, info.st_size))
+                total += info.st_size
+            
+            despejados = []
+            for chave, (_, _, arquivos) in sorted(grupos.items(), key=lambda item: item[1][0]):
+                if total <= self.limite_bytes:
+                    break
+                for nome, tamanho in arquivos:
+                    try:
+                        os.remove(os.path.join(self.pasta, nome))
+                    except FileNotFoundError:
+                        pass
+                    except OSError:
+                        continue  # no Windows pode estar mapeado - fica pra próxima
+                    total -= tamanho
+                despejados.append(chave)
+            
+            # Tira do índice os arquivos cujo conteúdo saiu do cache
+            removidos = [c for c, r in self.indice.items() if not self._tem_conteudo(r["hash"])]
+            if removidos:
+                for caminho in removidos:
+                    del self.indice[caminho]
+                self._salvar_indice()
+            despejados = [c for c in despejados if not self._tem_conteudo(c)]
+        # Os vetores de quem saiu também não servem mais
+        if _indice_vetorial is not None:
+            for chave in despejados:
+                _indice_vetorial.remover_hash(chave)
+
+_cache_extracao = None
+
+def obter_cache_extracao():
+    """Cria o cache só na primeira vez que alguém precisa dele"""
+    global _cache_extracao
+    if _cache_extracao is None:
+        _cache_extracao = CacheExtracao()
+    return _cache_extracao
+
+# Documento inteiro num arquivo só: texto UTF-8 + tabelas (array) de onde começa cada página e
+# cada sentença. Com mmap, abrir não lê nada - o sistema só traz do disco o pedaço que for usado,
+# e cada página/sentença vira str só na hora que alguém pede (dá pra ter GBs abertos sem encher a RAM)
+#
+# Formato: MAGICO | tamanho do cabeçalho (8 bytes) | cabeçalho JSON (múltiplo de 8) |
+#          início das páginas (Q, n+1) | início/fim das sentenças (Q, m cada) |
+#          número das páginas (I, n) | página de cada sentença (I, m) | texto UTF-8
+class DocumentoMapeado(Sequence):
+    MAGICO = b"CBDOC01\n"
+    
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with open(caminho, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(self.MAGICO)] != self.MAGICO:
+            self._mm.close()
+            raise ValueError(f"{caminho} não é um documento mapeado")
+        
+        posicao = len(self.MAGICO)
+        tamanho_cabecalho = int.from_bytes(self._mm[posicao:posicao + 8], "little")
+        posicao += 8
+        cabecalho = json.loads(self._mm[posicao:posicao + tamanho_cabecalho])
+        posicao += tamanho_cabecalho
+        self.versao = cabecalho["versao"]
+        self.metadados = cabecalho["metadados"]
+        self.estatisticas = cabecalho["estatisticas"]
+        self.tokenizador = cabecalho["tokenizador"]
+        
+        # As tabelas são visões direto no mmap (sem copiar nada pra listas do Python)
+        self._visao = memoryview(self._mm)
+        self._tabelas = []
+        def tabela(tipo, quantidade):
+            nonlocal posicao
+            tamanho = quantidade * (8 if tipo == "Q" else 4)
+            visao = self._visao[posicao:posicao + tamanho].cast(tipo)
+            self._tabelas.append(visao)
+            posicao += tamanho
+            return visao
+        
+        total_paginas, total_sentencas = cabecalho["paginas"], cabecalho["sentencas"]
+        self._inicio_paginas = tabela("Q", total_paginas + 1)
+        self._inicio_sentencas = tabela("Q", total_sentencas)
+        self._fim_sentencas = tabela("Q", total_sentencas)
+        self._num_paginas = tabela("I", total_paginas)
+        self.pagina_sentenca = tabela("I", total_sentencas)
+        self._texto = self._visao[posicao:]
+        self._tabelas.append(self._texto)
+        self.sentencas = SentencasMapeadas(self)
+    
+    @classmethod
+    def abrir(cls, caminho):
+        """Abre se existir e for da versão atual; senão None"""
+        try:
+            documento = cls(caminho)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        if documento.versao != VERSAO_CACHE:
+            documento.fechar()
+            return None
+        try:
+            os.utime(caminho)  # conta como uso pro despejo do cache
+        except OSError:
+            pass
+        return documento
+    
+    @classmethod
+    def criar(cls, caminho, paginas, metadados, estatisticas):
+        inicio_paginas = array('Q', [0])
+        num_paginas = array('I')
+        inicio_sentencas = array('Q')
+        fim_sentencas = array('Q')
+        pagina_sentenca = array('I')
+        partes = []
+        posicao = 0
+        for num_pagina, texto in paginas:
+            dados = texto.encode("utf-8")
+            # As sentenças saem em posição de caractere; vai convertendo pra bytes aos poucos
+            caractere = 0
+            byte = posicao
+            for a, b in TokenizadorRegex.limites_sentencas(texto):
+                byte += len(texto[caractere:a].encode("utf-8"))
+                inicio_sentencas.append(byte)
+                byte += len(texto[a:b].encode("utf-8"))
+                fim_sentencas.append(byte)
+                pagina_sentenca.append(num_pagina)
+                caractere = b
+            partes.append(dados)
+            posicao += len(dados)
+            inicio_paginas.append(posicao)
+            num_paginas.append(num_pagina)
+        
+        cabecalho = json.dumps({
+            "versao": VERSAO_CACHE,
+            "metadados": metadados,
+            "estatisticas": estatisticas,
+            "tokenizador": "regex",
+            "paginas": len(num_paginas),
+            "sentencas": len(pagina_sentenca)
+        }, ensure_ascii=False).encode("utf-8")
+        cabecalho += b" " * (-len(cabecalho) % 8)  # mantém as tabelas de 8 bytes alinhadas
+        
+        temporario = arquivo_temporario(caminho)
+        with open(temporario, "wb") as f:
+            f.write(cls.MAGICO)
+            f.write(len(cabecalho).to_bytes(8, "little"))
+            f.write(cabecalho)
+            for tabela in (inicio_paginas, inicio_sentencas, fim_sentencas, num_paginas, pagina_sentenca):
+                tabela.tofile(f)
+            for dados in partes:
+                f.write(dados)
+        os.replace(temporario, caminho)
+        return cls(caminho)
+    
+    def __len__(self):
+        return len(self._num_paginas)
+    
+    def __getitem__(self, indice):
+        """(num_pagina, texto) - igual a um item da lista de páginas do carregar_arquivo"""
+        if isinstance(indice, slice):
+            return [self[i] for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        return self._num_paginas[indice], str(self.pagina_bytes(indice), "utf-8")
+    
+    def pagina_bytes(self, indice):
+        """Bytes UTF-8 da página, sem copiar (visão direto no mmap)"""
+        return self._texto[self._inicio_paginas[indice]:self._inicio_paginas[indice + 1]]
+    
+    def sentenca_bytes(self, indice):
+        return self._texto[self._inicio_sentencas[indice]:self._fim_sentencas[indice]]
+    
+    def inicio_pagina_bytes(self, indice):
+        return self._inicio_paginas[indice]
+    
+    def texto_bytes(self, inicio, fim):
+        return self._texto[inicio:fim]
+    
+    def fechar(self):
+        # O mmap só fecha depois de soltar todas as visões
+        for visao in self._tabelas:
+            visao.release()
+        self._visao.release()
+        self._mm.close()
+
+class SentencasMapeadas(Sequence):
+    """As sentenças de um DocumentoMapeado, decodificadas só quando alguém pede"""
+    def __init__(self, documento):
+        self.documento = documento
+    
+    def __len__(self):
+        return len(self.documento.pagina_sentenca)
+    
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self[i] for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        return str(self.documento.sentenca_bytes(indice), "utf-8")
+
+class TrechosMapeados(Sequence):
+    """Os trechos (pro BM25, vetores e prompt) de um DocumentoMapeado: na memória só ficam onde
+    cada um começa e termina (em bytes); o texto é lido do mmap quando alguém pede"""
+    def __init__(self, documento, tamanho=None, sobreposicao=None):
+        self.documento = documento
+        self.paginas = array('I')  # número da página de cada trecho
+        self.inicios = array('Q')
+        self.fins = array('Q')
+        tamanho = TAMANHO_TRECHO if tamanho is None else tamanho
+        sobreposicao = SOBREPOSICAO_TRECHO if sobreposicao is None else sobreposicao
+        for indice, (num_pagina, texto) in enumerate(documento):
+            base = documento.inicio_pagina_bytes(indice)
+            # Caractere -> byte aos poucos (inícios e fins só andam pra frente)
+            cursores = {"inicio": [0, 0], "fim": [0, 0]}
+            def em_bytes(caractere, qual):
+                cursor = cursores[qual]
+                cursor[1] += len(texto[cursor[0]:caractere].encode("utf-8"))
+                cursor[0] = caractere
+                return base + cursor[1]
+            for inicio, fim in limites_trechos(texto, tamanho, sobreposicao):
+                self.paginas.append(num_pagina)
+                self.inicios.append(em_bytes(inicio, "inicio"))
+                self.fins.append(em_bytes(fim, "fim"))
+    
+    def __len__(self):
+        return len(self.paginas)
+    
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self[i] for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        texto = str(self.documento.texto_bytes(self.inicios[indice], self.fins[indice]), "utf-8")
+        return {'texto': texto, 'pagina': self.paginas[indice]}
+
+# Fica fora da classe porque o ProcessPoolExecutor precisa conseguir importar a função
+def _extrair_intervalo_pdf(caminho, inicio, fim):
+    """Extrai as páginas [inicio, fim) de um PDF - roda dentro de cada processo"""
+    leitor = PdfReader(caminho)
+    paginas = []
+    for num_pagina in range(inicio, fim):
+        texto_pagina = leitor.pages[num_pagina].extract_text()
+        if texto_pagina:
+            paginas.append([num_pagina + 1, texto_pagina])
+    return paginas
+
+def _contexto_processos():
+    # O vigia, o lote e o servidor extraem a partir de threads - fork de um processo com várias
+    # threads pode herdar uma trava presa. O forkserver parte de um processo limpo (no Windows já é spawn)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return None
+
 # Classe pra lidar com arquivos PDF/TXT
 class GerenciadorArquivos:
     @staticmethod
     def listar_arquivos():
         """Lista os arquivos na pasta inputs"""
+        # Com o vigia rodando, a lista já está em memória - não precisa ir no disco
+        if _ingestor is not None and _ingestor.rodando:
+            arquivos = _ingestor.listar()
+            if not arquivos:
+                print("📁 Nenhum arquivo PDF ou TXT encontrado na pasta 'inputs'")
+            return arquivos
+        
         arquivos = []
         try:
             for arquivo in os.listdir(PASTA_INPUTS):
@@ -155,81 +943,233 @@ class GerenciadorArquivos:
         return arquivos
     
     @staticmethod
-    def carregar_arquivo(nome_arquivo):
-        """Carrega um arquivo PDF ou TXT"""
+    def _metadados_pdf(leitor, nome_arquivo):
+        # str() porque o PyPDF2 às vezes devolve objetos dele
+        info = leitor.metadata or {}
+        return {
+            'total_paginas': len(leitor.pages),
+            'autor': str(info.get('/Author', 'Não informado')),
+            'titulo': str(info.get('/Title', nome_arquivo)),
+            'criacao': str(info.get('/CreationDate', 'Não informado'))
+        }
+    
+    @staticmethod
+    def _gerar_paginas_pdf(caminho, leitor, workers=None):
+        """Gera [num_pagina, texto] na ordem, extraindo em série ou num pool de processos"""
+        total_paginas = len(leitor.pages)
+        
+        if workers is None:
+            workers = WORKERS_EXTRACAO or os.cpu_count() or 1
+        workers = min(workers, total_paginas)
+        
+        if workers > 1 and total_paginas >= PAGINAS_MIN_PARALELO:
+            # Faço umas 4 faixas por worker pra um pedaço pesado não segurar todo mundo
+            tamanho_faixa = max(1, -(-total_paginas // (workers * 4)))
+            faixas = [(inicio, min(inicio + tamanho_faixa, total_paginas))
+                      for inicio in range(0, total_paginas, tamanho_faixa)]
+            
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_contexto_processos()) as executor:
+                # O map devolve na mesma ordem das faixas, então as páginas já saem em ordem
+                resultados = executor.map(_extrair_intervalo_pdf,
+                                          [caminho] * len(faixas),
+                                          [inicio for inicio, _ in faixas],
+                                          [fim for _, fim in faixas])
+                for parte in resultados:
+                    yield from parte
+        else:
+            for num_pagina, pagina in enumerate(leitor.pages, 1):
+                texto_pagina = pagina.extract_text()
+                if texto_pagina:
+                    yield [num_pagina, texto_pagina]
+    
+    @staticmethod
+    def iterar_paginas(nome_arquivo, usar_cache=True, workers=None, info=None, guardar=True):
+        """Gera (num_pagina, texto_limpo) uma página por vez, sem montar o documento inteiro.
+        Se passar um dict em info, ele recebe 'metadados' e 'estatisticas' quando terminar.
+        guardar=False não grava o .json.gz (quem chama vai guardar o documento mapeado)."""
         caminho = os.path.join(PASTA_INPUTS, nome_arquivo)
+        if info is None:
+            info = {}
+        
+        # Primeiro olha no cache - se o arquivo não mudou, nem abre o PyPDF2
+        cache = obter_cache_extracao() if usar_cache else None
+        chave = cache.chave(caminho) if cache else None
+        salvo = cache.buscar(chave) if cache else None
+        
+        info['hash'] = chave
+        if cache:
+            metricas.contar('cache_extracao.acertos' if salvo else 'cache_extracao.falhas')
+        if salvo:
+            info['metadados'] = salvo['metadados']
+            info['estatisticas'] = salvo['estatisticas']
+            for num_pagina, texto in salvo['paginas']:
+                yield num_pagina, texto
+            return
+        
+        if nome_arquivo.lower().endswith(".pdf"):
+            # Processar PDF
+            leitor = PdfReader(caminho)
+            metadados = GerenciadorArquivos._metadados_pdf(leitor, nome_arquivo)
+            brutas = GerenciadorArquivos._gerar_paginas_pdf(caminho, leitor, workers)
+        else:
+            # Processar TXT - é uma página só
+            with open(caminho, "r", encoding="utf-8") as f:
+                brutas = [[1, f.read()]]
+            metadados = {
+                'total_paginas': 1,
+                'autor': 'Não informado',
+                'titulo': nome_arquivo,
+                'criacao': 'Não informado'
+            }
+        
+        # Vai limpando e contando conforme as páginas chegam
+        inicio_extracao = time.perf_counter()
+        bytes_extraidos = 0
+        limpas = []
+        total_palavras = 0
+        total_caracteres = 0
+        vistas = set()
+        for num_pagina, texto_bruto in brutas:
+            if metricas.ativo:
+                bytes_extraidos += len(texto_bruto.encode("utf-8"))
+                metricas.contar('paginas_extraidas')
+            texto = re.sub(r'\s+', ' ', texto_bruto).strip()
+            if not texto:
+                continue
+            palavras = texto.split()
+            total_palavras += len(palavras)
+            total_caracteres += len(texto)
+            vistas.update(palavras)
+            if cache and guardar:
+                limpas.append([num_pagina, texto])
+            yield num_pagina, texto
         
+        stats = {
+            'total_palavras': total_palavras,
+            'total_caracteres': total_caracteres,
+            'palavras_unicas': len(vistas)
+        }
+        info['metadados'] = metadados
+        info['estatisticas'] = stats
+        if metricas.ativo:
+            metricas.contar('bytes_extraidos', bytes_extraidos)
+            metricas.registrar_tempo('extracao', time.perf_counter() - inicio_extracao)
+        if cache and guardar:
+            cache.guardar(chave, limpas, metadados, stats)
+    
+    @staticmethod
+    def montar_texto(paginas, nome_arquivo):
+        """Junta as páginas num texto só, com as marcações '--- Página N ---' no caso de PDF"""
+        if not nome_arquivo.lower().endswith(".pdf"):
+            return " ".join(texto for _, texto in paginas)
+        return " ".join(f"--- Página {num} --- {texto}" for num, texto in paginas)
+    
+    @staticmethod
+    @metricas.cronometrado('carregar_arquivo')
+    def carregar_arquivo(nome_arquivo, usar_cache=True, workers=None, materializar=False, levantar=False):
+        """Carrega um arquivo PDF ou TXT (workers=None usa o WORKERS_EXTRACAO).
+        Por padrão só guarda a lista de páginas; materializar=True também monta o 'texto' inteiro.
+        Com cache, 'paginas' é um DocumentoMapeado (mesma interface de lista, mas fica no disco).
+        levantar=True deixa o erro subir em vez de imprimir (pra quem roda em segundo plano)."""
         try:
-            if nome_arquivo.lower().endswith(".pdf"):
-                # Processar PDF
-                leitor = PdfReader(caminho)
-                texto_completo = ""
-                
-                for num_pagina, pagina in enumerate(leitor.pages, 1):
-                    texto_pagina = pagina.extract_text()
-                    if texto_pagina:
-                        texto_completo += f"\n--- Página {num_pagina} ---\n{texto_pagina}"
-                
-                # Metadados do PDF
-                metadados = {
-                    'total_paginas': len(leitor.pages),
-                    'autor': leitor.metadata.get('/Author', 'Não informado'),
-                    'titulo': leitor.metadata.get('/Title', nome_arquivo),
-                    'criacao': leitor.metadata.get('/CreationDate', 'Não informado')
-                }
-                
-            else:
-                # Processar TXT
-                with open(caminho, "r", encoding="utf-8") as f:
-                    texto_completo = f.read()
-                
-                metadados = {
-                    'total_paginas': 1,
-                    'autor': 'Não informado',
-                    'titulo': nome_arquivo,
-                    'criacao': 'Não informado'
-                }
+            # Já tem o documento mapeado? Aí nem descompacta o cache - só abre o arquivo
+            cache = obter_cache_extracao() if usar_cache and ARMAZEM_MAPEADO else None
+            documento = None
+            if cache:
+                chave = cache.chave(os.path.join(PASTA_INPUTS, nome_arquivo))
+                documento = DocumentoMapeado.abrir(cache.caminho_extra(chave, "doc1"))
             
-            # Limpar o texto - tirar espaços extras
-            texto_limpo = re.sub(r'\s+', ' ', texto_completo).strip()
-            palavras = texto_limpo.split()
-            
-            # Estatísticas básicas
-            stats = {
-                'total_palavras': len(palavras),
-                'total_caracteres': len(texto_limpo),
-                'palavras_unicas': len(set(palavras))
-            }
+            if documento:
+                metricas.contar('cache_extracao.acertos')
+                paginas = documento
+                info = {'metadados': documento.metadados, 'estatisticas': documento.estatisticas, 'hash': chave}
+            else:
+                info = {}
+                paginas = list(GerenciadorArquivos.iterar_paginas(nome_arquivo, usar_cache, workers, info,
+                                                                  guardar=cache is None))
+                if cache and info.get('hash'):
+                    try:
+                        paginas = cache.guardar_mapeado(info['hash'], paginas, info['metadados'], info['estatisticas'])
+                    except OSError as e:
+                        print(f"⚠️  Não consegui gravar o documento mapeado, sigo em memória: {e}")
+                        cache.guardar(info['hash'], paginas, info['metadados'], info['estatisticas'])
             
-            return {
-                'texto': texto_limpo,
-                'texto_original': texto_completo,
-                'metadados': metadados,
-                'estatisticas': stats,
-                'nome_arquivo': nome_arquivo
+            dados = {
+                'paginas': paginas,
+                'metadados': info['metadados'],
+                'estatisticas': info['estatisticas'],
+                'nome_arquivo': nome_arquivo,
+                'hash': info.get('hash')
             }
+            if materializar:
+                dados['texto'] = GerenciadorArquivos.montar_texto(paginas, nome_arquivo)
+            return dados
             
         except Exception as e:
+            if levantar:
+                raise
             print(f"❌ Erro ao carregar {nome_arquivo}: {e}")
             return None
 
 # Histórico de conversas
+# Antes reescrevia o JSON inteiro a cada resposta; agora é JSONL e só acrescenta no final
 class HistoricoConversas:
-    def __init__(self):
-        self.arquivo = ARQUIVO_HISTORICO
-        self.dados = self.carregar()
+    def __init__(self, arquivo=None):
+        self.arquivo = arquivo or ARQUIVO_HISTORICO
+        self.trava = threading.Lock()
+        self.pendentes = 0  # gravadas desde o último fsync
+        self._migrar_formato_antigo()
+        self._f = None
+        atexit.register(self.fechar)
     
-    def carregar(self):
+    def _migrar_formato_antigo(self):
+        antigo = os.path.join(os.path.dirname(self.arquivo), ARQUIVO_HISTORICO_ANTIGO)
+        if not os.path.exists(antigo) or os.path.exists(self.arquivo):
+            return
         try:
-            with open(self.arquivo, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {"conversas": []}
+            with open(antigo, "r", encoding="utf-8") as f:
+                conversas = json.load(f).get("conversas", [])
+            temporario = self.arquivo + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                for conversa in conversas:
+                    f.write(json.dumps(conversa, ensure_ascii=False) + "\n")
+            os.replace(temporario, self.arquivo)
+            os.replace(antigo, antigo + ".migrado")
+            print(f"📦 Histórico migrado para {self.arquivo} ({len(conversas)} conversas)")
         except Exception as e:
-            print(f"❌ Erro ao carregar histórico: {e}")
-            return {"conversas": []}
+            print(f"⚠️  Não consegui migrar o histórico antigo: {e}")
+    
+    def _abrir(self):
+        if self._f is None:
+            self._f = open(self.arquivo, "a", encoding="utf-8")
+        return self._f
+    
+    def fechar(self):
+        with self.trava:
+            if self._f is not None:
+                self._sincronizar()
+                self._f.close()
+                self._f = None
+    
+    def _sincronizar(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.pendentes = 0
+    
+    def _rotacionar_se_preciso(self):
+        if self._f.tell() < HISTORICO_MAX_MB * 1024 * 1024:
+            return
+        self._sincronizar()
+        self._f.close()
+        self._f = None
+        # historico.jsonl -> .1, .1 -> .2 ... o mais velho é descartado
+        for i in range(HISTORICO_ROTACOES - 1, 0, -1):
+            if os.path.exists(f"{self.arquivo}.{i}"):
+                os.replace(f"{self.arquivo}.{i}", f"{self.arquivo}.{i + 1}")
+        os.replace(self.arquivo, f"{self.arquivo}.1")
     
-    def salvar(self, arquivo, pergunta, resposta, modo):
+    @metricas.cronometrado('historico.salvar')
+    def salvar(self, arquivo, pergunta, resposta, modo, tempos=None, memoria=None):
         nova_entrada = {
             "data": datetime.now().isoformat(),
             "arquivo": arquivo,
@@ -237,134 +1177,1172 @@ class HistoricoConversas:
             "pergunta": pergunta,
             "resposta": resposta
         }
-        
-        self.dados["conversas"].append(nova_entrada)
+        if tempos:
+            nova_entrada["tempos"] = tempos
+        if memoria:
+            nova_entrada["memoria"] = memoria
         
         try:
-            with open(self.arquivo, "w", encoding="utf-8") as f:
-                json.dump(self.dados, f, indent=2, ensure_ascii=False)
+            with self.trava:
+                f = self._abrir()
+                f.write(json.dumps(nova_entrada, ensure_ascii=False) + "\n")
+                f.flush()
+                self.pendentes += 1
+                # fsync custa caro, então faz em lote
+                if self.pendentes >= HISTORICO_FSYNC_LOTE:
+                    self._sincronizar()
+                self._rotacionar_se_preciso()
         except Exception as e:
             print(f"⚠️  Não consegui salvar no histórico: {e}")
     
+    def _arquivos(self):
+        # Do mais novo pro mais velho: o atual e depois os rotacionados (.1, .2, ...)
+        return [self.arquivo] + [f"{self.arquivo}.{i}" for i in range(1, HISTORICO_ROTACOES + 1)]
+    
+    def ultimas(self, n=8, arquivo=None):
+        """Lê as últimas n conversas andando do fim do arquivo pra trás, sem carregar tudo.
+        Se o atual não tiver n (acabou de rotacionar), continua nos rotacionados"""
+        with self.trava:
+            if self._f is not None:
+                self._f.flush()
+        encontradas = []
+        for caminho in self._arquivos():
+            if len(encontradas) >= n:
+                break
+            try:
+                self._ler_de_tras_pra_frente(caminho, n, arquivo, encontradas)
+            except FileNotFoundError:
+                continue
+        encontradas.reverse()
+        return encontradas
+    
+    def _ler_de_tras_pra_frente(self, caminho, n, arquivo, encontradas):
+        with open(caminho, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            posicao = f.tell()
+            resto = b""
+            while posicao > 0 and len(encontradas) < n:
+                tamanho = min(64 * 1024, posicao)
+                posicao -= tamanho
+                f.seek(posicao)
+                bloco = f.read(tamanho) + resto
+                linhas = bloco.split(b"\n")
+                # A primeira linha pode estar cortada no meio, fica pra próxima volta
+                resto = linhas.pop(0) if posicao > 0 else b""
+                for linha in reversed(linhas):
+                    conversa = self._ler_linha(linha)
+                    if conversa and (arquivo is None or conversa.get("arquivo") == arquivo):
+                        encontradas.append(conversa)
+                        if len(encontradas) >= n:
+                            break
+    
+    @staticmethod
+    def _ler_linha(linha):
+        linha = linha.strip()
+        if not linha:
+            return None
+        try:
+            return json.loads(linha)
+        except ValueError:
+            return None  # linha quebrada (ex.: queda no meio da gravação)
+    
+    def _ler_arquivo(self, caminho):
+        with open(caminho, "rb") as f:
+            return [c for c in map(self._ler_linha, f) if c]
+    
+    @staticmethod
+    def _reescrever(caminho, conversas):
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            for conversa in conversas:
+                f.write(json.dumps(conversa, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    
+    def compactar(self, manter=None):
+        """Reescreve o histórico sem linhas quebradas (o atual e os rotacionados).
+        Com manter=N fica só com as N mais recentes, num arquivo só (os rotacionados são apagados)"""
+        self.fechar()
+        with self.trava:
+            caminhos = [c for c in self._arquivos() if os.path.exists(c)]
+            if manter is None:
+                total = 0
+                for caminho in caminhos:
+                    conversas = self._ler_arquivo(caminho)
+                    self._reescrever(caminho, conversas)
+                    total += len(conversas)
+                return total
+            conversas = []
+            for caminho in caminhos:
+                if len(conversas) >= manter:
+                    break
+                conversas = self._ler_arquivo(caminho) + conversas
+            conversas = conversas[-manter:]
+            self._reescrever(self.arquivo, conversas)
+            for caminho in caminhos[1:]:
+                os.remove(caminho)
+            return len(conversas)
+    
     def mostrar(self):
-        if not self.dados["conversas"]:
+        # Mostra só as últimas 8 pra não ficar enorme
+        conversas = self.ultimas(8)
+        if not conversas:
             print("📝 Nenhuma conversa no histórico ainda.")
             return
         
         print(f"\n📋 Histórico de Conversas:")
         print("=" * 70)
         
-        # Mostra só as últimas 8 pra não ficar enorme
-        for i, conversa in enumerate(self.dados["conversas"][-8:], 1):
+        for i, conversa in enumerate(conversas, 1):
             data = datetime.fromisoformat(conversa["data"]).strftime("%d/%m %H:%M")
             print(f"{i}. [{data}] {conversa['modo']} - {conversa['arquivo']}")
             print(f"   Pergunta: {conversa['pergunta'][:80]}...")
             print(f"   Resposta: {conversa['resposta'][:80]}...")
             print("-" * 70)
 
-# Classe pra analisar textos - essa foi a mais trabalhosa
-class AnalisadorTexto:
-    def __init__(self, texto):
-        self.texto = texto
-        self.texto_lower = texto.lower()
-        self.sentencas = self._dividir_em_sentencas()
-        self.palavras = self._extrair_palavras_uteis()
+# Interseção de listas ordenadas "galopando": pula 1, 2, 4, 8... posições e só então faz busca
+# binária. Com uma lista curta e outra longa, custa ~ curta * log(longa) em vez de percorrer a longa
+def galopar(lista, alvo, inicio=0):
+    """Primeira posição >= inicio onde lista[posição] >= alvo"""
+    tamanho = len(lista)
+    if inicio >= tamanho or lista[inicio] >= alvo:
+        return inicio
+    anterior = inicio
+    passo = 1
+    atual = inicio + 1
+    while atual < tamanho and lista[atual] < alvo:
+        anterior = atual
+        passo *= 2
+        atual = anterior + passo
+    return bisect.bisect_left(lista, alvo, anterior + 1, min(atual + 1, tamanho))
+
+def intersecao_galopante(a, b, deslocamento=0):
+    """Elementos x de a (ordenada) tais que x + deslocamento está em b (ordenada)"""
+    resultado = []
+    if len(a) <= len(b):
+        j = 0
+        for x in a:
+            j = galopar(b, x + deslocamento, j)
+            if j == len(b):
+                break
+            if b[j] == x + deslocamento:
+                resultado.append(x)
+    else:
+        i = 0
+        for y in b:
+            i = galopar(a, y - deslocamento, i)
+            if i == len(a):
+                break
+            if a[i] == y - deslocamento:
+                resultado.append(a[i])
+    return resultado
+
+# Índice invertido - monta uma vez por documento e as buscas viram consulta em dicionário
+# Guardo a posição de cada token (ordinal) e, à parte, onde ele começa no texto
+class IndiceInvertido:
+    VERSAO = 1
+    PADRAO_TOKEN = re.compile(r'\w+')
     
-    def _dividir_em_sentencas(self):
-        # Tenta usar NLTK primeiro
-        try:
-            from nltk.tokenize import sent_tokenize
-            return sent_tokenize(self.texto)
-        except:
-            # Se não der, usa o método manual
-            return TokenizadorManual.dividir_sentencas(self.texto)
+    def __init__(self, texto=None):
+        self.offsets = array('I')  # offsets[ordinal] = onde o token começa no texto
+        self.postings = {}  # token normalizado -> array com os ordinais
+        if texto is not None:
+            self._construir(texto)
     
-    def _extrair_palavras_uteis(self):
-        # Tenta NLTK primeiro
+    @staticmethod
+    def normalizar(token):
+        return token.lower()
+    
+    def _construir(self, texto):
+        offsets = self.offsets
+        postings = self.postings
+        for ordinal, m in enumerate(self.PADRAO_TOKEN.finditer(texto)):
+            offsets.append(m.start())
+            token = self.normalizar(m.group())
+            lista = postings.get(token)
+            if lista is None:
+                lista = postings[token] = array('I')
+            lista.append(ordinal)
+    
+    @classmethod
+    def tokenizar(cls, texto):
+        return [cls.normalizar(t) for t in cls.PADRAO_TOKEN.findall(texto)]
+    
+    def ordinais(self, token):
+        return self.postings.get(self.normalizar(token), ())
+    
+    def frequencia(self, token):
+        return len(self.ordinais(token))
+    
+    def contendo(self, trecho):
+        """Tokens do vocabulário que têm trecho dentro (a busca é por pedaço de texto, não por palavra inteira)"""
+        trecho = self.normalizar(trecho)
+        return [token for token in self.postings if trecho in token]
+    
+    def ordinais_uniao(self, tokens):
+        """Ordinais de qualquer um dos tokens, em ordem"""
+        if len(tokens) == 1:
+            return self.postings.get(tokens[0], ())
+        return sorted(itertools.chain.from_iterable(self.postings.get(t, ()) for t in tokens))
+    
+    def ordinais_frase(self, tokens):
+        """Ordinais onde a sequência de tokens aparece em seguida (frase exata)"""
+        return self.cruzar([self.ordinais(t) for t in tokens])
+    
+    @staticmethod
+    def cruzar(listas):
+        """Ordinais i em que listas[0] tem i, listas[1] tem i+1, ... (cada lista em ordem)"""
+        if not listas:
+            return []
+        # Começa pela lista mais curta e vai cruzando com as outras (da mais curta pra mais longa)
+        ordem = sorted(range(len(listas)), key=lambda i: len(listas[i]))
+        raro = ordem[0]
+        candidatos = [ordinal - raro for ordinal in listas[raro] if ordinal >= raro]
+        for i in ordem[1:]:
+            if not candidatos:
+                break
+            candidatos = intersecao_galopante(candidatos, listas[i], i)
+        return candidatos
+    
+    def salvar(self, caminho):
+        temporario = arquivo_temporario(caminho)
+        with open(temporario, "wb") as f:
+            pickle.dump({"versao": self.VERSAO, "offsets": self.offsets, "postings": self.postings},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, caminho)
+    
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, "rb") as f:
+            dados = pickle.load(f)
+        if dados.get("versao") != cls.VERSAO:
+            return None
+        indice = cls()
+        indice.offsets = dados["offsets"]
+        indice.postings = dados["postings"]
+        return indice
+    
+    @classmethod
+    def carregar_ou_construir(cls, texto, chave=None):
+        """Usa o índice salvo no cache se tiver (chave = hash do documento), senão monta e salva.
+        texto pode ser uma função - aí só é chamada se precisar montar"""
+        if callable(texto):
+            obter_texto = texto
+        else:
+            obter_texto = lambda: texto
+        if not chave:
+            return cls(obter_texto())
+        
+        caminho = obter_cache_extracao().caminho_extra(chave, f"indice{cls.VERSAO}.pkl")
         try:
-            from nltk.tokenize import word_tokenize
-            from nltk.corpus import stopwords
-            
-            stop_pt = set(stopwords.words('portuguese'))
-            stop_en = set(stopwords.words('english'))
-            todas_stopwords = stop_pt.union(stop_en)
-            
-            palavras = word_tokenize(self.texto_lower)
-            # Filtra: só palavras com 3+ letras e que não são stopwords
-            return [p for p in palavras if p.isalpha() and len(p) >= 3 and p not in todas_stopwords]
-            
-        except:
-            # Fallback pro quando NLTK falha
-            return TokenizadorManual.extrair_palavras(self.texto)
+            indice = cls.carregar(caminho)
+            if indice is not None:
+                return indice
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️  Índice salvo com problema, vou montar de novo: {e}")
+        
+        indice = cls(obter_texto())
+        try:
+            indice.salvar(caminho)
+        except Exception as e:
+            print(f"⚠️  Não consegui salvar o índice: {e}")
+        return indice
+
+@functools.lru_cache(maxsize=65536)
+def normalizar_acentos(palavra):
+    """'Informação' -> 'informacao' (NFKD e tira as marcas de acento)"""
+    decomposta = unicodedata.normalize("NFKD", palavra.lower())
+    return "".join(c for c in decomposta if not unicodedata.combining(c))
+
+# Busca aproximada: índice de trigramas sobre o VOCABULÁRIO do documento (não sobre o texto),
+# já sem acento. Acha "informacao" pra "informação", erro de digitação e palavra quebrada do PDF
+# comparando só os trigramas - nada de calcular distância de edição contra cada palavra
+class IndiceTrigramas:
+    LIMIAR = 0.35  # similaridade mínima (Jaccard dos trigramas) pra contar como parecida
     
-    def mostrar_resumo(self):
-        print(f"\n📊 Resumo do Documento")
-        print("=" * 50)
+    def __init__(self, vocabulario):
+        grupos = {}
+        for token in vocabulario:
+            grupos.setdefault(normalizar_acentos(token), []).append(token)
+        self.formas = sorted(grupos)  # ordenado pra busca por prefixo com bisect
+        self.originais = [grupos[forma] for forma in self.formas]  # como aparecem no índice invertido
+        self.tamanhos = array('I')
+        self.trigramas = {}  # trigrama -> ids das formas
+        for id_forma, forma in enumerate(self.formas):
+            trigramas = self.trigramas_de(forma)
+            self.tamanhos.append(len(trigramas))
+            for trigrama in trigramas:
+                lista = self.trigramas.get(trigrama)
+                if lista is None:
+                    lista = self.trigramas[trigrama] = array('I')
+                lista.append(id_forma)
+    
+    @staticmethod
+    def trigramas_de(forma):
+        # Espaços nas pontas pra valorizar começo e fim da palavra
+        marcada = f"  {forma} "
+        return {marcada[i:i + 3] for i in range(len(marcada) - 2)}
+    
+    def aproximadas(self, palavra, limite=10, limiar=LIMIAR):
+        """[(similaridade, id_forma)] das palavras do documento mais parecidas"""
+        trigramas = self.trigramas_de(normalizar_acentos(palavra))
+        comuns = Counter()
+        for trigrama in trigramas:
+            comuns.update(self.trigramas.get(trigrama, ()))
+        total = len(trigramas)
+        tamanhos = self.tamanhos
+        parecidas = []
+        for id_forma, iguais in comuns.items():
+            similaridade = iguais / (total + tamanhos[id_forma] - iguais)
+            if similaridade >= limiar:
+                parecidas.append((similaridade, id_forma))
+        return heapq.nlargest(limite, parecidas)
+    
+    def prefixo(self, inicio, limite=10):
+        """[(1.0, id_forma)] das palavras que começam com 'inicio' (as mais curtas primeiro)"""
+        inicio = normalizar_acentos(inicio)
+        posicao = bisect.bisect_left(self.formas, inicio)
+        achadas = []
+        while posicao < len(self.formas) and self.formas[posicao].startswith(inicio) and len(achadas) < 500:
+            achadas.append(posicao)
+            posicao += 1
+        achadas.sort(key=lambda i: (len(self.formas[i]), self.formas[i]))
+        return [(1.0, i) for i in achadas[:limite]]
+
+# Consultas com AND / OR / NOT, "frase exata", NEAR/k e parênteses, tudo em cima das posições
+# do índice invertido - o custo depende do tamanho das listas dos termos, não do tamanho do texto.
+# O resultado é por página: uma página "bate" se a expressão vale pra ela
+class MotorConsultas:
+    PADRAO = re.compile(r'"[^"]*"|\(|\)|NEAR/\d+|\w+')
+    OPERADORES = {"AND", "OR", "NOT"}
+    
+    def __init__(self, analisador):
+        self.analisador = analisador
+        self.indice = analisador.indice
+        # Primeiro ordinal de cada página - converte posição de token em página sem olhar o texto
+        self.inicio_ordinal = array('I', (bisect.bisect_left(self.indice.offsets, inicio)
+                                          for inicio, _ in analisador.paginas))
+    
+    # ----- Leitura da consulta -----
+    def analisar(self, consulta):
+        """Texto da consulta -> árvore de tuplas ('termo'|'frase'|'near'|'and'|'or'|'not', ...)"""
+        self._pedacos = self.PADRAO.findall(consulta)
+        self._posicao = 0
+        if not self._pedacos:
+            raise ValueError("consulta vazia")
+        arvore = self._ou()
+        if self._posicao < len(self._pedacos):
+            raise ValueError(f"não esperava '{self._pedacos[self._posicao]}'")
+        return arvore
+    
+    def _olhar(self):
+        return self._pedacos[self._posicao] if self._posicao < len(self._pedacos) else None
+    
+    def _consumir(self):
+        pedaco = self._olhar()
+        self._posicao += 1
+        return pedaco
+    
+    def _ou(self):
+        esquerda = self._e()
+        while self._olhar() == "OR":
+            self._consumir()
+            esquerda = ("or", esquerda, self._e())
+        return esquerda
+    
+    def _e(self):
+        # "a b" é o mesmo que "a AND b"
+        esquerda = self._nao()
+        while self._olhar() is not None and self._olhar() not in ("OR", ")"):
+            if self._olhar() == "AND":
+                self._consumir()
+            esquerda = ("and", esquerda, self._nao())
+        return esquerda
+    
+    def _nao(self):
+        if self._olhar() == "NOT":
+            self._consumir()
+            return ("not", self._nao())
+        return self._perto()
+    
+    def _perto(self):
+        esquerda = self._primario()
+        while self._olhar() is not None and self._olhar().startswith("NEAR/"):
+            distancia = int(self._consumir()[5:])
+            esquerda = ("near", esquerda, self._primario(), distancia)
+        return esquerda
+    
+    def _primario(self):
+        pedaco = self._consumir()
+        if pedaco is None:
+            raise ValueError("a consulta terminou no meio")
+        if pedaco == "(":
+            dentro = self._ou()
+            if self._consumir() != ")":
+                raise ValueError("faltou fechar o parêntese")
+            return dentro
+        if pedaco == ")" or pedaco in self.OPERADORES or pedaco.startswith("NEAR/"):
+            raise ValueError(f"não esperava '{pedaco}'")
+        if pedaco.startswith('"'):
+            tokens = IndiceInvertido.tokenizar(pedaco.strip('"'))
+            if not tokens:
+                raise ValueError("frase vazia")
+            return ("frase", tokens) if len(tokens) > 1 else ("termo", tokens[0])
+        return ("termo", IndiceInvertido.normalizar(pedaco))
+    
+    # ----- Avaliação -----
+    def pagina_do_ordinal(self, ordinal):
+        return bisect.bisect_right(self.inicio_ordinal, ordinal) - 1
+    
+    def _paginas_de(self, ordinais):
+        """Páginas (índices, ordenados) que têm algum desses ordinais - pula direto pra próxima página"""
+        paginas = []
+        i = 0
+        total_paginas = len(self.inicio_ordinal)
+        while i < len(ordinais):
+            pagina = self.pagina_do_ordinal(ordinais[i])
+            paginas.append(pagina)
+            if pagina + 1 >= total_paginas:
+                break
+            i = galopar(ordinais, self.inicio_ordinal[pagina + 1], i)
+        return paginas
+    
+    def _filtrar_acertos(self, acertos, paginas):
+        manter = set(paginas)
+        return [ordinal for ordinal in acertos if self.pagina_do_ordinal(ordinal) in manter]
+    
+    def _acertos_fora(self, acertos, paginas):
+        return [ordinal for ordinal in acertos if self.pagina_do_ordinal(ordinal) not in paginas]
+    
+    def _posicoes(self, no):
+        """Ordinais onde um termo/frase/NEAR acontece (NEAR só aceita esses como operandos)"""
+        tipo = no[0]
+        if tipo == "termo":
+            return self.indice.ordinais(no[1])
+        if tipo == "frase":
+            return self.indice.ordinais_frase(no[1])
+        if tipo == "near":
+            a, b = self._posicoes(no[1]), self._posicoes(no[2])
+            distancia = no[3]
+            juntos = set()
+            j = 0
+            for x in a:
+                j = galopar(b, x - distancia, j)
+                if j < len(b) and b[j] <= x + distancia:
+                    juntos.add(x)
+                    juntos.add(b[j])
+            return sorted(juntos)
+        raise ValueError("NEAR só funciona entre palavras ou frases")
+    
+    def avaliar(self, no):
+        """(páginas, acertos, negado) - negado=True quer dizer: todas as páginas MENOS estas.
+        Num resultado negado, os acertos nas páginas de fora são os da expressão de dentro - guardo
+        pra um NOT que desfaz outro (NOT NOT x) ainda ter os acertos de x; o buscar filtra no final"""
+        tipo = no[0]
+        if tipo in ("termo", "frase", "near"):
+            posicoes = self._posicoes(no)
+            return self._paginas_de(posicoes), list(posicoes), False
+        if tipo == "not":
+            paginas, acertos, negado = self.avaliar(no[1])
+            return paginas, acertos, not negado
         
-        print(f"📝 Total de sentenças: {len(self.sentencas)}")
-        print(f"🔤 Total de palavras úteis: {len(self.palavras)}")
-        print(f"📈 Palavras únicas: {len(set(self.palavras))}")
-        
-        if self.palavras:
-            densidade = len(set(self.palavras)) / len(self.palavras)
-            print(f"📏 Densidade léxica: {densidade:.1%}")
-        
-        # Mostra preview das páginas se tiver marcação de páginas
-        partes = self.texto.split('--- Página')
-        if len(partes) > 1:
-            print(f"\n📄 Preview por página:")
-            for i, pagina in enumerate(partes[1:6], 1):  # Mostra só as 5 primeiras
-                linhas = pagina.split('\n')
-                if len(linhas) > 1:
-                    conteudo = ' '.join(linhas[1:])
-                    preview = conteudo[:MAX_PREVIEW]
-                    if len(conteudo) > MAX_PREVIEW:
-                        preview += "..."
-                    print(f"   📖 Página {i}: {preview}")
+        pa, aa, na = self.avaliar(no[1])
+        pb, ab, nb = self.avaliar(no[2])
+        acertos = sorted(set(aa) | set(ab))
+        if tipo == "and":
+            if not na and not nb:
+                paginas = intersecao_galopante(pa, pb)
+            elif not na:
+                fora = set(pb)
+                paginas = [p for p in pa if p not in fora]
+            elif not nb:
+                fora = set(pa)
+                paginas = [p for p in pb if p not in fora]
+            else:
+                return sorted(set(pa) | set(pb)), acertos, True
+            return paginas, self._filtrar_acertos(acertos, paginas), False
+        
+        # or - acerto de dentro de um NOT só fica nas páginas que continuam de fora
+        if not na and not nb:
+            return sorted(set(pa) | set(pb)), acertos, False
+        if na and nb:
+            so_a, so_b = set(pa) - set(pb), set(pb) - set(pa)
+            acertos = sorted(set(self._acertos_fora(aa, so_a)) | set(self._acertos_fora(ab, so_b)))
+            return intersecao_galopante(pa, pb), acertos, True
+        (positivas, acertos_positivos), (negadas, acertos_negados) = ((pa, aa), (pb, ab)) if not na else ((pb, ab), (pa, aa))
+        dentro = set(positivas)
+        acertos = sorted(set(acertos_positivos) | set(self._acertos_fora(acertos_negados, dentro)))
+        return [p for p in negadas if p not in dentro], acertos, True
     
-    def buscar_palavra(self, palavra):
-        print(f"\n🔍 Buscando: '{palavra}'")
-        print("=" * 50)
+    def buscar(self, consulta):
+        """[(página, acertos)] das páginas que satisfazem a consulta, as com mais acertos primeiro"""
+        paginas, acertos, negado = self.avaliar(self.analisar(consulta))
+        if negado:
+            fora = set(paginas)
+            paginas = [p for p in range(len(self.inicio_ordinal)) if p not in fora]
+        por_pagina = {p: [] for p in paginas}
+        for ordinal in acertos:
+            lista = por_pagina.get(self.pagina_do_ordinal(ordinal))
+            if lista is not None:
+                lista.append(ordinal)
+        return sorted(por_pagina.items(), key=lambda item: (-len(item[1]), item[0]))
+
+# Perguntas respondidas sem IA: cada sentença vira um vetor TF-IDF esparso e a resposta são as
+# sentenças mais parecidas com a pergunta (cosseno). Fica guardado por termo (termo -> sentenças),
+# então responder só percorre as listas dos termos da pergunta, não o documento
+class RespondedorExtrativo:
+    VERSAO = 1
+    MIN_PALAVRAS = 3  # sentença com menos palavras úteis que isso (título, rodapé) não entra
+    
+    def __init__(self, sentencas=None):
+        self.termos = {}  # termo -> id
+        self.idf = array('f')
+        self.inicio = array('I', [0])  # postings do termo t ficam em [inicio[t], inicio[t + 1])
+        self.sentencas_termo = array('I')
+        self.pesos = array('f')  # tf-idf já dividido pela norma da sentença
+        self.total_sentencas = 0
+        self._visoes = None
+        if sentencas is not None:
+            self._construir(sentencas)
+    
+    def _construir(self, sentencas):
+        postings = {}  # termo -> (sentenças, tf)
+        total = 0
+        for indice, sentenca in enumerate(sentencas):
+            total += 1
+            palavras = TokenizadorRegex.extrair_palavras(sentenca)
+            if len(palavras) < self.MIN_PALAVRAS:
+                continue
+            for termo, tf in Counter(palavras).items():
+                lista = postings.get(termo)
+                if lista is None:
+                    lista = postings[termo] = (array('I'), array('f'))
+                lista[0].append(indice)
+                lista[1].append(1 + math.log(tf))
+        self.total_sentencas = total
         
-        # Regex pra encontrar a palavra com contexto
-        padrao = re.compile(f".{{0,{CONTEXTO_BUSCA}}}{re.escape(palavra)}.{{0,{CONTEXTO_BUSCA}}}", re.IGNORECASE)
-        resultados = padrao.findall(self.texto)
+        # Junta tudo em arrays contínuos, um termo depois do outro
+        pesos_brutos = array('f')
+        for termo, (sentencas_termo, tfs) in postings.items():
+            self.termos[termo] = len(self.idf)
+            self.idf.append(math.log((total + 1) / (len(sentencas_termo) + 1)) + 1)
+            self.sentencas_termo.extend(sentencas_termo)
+            pesos_brutos.extend(tfs)
+            self.inicio.append(len(self.sentencas_termo))
         
-        if resultados:
-            print(f"✅ Encontrado {len(resultados)} vezes:")
-            for i, trecho in enumerate(resultados[:6], 1):  # Mostra só 6 resultados
-                trecho_limpo = re.sub(r'\s+', ' ', trecho).strip()
-                print(f"\n{i}. ...{trecho_limpo}...")
-            
-            if len(resultados) > 6:
-                print(f"\n📎 ... e mais {len(resultados) - 6} resultados")
+        # tf * idf e normaliza cada sentença (norma L2 = 1) - com numpy é tudo de uma vez
+        if np is not None and pesos_brutos:
+            ocorrencias = np.diff(np.frombuffer(self.inicio, dtype=np.uint32))
+            pesos = np.frombuffer(pesos_brutos, dtype=np.float32) * np.repeat(
+                np.frombuffer(self.idf, dtype=np.float32), ocorrencias)
+            linhas = np.frombuffer(self.sentencas_termo, dtype=np.uint32)
+            normas = np.sqrt(np.bincount(linhas, weights=pesos * pesos, minlength=total))
+            self.pesos = array('f', (pesos / normas[linhas]).astype(np.float32).tobytes())
         else:
-            print("❌ Palavra não encontrada")
+            pesos = []
+            normas = [0.0] * total
+            for termo_id in range(len(self.idf)):
+                idf = self.idf[termo_id]
+                for posicao in range(self.inicio[termo_id], self.inicio[termo_id + 1]):
+                    peso = pesos_brutos[posicao] * idf
+                    pesos.append(peso)
+                    normas[self.sentencas_termo[posicao]] += peso * peso
+            self.pesos = array('f', (p / math.sqrt(normas[self.sentencas_termo[i]]) for i, p in enumerate(pesos)))
     
-    def analisar_palavras_chave(self):
-        if not self.palavras:
+    def _vetor_consulta(self, pergunta):
+        consulta = []
+        for termo, tf in Counter(TokenizadorRegex.extrair_palavras(pergunta)).items():
+            termo_id = self.termos.get(termo)
+            if termo_id is not None:
+                consulta.append((termo_id, (1 + math.log(tf)) * self.idf[termo_id]))
+        norma = math.sqrt(sum(peso * peso for _, peso in consulta)) or 1.0
+        return [(termo_id, peso / norma) for termo_id, peso in consulta]
+    
+    def responder(self, pergunta, top_k=3):
+        """[(similaridade, índice_da_sentença)] das sentenças que mais batem com a pergunta"""
+        consulta = self._vetor_consulta(pergunta)
+        if not consulta:
+            return []
+        
+        if np is not None:
+            if self._visoes is None:
+                self._visoes = (np.frombuffer(self.sentencas_termo, dtype=np.uint32),
+                                np.frombuffer(self.pesos, dtype=np.float32))
+            linhas, pesos = self._visoes
+            pontos = np.zeros(self.total_sentencas, dtype=np.float32)
+            for termo_id, peso in consulta:
+                a, b = self.inicio[termo_id], self.inicio[termo_id + 1]
+                # Cada sentença aparece uma vez só na lista do termo, então o += indexado funciona
+                pontos[linhas[a:b]] += peso * pesos[a:b]
+            candidatos = np.flatnonzero(pontos)
+            k = min(top_k, len(candidatos))
+            if k == 0:
+                return []
+            melhores = candidatos[np.argpartition(-pontos[candidatos], k - 1)[:k]]
+            return sorted(((float(pontos[i]), int(i)) for i in melhores), reverse=True)
+        
+        pontos = {}
+        for termo_id, peso in consulta:
+            for posicao in range(self.inicio[termo_id], self.inicio[termo_id + 1]):
+                linha = self.sentencas_termo[posicao]
+                pontos[linha] = pontos.get(linha, 0.0) + peso * self.pesos[posicao]
+        return heapq.nlargest(top_k, ((p, linha) for linha, p in pontos.items()))
+    
+    def resumir(self, n=RESUMO_SENTENCAS, iteracoes=50, amortecimento=0.85):
+        """[(pontuação, índice_da_sentença)] das n frases mais centrais do documento.
+        É um TextRank, mas em vez de montar a matriz frase x frase (quadrática) o passeio aleatório
+        vai frase -> termo -> frase pelas próprias listas do TF-IDF: cada iteração custa O(postings)."""
+        if not len(self.sentencas_termo):
+            return []
+        if np is None:
+            return self._resumir_centroide(n)
+        
+        total = self.total_sentencas
+        linhas = np.frombuffer(self.sentencas_termo, dtype=np.uint32).astype(np.int64)
+        pesos = np.frombuffer(self.pesos, dtype=np.float32).astype(np.float64)
+        ocorrencias = np.diff(np.frombuffer(self.inicio, dtype=np.uint32)).astype(np.int64)
+        termos = np.repeat(np.arange(len(ocorrencias)), ocorrencias)
+        
+        # Poda 1: termo que só aparece numa frase não liga ninguém; termo em quase todas vira hub
+        limite_df = max(50, int(total * RESUMO_DF_MAX))
+        mantem = (ocorrencias[termos] >= 2) & (ocorrencias[termos] <= limite_df)
+        linhas, pesos, termos = linhas[mantem], pesos[mantem], termos[mantem]
+        if not len(linhas):
+            return self._resumir_centroide(n)
+        
+        # Poda 2: cada frase só fica com os seus termos mais fortes (frase enorme não puxa tudo pra ela)
+        ordem = np.lexsort((-pesos, linhas))
+        linhas, pesos, termos = linhas[ordem], pesos[ordem], termos[ordem]
+        primeira = np.searchsorted(linhas, linhas)  # onde começa a frase de cada posting
+        mantem = (np.arange(len(linhas)) - primeira) < RESUMO_TERMOS_POR_SENTENCA
+        linhas, pesos, termos = linhas[mantem], pesos[mantem], termos[mantem]
+        
+        saida_frase = np.bincount(linhas, weights=pesos, minlength=total)
+        saida_termo = np.bincount(termos, weights=pesos, minlength=len(ocorrencias))
+        ativas = saida_frase > 0
+        atual = ativas / ativas.sum()
+        for _ in range(iteracoes):
+            # frase -> termo -> frase, proporcional ao peso de cada ligação
+            massa_termo = np.bincount(termos, weights=pesos * (atual / np.where(ativas, saida_frase, 1))[linhas],
+                                      minlength=len(ocorrencias))
+            chegada = np.bincount(linhas, weights=pesos * (massa_termo / np.where(saida_termo > 0, saida_termo, 1))[termos],
+                                  minlength=total)
+            novo = np.where(ativas, (1 - amortecimento) / ativas.sum() + amortecimento * chegada, 0.0)
+            novo /= novo.sum()
+            if np.abs(novo - atual).sum() < 1e-6:
+                atual = novo
+                break
+            atual = novo
+        
+        k = min(n * 3, int(ativas.sum()))  # pega folga pra poder descartar frases repetidas
+        melhores = np.argpartition(-atual, k - 1)[:k]
+        return sorted(((float(atual[i]), int(i)) for i in melhores), reverse=True)
+    
+    def _resumir_centroide(self, n):
+        # Sem numpy: frase mais parecida com o "centro" do documento (soma de todos os vetores)
+        pontos = [0.0] * self.total_sentencas
+        for termo_id in range(len(self.idf)):
+            a, b = self.inicio[termo_id], self.inicio[termo_id + 1]
+            centro = sum(self.pesos[a:b])
+            for posicao in range(a, b):
+                pontos[self.sentencas_termo[posicao]] += self.pesos[posicao] * centro
+        return heapq.nlargest(n * 3, ((p, i) for i, p in enumerate(pontos) if p > 0))
+    
+    def salvar(self, caminho):
+        temporario = arquivo_temporario(caminho)
+        with open(temporario, "wb") as f:
+            pickle.dump({
+                "versao": self.VERSAO, "termos": self.termos, "idf": self.idf, "inicio": self.inicio,
+                "sentencas_termo": self.sentencas_termo, "pesos": self.pesos, "total": self.total_sentencas
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, caminho)
+    
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, "rb") as f:
+            dados = pickle.load(f)
+        if dados.get("versao") != cls.VERSAO:
+            return None
+        respondedor = cls()
+        respondedor.termos = dados["termos"]
+        respondedor.idf = dados["idf"]
+        respondedor.inicio = dados["inicio"]
+        respondedor.sentencas_termo = dados["sentencas_termo"]
+        respondedor.pesos = dados["pesos"]
+        respondedor.total_sentencas = dados["total"]
+        return respondedor
+    
+    @classmethod
+    def carregar_ou_construir(cls, sentencas, chave=None):
+        """Mesmo esquema do IndiceInvertido: usa o salvo no cache (por hash do documento) se tiver"""
+        if not chave:
+            return cls(sentencas)
+        
+        caminho = obter_cache_extracao().caminho_extra(chave, f"tfidf{cls.VERSAO}.pkl")
+        try:
+            respondedor = cls.carregar(caminho)
+            if respondedor is not None:
+                return respondedor
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️  TF-IDF salvo com problema, vou montar de novo: {e}")
+        
+        respondedor = cls(sentencas)
+        try:
+            respondedor.salvar(caminho)
+        except Exception as e:
+            print(f"⚠️  Não consegui salvar o TF-IDF: {e}")
+        return respondedor
+
+# Todas as contas do AnalisadorTexto feitas numa passada só e guardadas em arrays
+# Antes cada opção do menu refazia o Counter e os set() por conta própria
+class AnaliseTexto:
+    def __init__(self, palavras, sentencas):
+        contador = Counter(palavras)
+        # Vocabulário ordenado por frequência (empate fica na ordem em que apareceu, igual ao most_common)
+        itens = sorted(contador.items(), key=lambda item: -item[1])
+        self.vocabulario = [palavra for palavra, _ in itens]
+        self.contagens = array('I', (freq for _, freq in itens))
+        self.total_palavras = len(palavras)
+        self.palavras_unicas = len(self.vocabulario)
+        self.hapax = sum(1 for freq in self.contagens if freq == 1)
+        
+        # Histograma de tamanho das palavras: histograma_letras[n] = quantas palavras têm n letras
+        self.histograma_letras = array('I')
+        for palavra, freq in itens:
+            tamanho = len(palavra)
+            if tamanho >= len(self.histograma_letras):
+                self.histograma_letras.extend([0] * (tamanho + 1 - len(self.histograma_letras)))
+            self.histograma_letras[tamanho] += freq
+        
+        self.palavras_por_sentenca = array('I', (len(s.split()) for s in sentencas))
+    
+    @property
+    def densidade_lexica(self):
+        return self.palavras_unicas / self.total_palavras if self.total_palavras else 0
+    
+    @property
+    def media_letras(self):
+        if not self.total_palavras:
+            return 0.0
+        return sum(tamanho * qtd for tamanho, qtd in enumerate(self.histograma_letras)) / self.total_palavras
+    
+    def mais_comuns(self, n, filtro=None):
+        """Top n (palavra, frequência); filtro opcional sobre a palavra"""
+        resultado = []
+        for palavra, freq in zip(self.vocabulario, self.contagens):
+            if filtro is None or filtro(palavra):
+                resultado.append((palavra, freq))
+                if len(resultado) >= n:
+                    break
+        return resultado
+
+# Classe pra analisar textos - essa foi a mais trabalhosa
+class AnalisadorTexto:
+    @metricas.cronometrado('analisador.init')
+    def __init__(self, texto=None, paginas=None, chave=None):
+        # Dá pra passar o texto inteiro ou a lista de páginas (num, texto) do carregar_arquivo
+        if paginas is None:
+            paginas = [(1, texto or "")]
+            self.tem_paginas = False
+        else:
+            self.tem_paginas = True
+        
+        # Documento mapeado já vem com as sentenças divididas (pelo regex) - só usa se for o mesmo tokenizador
+        mapeado = isinstance(paginas, DocumentoMapeado) and paginas.tokenizador == "regex"
+        if mapeado and USAR_NLTK and _recursos_nltk():
+            mapeado = False
+        
+        # Guarda onde cada página começa no texto "juntado" (páginas separadas por \n), mas só junta
+        # de verdade quando alguém precisa do texto inteiro. Com documento mapeado, o texto inteiro
+        # nem fica guardado: trechos e contexto são lidos das páginas no mmap
+        self._fonte = paginas
+        self._guardar_texto = not isinstance(paginas, DocumentoMapeado)
+        self._texto = texto if texto is not None and not self.tem_paginas else None
+        self.paginas = []  # (inicio_no_texto, num_pagina)
+        self.sentencas = []
+        self.pagina_sentenca = []  # página de cada sentença
+        posicao = 0
+        for num_pagina, texto_pagina in paginas:
+            self.paginas.append((posicao, num_pagina))
+            posicao += len(texto_pagina) + 1
+            if mapeado:
+                continue
+            
+            # Sentença não atravessa página, assim sei de onde cada uma veio
+            sentencas_pagina = self._dividir_em_sentencas(texto_pagina)
+            self.sentencas.extend(sentencas_pagina)
+            self.pagina_sentenca.extend([num_pagina] * len(sentencas_pagina))
+        
+        if mapeado:
+            # Visões no mmap: cada sentença só vira str quando for lida
+            self.sentencas = paginas.sentencas
+            self.pagina_sentenca = paginas.pagina_sentenca
+        
+        self.tamanho_texto = max(posicao - 1, 0)
+        self._texto_lower = None
+        self._palavras = None
+        self._analise = None
+        self._respondedor = None
+        self._trigramas = None
+        self._consultas = None
+        self._resumos = {}
+        # As sentenças mudam com o tokenizador, então ele entra na chave do que for salvo a partir delas
+        self.chave_sentencas = f"{chave}.{'nltk' if USAR_NLTK and _recursos_nltk() else 'regex'}" if chave else None
+        self.indice = IndiceInvertido.carregar_ou_construir(lambda: self.texto, chave)
+    
+    @property
+    def texto(self):
+        """O documento inteiro numa str - montado na hora (e guardado, se não for mapeado)"""
+        if self._texto is not None:
+            return self._texto
+        texto = "\n".join(texto_pagina for _, texto_pagina in self._fonte)
+        if self._guardar_texto:
+            self._texto = texto
+        return texto
+    
+    def trecho_texto(self, inicio, fim):
+        """O mesmo que texto[inicio:fim], mas lendo só as páginas que cruzam esse pedaço"""
+        if self._texto is not None:
+            return self._texto[max(0, inicio):fim]
+        inicio = max(0, inicio)
+        partes = []
+        indice = max(bisect.bisect_right(self.paginas, (inicio, float("inf"))) - 1, 0)
+        while indice < len(self.paginas) and self.paginas[indice][0] < fim:
+            comeco = self.paginas[indice][0]
+            pedaco = self.texto_pagina(indice) + ("\n" if indice + 1 < len(self.paginas) else "")
+            partes.append(pedaco[max(0, inicio - comeco):max(0, fim - comeco)])
+            indice += 1
+        return "".join(partes)
+    
+    def fim_token(self, inicio):
+        """Onde termina o token que começa em inicio (posição no texto)"""
+        janela = 64
+        while True:
+            pedaco = self.trecho_texto(inicio, inicio + janela)
+            encontrado = IndiceInvertido.PADRAO_TOKEN.match(pedaco)
+            fim = encontrado.end() if encontrado else 0
+            if fim < len(pedaco) or inicio + len(pedaco) >= self.tamanho_texto:
+                return inicio + fim
+            janela *= 4
+    
+    @property
+    def palavras(self):
+        # Lista de todas as palavras úteis - só quem faz as contas (resumo, estatísticas...) precisa
+        if self._palavras is None:
+            self._palavras = self._extrair_palavras_uteis()
+        return self._palavras
+    
+    @property
+    def texto_lower(self):
+        # Só cria a cópia em minúsculas se alguém precisar
+        if self._texto_lower is None:
+            self._texto_lower = self.texto.lower()
+        return self._texto_lower
+    
+    @property
+    def analise(self):
+        # Só faz as contas na primeira vez que algum relatório pedir
+        if self._analise is None:
+            self._analise = AnaliseTexto(self.palavras, self.sentencas)
+        return self._analise
+    
+    def resumo(self, n=RESUMO_SENTENCAS):
+        """Índices (na ordem do documento) das frases do resumo - guardado no cache por documento"""
+        if n in self._resumos:
+            return self._resumos[n]
+        caminho = obter_cache_extracao().caminho_extra(self.chave_sentencas, f"resumo{RespondedorExtrativo.VERSAO}.json") \
+            if self.chave_sentencas else None
+        salvos = {}
+        if caminho:
+            try:
+                with open(caminho, "r", encoding="utf-8") as f:
+                    salvos = json.load(f)
+            except (FileNotFoundError, ValueError):
+                salvos = {}
+            if str(n) in salvos:
+                self._resumos[n] = salvos[str(n)]
+                return self._resumos[n]
+        
+        escolhidas = []
+        vistas = set()
+        for _, indice in self.respondedor.resumir(n):
+            # PDF costuma repetir cabeçalho/tabela - frase igual não entra duas vezes
+            normalizada = re.sub(r'\W+', ' ', self.sentencas[indice].lower()).strip()
+            if normalizada in vistas:
+                continue
+            vistas.add(normalizada)
+            escolhidas.append(indice)
+            if len(escolhidas) >= n:
+                break
+        escolhidas.sort()
+        self._resumos[n] = escolhidas
+        
+        if caminho:
+            salvos[str(n)] = escolhidas
+            try:
+                with open(caminho, "w", encoding="utf-8") as f:
+                    json.dump(salvos, f)
+            except OSError as e:
+                print(f"⚠️  Não consegui salvar o resumo: {e}")
+        return escolhidas
+    
+    @property
+    def trigramas(self):
+        if self._trigramas is None:
+            self._trigramas = IndiceTrigramas(self.indice.postings)
+        return self._trigramas
+    
+    def encontrar_aproximadas(self, consulta, candidatos_por_palavra=5):
+        """Busca sem ligar pra acento/erro: cada palavra da consulta vira as palavras parecidas do
+        documento e aí usa o índice invertido. 'segur*' busca por prefixo.
+        Devolve (ocorrências [(inicio, fim)], [(palavra, [(similaridade, forma)])])."""
+        palavras = IndiceInvertido.tokenizar(consulta)
+        por_prefixo = consulta.strip().endswith("*")
+        trigramas = self.trigramas
+        candidatos = []
+        tokens_por_palavra = []
+        for j, palavra in enumerate(palavras):
+            if por_prefixo and j == len(palavras) - 1:
+                achadas = trigramas.prefixo(palavra, candidatos_por_palavra * 4)
+            else:
+                achadas = trigramas.aproximadas(palavra, candidatos_por_palavra)
+                # Se a palavra existe (tirando acento), não precisa misturar as só parecidas
+                if achadas and achadas[0][0] >= 1.0:
+                    achadas = [a for a in achadas if a[0] >= 1.0]
+            candidatos.append((palavra, [(similaridade, trigramas.formas[i]) for similaridade, i in achadas]))
+            tokens_por_palavra.append([token for _, i in achadas for token in trigramas.originais[i]])
+        if not palavras or not all(tokens_por_palavra):
+            return [], candidatos
+        
+        # Primeira palavra: junta as listas de todas as variantes (já vêm ordenadas)
+        primeiros = heapq.merge(*(self.indice.ordinais(t) for t in tokens_por_palavra[0]))
+        # As outras têm que vir logo em seguida, como numa frase
+        seguintes = [set().union(*(self.indice.ordinais(t) for t in tokens)) for tokens in tokens_por_palavra[1:]]
+        offsets = self.indice.offsets
+        resultado = []
+        for ordinal in primeiros:
+            if all(ordinal + k + 1 in conjunto for k, conjunto in enumerate(seguintes)):
+                ultimo = offsets[ordinal + len(seguintes)]
+                resultado.append((offsets[ordinal], self.fim_token(ultimo)))
+        return resultado, candidatos
+    
+    @property
+    def consultas(self):
+        if self._consultas is None:
+            self._consultas = MotorConsultas(self)
+        return self._consultas
+    
+    @metricas.cronometrado('analisador.buscar_consulta')
+    def buscar_consulta(self, consulta):
+        print(f"\n🧮 Consulta: {consulta}")
+        print("=" * 50)
+        try:
+            paginas = self.consultas.buscar(consulta)
+        except ValueError as e:
+            print(f"❌ Consulta inválida: {e}")
+            print('💡 Exemplo: firewall AND (senha OR "autenticação forte") NOT wifi, backup NEAR/5 dados')
+            return []
+        
+        if not paginas:
+            print("❌ Nenhuma página atende à consulta")
+            return paginas
+        
+        offsets = self.indice.offsets
+        print(f"✅ {len(paginas)} páginas atendem à consulta:")
+        for pagina, acertos in paginas[:10]:
+            num_pagina = self.paginas[pagina][1]
+            if acertos:
+                inicio = offsets[acertos[0]]
+                fim = self.fim_token(inicio)
+                print(f"\n📄 Página {num_pagina} ({len(acertos)} acertos): ...{self.contexto(inicio, fim)}...")
+            else:
+                # Página que entrou só por um NOT - mostra o começo dela
+                print(f"\n📄 Página {num_pagina}: {self.texto_pagina(pagina)[:CONTEXTO_BUSCA * 2]}...")
+        if len(paginas) > 10:
+            print(f"\n📎 ... e mais {len(paginas) - 10} páginas")
+        return paginas
+    
+    @metricas.cronometrado('analisador.buscar_aproximada')
+    def buscar_aproximada(self, consulta):
+        print(f"\n🔎 Busca aproximada: '{consulta}'")
+        print("=" * 50)
+        
+        resultados, candidatos = self.encontrar_aproximadas(consulta)
+        for palavra, achadas in candidatos:
+            if achadas:
+                parecidas = ", ".join(f"{forma} ({similaridade:.0%})" for similaridade, forma in achadas)
+                print(f"🔤 {palavra} ~ {parecidas}")
+            else:
+                print(f"🔤 {palavra}: nada parecido no documento")
+        
+        if resultados:
+            print(f"✅ Encontrado {len(resultados)} vezes:")
+            for i, (inicio, fim) in enumerate(resultados[:6], 1):
+                print(f"\n{i}. [p.{self.pagina_do_offset(inicio)}] ...{self.contexto(inicio, fim)}...")
+            if len(resultados) > 6:
+                print(f"\n📎 ... e mais {len(resultados) - 6} resultados")
+        else:
+            print("❌ Nada encontrado")
+    
+    @property
+    def respondedor(self):
+        if self._respondedor is None:
+            self._respondedor = RespondedorExtrativo.carregar_ou_construir(self.sentencas, self.chave_sentencas)
+        return self._respondedor
+    
+    def pagina_do_offset(self, offset):
+        """Diz em qual página está uma posição do texto"""
+        indice = bisect.bisect_right(self.paginas, (offset, float("inf"))) - 1
+        return self.paginas[max(indice, 0)][1]
+    
+    def texto_pagina(self, indice):
+        if self._texto is not None:
+            inicio = self.paginas[indice][0]
+            fim = self.paginas[indice + 1][0] - 1 if indice + 1 < len(self.paginas) else len(self._texto)
+            return self._texto[inicio:fim]
+        return self._fonte[indice][1]
+    
+    def _dividir_em_sentencas(self, texto):
+        # NLTK só se foi pedido e já está instalado; senão vai de regex
+        nltk_ok = _recursos_nltk() if USAR_NLTK else None
+        if nltk_ok:
+            return nltk_ok[0](texto)
+        return TokenizadorRegex.dividir_sentencas(texto)
+    
+    def _extrair_palavras_uteis(self):
+        nltk_ok = _recursos_nltk() if USAR_NLTK else None
+        if nltk_ok:
+            _, word_tokenize, todas_stopwords = nltk_ok
+            palavras = word_tokenize(self.texto_lower)
+            # Filtra: só palavras com 3+ letras e que não são stopwords
+            return [p for p in palavras if p.isalpha() and len(p) >= 3 and p not in todas_stopwords]
+        return TokenizadorRegex.extrair_palavras(self.texto)
+    
+    @metricas.cronometrado('analisador.mostrar_resumo')
+    def mostrar_resumo(self):
+        print(f"\n📊 Resumo do Documento")
+        print("=" * 50)
+        
+        analise = self.analise
+        print(f"📝 Total de sentenças: {len(self.sentencas)}")
+        print(f"🔤 Total de palavras úteis: {analise.total_palavras}")
+        print(f"📈 Palavras únicas: {analise.palavras_unicas}")
+        
+        if analise.total_palavras:
+            print(f"📏 Densidade léxica: {analise.densidade_lexica:.1%}")
+        
+        # Resumo de verdade: as frases mais centrais do documento inteiro, na ordem em que aparecem
+        escolhidas = self.resumo()
+        if escolhidas:
+            print(f"\n📝 Resumo ({len(escolhidas)} frases mais representativas):")
+            for indice in escolhidas:
+                frase = self.sentencas[indice]
+                if len(frase) > MAX_PREVIEW:
+                    frase = frase[:MAX_PREVIEW] + "..."
+                local = f"p.{self.pagina_sentenca[indice]}" if self.tem_paginas else f"frase {indice + 1}"
+                print(f"   📖 [{local}] {frase}")
+    
+    @metricas.cronometrado('analisador.encontrar_ocorrencias')
+    def encontrar_ocorrencias(self, palavra):
+        """Lista de (inicio, fim) de cada ocorrência no texto, usando o índice
+        
+        Continua valendo pedaço de palavra ("hacker" acha "hackers"): o termo é expandido pros
+        tokens do vocabulário que o contêm. Numa frase, a primeira palavra pode ser fim de token,
+        a última pode ser começo e as do meio são exatas.
+        """
+        tokens = IndiceInvertido.tokenizar(palavra)
+        if not tokens:
+            # Só pontuação/símbolo - aí não tem jeito, vai de regex mesmo
+            return [(m.start(), m.end()) for m in re.finditer(re.escape(palavra), self.texto, re.IGNORECASE)]
+        
+        indice = self.indice
+        offsets = indice.offsets
+        resultado = []
+        if len(tokens) == 1:
+            termo = tokens[0]
+            for variante in indice.contendo(termo):
+                # Todas as posições do termo dentro do token, sem sobreposição (igual ao re.findall)
+                posicoes = [m.start() for m in re.finditer(re.escape(termo), variante)]
+                for ordinal in indice.postings[variante]:
+                    inicio = offsets[ordinal]
+                    resultado.extend((inicio + p, inicio + p + len(termo)) for p in posicoes)
+        else:
+            primeiro, ultimo = tokens[0], tokens[-1]
+            meio = [indice.ordinais(t) for t in tokens[1:-1]]
+            finais = indice.ordinais_uniao([t for t in indice.contendo(ultimo) if t.startswith(ultimo)])
+            for variante in indice.contendo(primeiro):
+                if not variante.endswith(primeiro):
+                    continue
+                recuo = len(variante) - len(primeiro)
+                for ordinal in indice.cruzar([indice.postings[variante]] + meio + [finais]):
+                    resultado.append((offsets[ordinal] + recuo, offsets[ordinal + len(tokens) - 1] + len(ultimo)))
+        resultado.sort()
+        return resultado
+    
+    def contexto(self, inicio, fim, tamanho=CONTEXTO_BUSCA):
+        trecho = self.trecho_texto(inicio - tamanho, fim + tamanho)
+        return re.sub(r'\s+', ' ', trecho).strip()
+    
+    def contar(self, palavra):
+        tokens = IndiceInvertido.tokenizar(palavra)
+        if len(tokens) == 1:
+            # Conta direto das listas, sem montar as posições (str.count também não sobrepõe)
+            termo = tokens[0]
+            return sum(len(self.indice.postings[v]) * v.count(termo) for v in self.indice.contendo(termo))
+        return len(self.encontrar_ocorrencias(palavra))
+    
+    @metricas.cronometrado('analisador.buscar_palavra')
+    def buscar_palavra(self, palavra):
+        print(f"\n🔍 Buscando: '{palavra}'")
+        print("=" * 50)
+        
+        resultados = self.encontrar_ocorrencias(palavra)
+        
+        if resultados:
+            print(f"✅ Encontrado {len(resultados)} vezes:")
+            for i, (inicio, fim) in enumerate(resultados[:6], 1):  # Mostra só 6 resultados
+                print(f"\n{i}. ...{self.contexto(inicio, fim)}...")
+            
+            if len(resultados) > 6:
+                print(f"\n📎 ... e mais {len(resultados) - 6} resultados")
+        else:
+            print("❌ Palavra não encontrada")
+            # Talvez seja acento ou erro de digitação - sugere as parecidas
+            tokens = IndiceInvertido.tokenizar(palavra)
+            if len(tokens) == 1:
+                sugestoes = [self.trigramas.originais[i][0] for _, i in self.trigramas.aproximadas(tokens[0], 3)]
+                if sugestoes:
+                    print(f"💡 Você quis dizer: {', '.join(sugestoes)}? (ou use a busca aproximada)")
+    
+    @metricas.cronometrado('analisador.analisar_palavras_chave')
+    def analisar_palavras_chave(self):
+        if not self.palavras:
             print("❌ Nada para analisar")
             return
         
         print(f"\n🔑 Análise de Palavras-Chave")
         print("=" * 50)
         
-        # Conta frequência das palavras
-        contador = Counter(self.palavras)
-        top_15 = contador.most_common(15)
+        # Frequências já estão prontas na análise
+        top_15 = self.analise.mais_comuns(15)
         
         print("📊 Palavras mais frequentes:")
         for palavra, freq in top_15:
             print(f"   {palavra}: {freq}x")
         
         # Palavras longas (geralmente termos técnicos)
-        palavras_longas = [p for p in self.palavras if len(p) > 8]
+        palavras_longas = self.analise.mais_comuns(5, filtro=lambda p: len(p) > 8)
         if palavras_longas:
-            contador_longas = Counter(palavras_longas)
             print(f"\n🔬 Termos técnicos (mais de 8 letras):")
-            for palavra, freq in contador_longas.most_common(5):
+            for palavra, freq in palavras_longas:
                 print(f"   {palavra}: {freq}x")
     
+    @metricas.cronometrado('analisador.mostrar_estatisticas')
     def mostrar_estatisticas(self):
         if not self.palavras or not self.sentencas:
             print("❌ Dados insuficientes")
@@ -373,25 +2351,42 @@ class AnalisadorTexto:
         print(f"\n📈 Estatísticas Detalhadas")
         print("=" * 50)
         
+        analise = self.analise
         try:
-            palavras_por_sentenca = [len(s.split()) for s in self.sentencas]
-            letras_por_palavra = [len(p) for p in self.palavras]
+            palavras_por_sentenca = analise.palavras_por_sentenca
             
-            print(f"📝 Média de palavras por sentença: {statistics.mean(palavras_por_sentenca):.1f}")
-            print(f"🔠 Média de letras por palavra: {statistics.mean(letras_por_palavra):.2f}")
+            print(f"📝 Média de palavras por sentença: {sum(palavras_por_sentenca) / len(palavras_por_sentenca):.1f}")
+            print(f"🔠 Média de letras por palavra: {analise.media_letras:.2f}")
             print(f"📏 Sentença mais longa: {max(palavras_por_sentenca)} palavras")
             print(f"📏 Sentença mais curta: {min(palavras_por_sentenca)} palavras")
         except:
             print("❌ Erro ao calcular estatísticas")
         
         # Palavras que aparecem só uma vez
-        contador = Counter(self.palavras)
-        unicas = sum(1 for count in contador.values() if count == 1)
-        print(f"🎯 Palavras únicas (só uma ocorrência): {unicas}")
+        print(f"🎯 Palavras únicas (só uma ocorrência): {analise.hapax}")
+    
+    @metricas.cronometrado('analisador.responder_extrativo')
+    def responder_extrativo(self, pergunta, n=3):
+        """Responde sem IA com as sentenças do documento que mais têm a ver com a pergunta"""
+        inicio = time.perf_counter()
+        respostas = self.respondedor.responder(pergunta, n)
+        decorrido = time.perf_counter() - inicio
+        
+        print(f"\n💬 Pergunta: {pergunta}")
+        print("=" * 50)
+        if not respostas:
+            print("❌ Nenhuma sentença do documento tem a ver com a pergunta")
+            return []
+        for i, (similaridade, indice) in enumerate(respostas, 1):
+            local = f"p.{self.pagina_sentenca[indice]}" if self.tem_paginas else f"sentença {indice + 1}"
+            print(f"\n{i}. [{local} | {similaridade:.0%}] {self.sentencas[indice]}")
+        print(f"\n⚡ {decorrido * 1000:.1f} ms - trechos copiados do documento, sem IA")
+        return respostas
     
+    @metricas.cronometrado('analisador.comparar_palavras')
     def comparar_palavras(self, palavra1, palavra2):
-        freq1 = len(re.findall(re.escape(palavra1), self.texto_lower))
-        freq2 = len(re.findall(re.escape(palavra2), self.texto_lower))
+        freq1 = self.contar(palavra1)
+        freq2 = self.contar(palavra2)
         
         print(f"\n⚖️ Comparando:")
         print("=" * 40)
@@ -405,17 +2400,18 @@ class AnalisadorTexto:
         else:
             print(f"⚡ São igualmente frequentes")
     
+    @metricas.cronometrado('analisador.exportar_analise')
     def exportar_analise(self, nome_arquivo):
         dados = {
             "arquivo": nome_arquivo,
             "data_analise": datetime.now().isoformat(),
             "estatisticas": {
                 "sentencas": len(self.sentencas),
-                "palavras_uteis": len(self.palavras),
-                "palavras_unicas": len(set(self.palavras)),
-                "densidade_lexica": len(set(self.palavras)) / len(self.palavras) if self.palavras else 0
+                "palavras_uteis": self.analise.total_palavras,
+                "palavras_unicas": self.analise.palavras_unicas,
+                "densidade_lexica": self.analise.densidade_lexica
             },
-            "top_palavras": dict(Counter(self.palavras).most_common(20))
+            "top_palavras": dict(self.analise.mais_comuns(20))
         }
         
         nome_saida = f"analise_{nome_arquivo.split('.')[0]}.json"
@@ -426,13 +2422,1189 @@ class AnalisadorTexto:
         except Exception as e:
             print(f"❌ Erro ao exportar: {e}")
 
+# Divide as páginas em trechos com sobreposição, pra não cortar uma ideia no meio
+def limites_trechos(texto, tamanho=TAMANHO_TRECHO, sobreposicao=SOBREPOSICAO_TRECHO):
+    """(inicio, fim) de cada trecho de uma página, já sem os espaços das pontas"""
+    passo = max(1, tamanho - sobreposicao)
+    inicio = 0
+    while inicio < len(texto):
+        fim = min(inicio + tamanho, len(texto))
+        # Tenta terminar num espaço pra não quebrar palavra
+        if fim < len(texto):
+            espaco = texto.rfind(" ", inicio + passo // 2, fim)
+            if espaco != -1:
+                fim = espaco
+        pedaco = texto[inicio:fim]
+        esquerda = len(pedaco) - len(pedaco.lstrip())
+        direita = len(pedaco.rstrip())
+        yield (inicio + esquerda, inicio + direita) if direita > esquerda else (inicio, inicio)
+        if fim >= len(texto):
+            break
+        proximo = max(inicio + 1, fim - sobreposicao)
+        # E começa o próximo no início de uma palavra também
+        espaco = texto.find(" ", proximo, fim)
+        inicio = espaco + 1 if espaco != -1 else proximo
+
+def dividir_em_trechos(paginas, tamanho=TAMANHO_TRECHO, sobreposicao=SOBREPOSICAO_TRECHO):
+    # Documento mapeado: os trechos ficam como posições no mmap em vez de cópias do texto
+    if isinstance(paginas, DocumentoMapeado):
+        return TrechosMapeados(paginas, tamanho, sobreposicao)
+    return [{'texto': texto[inicio:fim], 'pagina': num_pagina}
+            for num_pagina, texto in paginas
+            for inicio, fim in limites_trechos(texto, tamanho, sobreposicao)]
+
+# Contagem de tokens: tiktoken se estiver instalado, senão uma estimativa que erra pra mais
+# (caracteres são uma medida ruim em português - acento e palavra longa viram mais tokens)
+@functools.lru_cache(maxsize=None)
+def _codificador_tiktoken(modelo):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Sem internet na primeira vez o tiktoken não consegue baixar o vocabulário
+        return None
+
+class ContadorTokens:
+    PEDACOS = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+    TOKENS_POR_MENSAGEM = 4  # o que o formato de chat acrescenta em cada mensagem
+    
+    def __init__(self, modelo=MODELO_IA):
+        self.modelo = modelo
+        self.codificador = _codificador_tiktoken(modelo)
+        self.nome = self.codificador.name if self.codificador else "estimativa"
+        # Cache por texto: serve pra textos curtos e repetidos (cabeçalhos, mensagens)
+        self.contar = functools.lru_cache(maxsize=CACHE_TOKENS_MAX)(self._contar)
+        # Trecho de documento mapeado vira uma str nova a cada acesso, e a chave por texto teria que
+        # recalcular o hash do trecho inteiro toda vez - esses ficam por (documento, índice do trecho)
+        self.trechos = OrderedDict()
+        self.trava = threading.Lock()
+    
+    def _contar(self, texto):
+        if self.codificador:
+            return len(self.codificador.encode(texto, disallowed_special=()))
+        total = 0
+        for pedaco in self.PEDACOS.findall(texto):
+            if not pedaco[0].isalnum() and pedaco[0] != "_":
+                total += 1
+            elif pedaco.isascii():
+                total += -(-len(pedaco) // 4)
+            else:
+                total += -(-len(pedaco) // 3)
+        return total
+    
+    def contar_trecho(self, chave, texto):
+        """Tokens de um trecho de documento, guardados pela chave (documento, índice) em vez do texto"""
+        with self.trava:
+            total = self.trechos.get(chave)
+            if total is not None:
+                self.trechos.move_to_end(chave)
+                return total
+        total = self._contar(texto)
+        with self.trava:
+            self.trechos[chave] = total
+            if len(self.trechos) > CACHE_TOKENS_MAX:
+                self.trechos.popitem(last=False)
+        return total
+    
+    def contar_mensagens(self, mensagens):
+        return sum(self.contar(m["content"]) + self.TOKENS_POR_MENSAGEM for m in mensagens) + 3
+    
+    def janela(self):
+        return JANELA_MODELOS.get(self.modelo, JANELA_MODELOS["padrao"])
+    
+    def orcamento_contexto(self, mensagens_sem_contexto, limite=None):
+        """Quantos tokens de documento ainda cabem depois das instruções, da pergunta e da resposta"""
+        livre = self.janela() - MAX_TOKENS_RESPOSTA - self.contar_mensagens(mensagens_sem_contexto)
+        return max(0, min(limite or LIMITE_CONTEXTO_TOKENS, livre))
+    
+    def cortar(self, texto, tokens, do_fim=False):
+        """Pedaço do texto com no máximo N tokens (do começo, ou do fim)"""
+        if tokens <= 0:
+            return ""
+        if self.codificador:
+            codigos = self.codificador.encode(texto, disallowed_special=())
+            if len(codigos) <= tokens:
+                return texto
+            return self.codificador.decode(codigos[-tokens:] if do_fim else codigos[:tokens])
+        if self.contar(texto) <= tokens:
+            return texto
+        # Na estimativa vai somando palavra por palavra até estourar
+        palavras = texto.split(" ")
+        if do_fim:
+            palavras.reverse()
+        escolhidas = []
+        usados = 0
+        for palavra in palavras:
+            custo = self._contar(palavra)
+            if usados + custo > tokens:
+                break
+            escolhidas.append(palavra)
+            usados += custo
+        if do_fim:
+            escolhidas.reverse()
+        return " ".join(escolhidas)
+
+_contadores_tokens = {}
+
+def obter_contador_tokens(modelo=None):
+    modelo = modelo or MODELO_IA
+    if modelo not in _contadores_tokens:
+        _contadores_tokens[modelo] = ContadorTokens(modelo)
+    return _contadores_tokens[modelo]
+
+def empacotar_trechos(candidatos, limite_tokens, contador=None, chave_contagem=None):
+    """Escolhe, na ordem de relevância, os trechos que cabem no orçamento.
+    candidatos: [(chave, cabecalho, texto)]; devolve as chaves escolhidas.
+    chave_contagem(chave) dá a chave estável do trecho (documento, índice) pro cache de contagens."""
+    contador = contador or obter_contador_tokens()
+    separador = contador.contar("\n\n")
+    escolhidos = []
+    usados = 0
+    for chave, cabecalho, texto in candidatos:
+        estavel = chave_contagem(chave) if chave_contagem else None
+        custo_texto = contador.contar_trecho(estavel, texto) if estavel else contador.contar(texto)
+        custo = contador.contar(cabecalho) + custo_texto + separador
+        if usados + custo > limite_tokens:
+            continue
+        escolhidos.append(chave)
+        usados += custo
+    return escolhidos
+
+# BM25 simples, tudo local - dá pra ir adicionando documentos aos poucos
+class IndiceBM25:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # termo -> lista de (id_doc, frequência)
+        self.tamanhos = array('I')
+        self.total_tamanhos = 0
+    
+    def __len__(self):
+        return len(self.tamanhos)
+    
+    @staticmethod
+    def tokenizar(texto):
+        return TokenizadorManual.extrair_palavras(texto)
+    
+    def adicionar(self, texto):
+        """Indexa mais um documento e devolve o id dele"""
+        id_doc = len(self.tamanhos)
+        termos = self.tokenizar(texto)
+        for termo, freq in Counter(termos).items():
+            self.postings.setdefault(termo, []).append((id_doc, freq))
+        self.tamanhos.append(len(termos))
+        self.total_tamanhos += len(termos)
+        return id_doc
+    
+    def buscar(self, consulta, top_k=10, globais=None):
+        """Devolve [(pontuação, id_doc)] dos melhores documentos pra consulta.
+        globais = (total_docs, tamanho_medio, df) quando o índice faz parte de um corpus maior"""
+        if not self.tamanhos:
+            return []
+        if globais is None:
+            total_docs = len(self.tamanhos)
+            media = self.total_tamanhos / total_docs or 1
+            df = None
+        else:
+            total_docs, media, df = globais
+        pontuacoes = {}
+        
+        for termo in set(self.tokenizar(consulta)):
+            lista = self.postings.get(termo)
+            if not lista:
+                continue
+            n_termo = df[termo] if df is not None else len(lista)
+            idf = math.log(1 + (total_docs - n_termo + 0.5) / (n_termo + 0.5))
+            for id_doc, freq in lista:
+                norma = self.k1 * (1 - self.b + self.b * self.tamanhos[id_doc] / media)
+                pontuacoes[id_doc] = pontuacoes.get(id_doc, 0.0) + idf * freq * (self.k1 + 1) / (freq + norma)
+        
+        return heapq.nlargest(top_k, ((p, d) for d, p in pontuacoes.items()))
+
+# ---------- Embeddings ----------
+# Cada embedder só precisa de um nome, uma dimensão e um embed(textos) -> matriz float32 normalizada
+
+# Hashing trick: cada termo cai numa posição fixa do vetor. Determinístico e sem rede
+class EmbedderHashing:
+    nome = "hashing"
+    
+    def __init__(self, dimensao=DIMENSAO_EMBEDDING):
+        self.dimensao = dimensao
+    
+    def _features(self, texto):
+        termos = IndiceBM25.tokenizar(texto)
+        features = list(termos)
+        # Bigramas pegam um pouco de ordem; o prefixo ajuda com plural/conjugação
+        features.extend(f"{a} {b}" for a, b in zip(termos, termos[1:]))
+        features.extend(f"#{t[:5]}" for t in termos if len(t) > 5)
+        return features
+    
+    def embed(self, textos):
+        matriz = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        for linha, texto in enumerate(textos):
+            for feature, freq in Counter(self._features(texto)).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                sinal = 1.0 if h & 0x80000000 else -1.0
+                matriz[linha, h % self.dimensao] += sinal * (1.0 + math.log(freq))
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return matriz / normas
+
+class EmbedderOpenAI:
+    nome = "openai"
+    
+    def __init__(self, cliente, modelo="text-embedding-3-small", dimensao=DIMENSAO_EMBEDDING):
+        self.cliente = cliente
+        self.modelo = modelo
+        self.dimensao = dimensao
+    
+    def embed(self, textos):
+        resposta = obter_limitador_sincrono().chamar(
+            lambda: self.cliente.embeddings.create(model=self.modelo, input=list(textos), dimensions=self.dimensao))
+        matriz = np.array([item.embedding for item in resposta.data], dtype=np.float32)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return matriz / normas
+
+EMBEDDERS = {
+    "hashing": EmbedderHashing,
+    "openai": EmbedderOpenAI
+}
+
+# Índice vetorial em disco: os vetores ficam num arquivo float32 mapeado em memória (memmap),
+# então dá pra indexar todos os arquivos da pasta inputs sem carregar tudo na RAM.
+# Documento que mudou ou saiu do cache ganha uma "lápide" no itens.jsonl: as linhas dele
+# param de aparecer nas buscas e somem de vez na compactação, quando o índice é aberto.
+# Mais de um processo pode usar a mesma pasta: quem acrescenta segura uma trava de arquivo e
+# relê o que os outros gravaram antes de numerar as linhas novas
+class IndiceVetorial:
+    BLOCO = 65536  # linhas por vez na varredura completa
+    
+    def __init__(self, embedder, pasta=None, vivo=None):
+        """vivo(chave) diz se um documento ainda existe; os que não existem são compactados na abertura"""
+        self.embedder = embedder
+        self.dimensao = embedder.dimensao
+        self.pasta = pasta or os.path.join(PASTA_CACHE, "vetores", f"{embedder.nome}_{embedder.dimensao}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.pasta)), exist_ok=True)
+        # As travas ficam fora da pasta, que é trocada inteira na compactação
+        self.arquivo_trava = self.pasta + ".trava"
+        self._uso = open(self.pasta + ".uso", "a+b")
+        exclusivo = self._travar_uso()
+        self._recuperar_compactacao()
+        os.makedirs(self.pasta, exist_ok=True)
+        self.arquivo_vetores = os.path.join(self.pasta, "vetores.f32")
+        self.arquivo_itens = os.path.join(self.pasta, "itens.jsonl")
+        self.arquivo_textos = os.path.join(self.pasta, "textos.bin")
+        self.arquivo_ivf = os.path.join(self.pasta, "ivf.npz")
+        self.trava = threading.Lock()
+        
+        self._zerar()
+        with self.trava:
+            suspeitos = self._sincronizar()
+        if vivo is not None:
+            suspeitos.update(c for c in self.codigos if not vivo(c))
+        self.remover_documentos(suspeitos)
+        if exclusivo:
+            self._compactar_se_precisar()
+            fcntl.flock(self._uso, fcntl.LOCK_SH)
+    
+    def __len__(self):
+        return len(self.itens)
+    
+    def _travar_uso(self):
+        """Cada processo segura uma trava compartilhada enquanto usa o índice; True se está sozinho (pode compactar)"""
+        if fcntl is None:
+            return False  # no Windows não tem trava compartilhada - sem compactação automática
+        try:
+            fcntl.flock(self._uso, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            fcntl.flock(self._uso, fcntl.LOCK_SH)
+            return False
+    
+    def _zerar(self):
+        # Na memória só fica o mínimo: de qual documento é cada linha e onde está o texto
+        self.itens = []  # (arquivo, pagina, inicio_texto, fim_texto, indice_do_trecho)
+        self.codigo_doc = array('i')  # linha -> código do documento
+        self.codigos = {}  # hash do documento -> código
+        self.chave_codigo = {}  # código -> hash do documento (inclusive dos removidos)
+        self.mortos = set()  # códigos de documentos removidos (linhas ainda no disco)
+        self._ivf = None
+        self._lido_ate = 0  # bytes do itens.jsonl já lidos
+        self._identidade = None  # (dispositivo, inode) do itens.jsonl lido
+    
+    def _linhas_no_disco(self):
+        try:
+            return os.path.getsize(self.arquivo_vetores) // (4 * self.dimensao)
+        except FileNotFoundError:
+            return 0
+    
+    def _sincronizar(self):
+        """Lê o que foi acrescentado no itens.jsonl desde a última vez (por este ou outro processo)
+        
+        Chamado com self.trava. Devolve os documentos gravados no formato antigo com as linhas fora
+        de ordem (dois processos indexando ao mesmo tempo antes da trava de arquivo) - os vetores
+        deles não batem com os itens e precisam ser refeitos.
+        """
+        suspeitos = set()
+        try:
+            estado = os.stat(self.arquivo_itens)
+        except FileNotFoundError:
+            return suspeitos
+        identidade = (estado.st_dev, estado.st_ino)
+        if identidade != self._identidade or estado.st_size < self._lido_ate:
+            if self._identidade is not None:
+                self._zerar()  # a pasta foi trocada por uma compactação: recomeça do zero
+            self._identidade = identidade
+        if estado.st_size == self._lido_ate:
+            return suspeitos
+        
+        linhas_vetores = self._linhas_no_disco()
+        antes = len(self.itens)
+        with open(self.arquivo_itens, "rb") as f:
+            f.seek(self._lido_ate)
+            for linha in f:
+                if not linha.endswith(b"\n"):
+                    break  # outro processo ainda está gravando essa linha
+                item = json.loads(linha)
+                if item.get("x"):
+                    self._marcar_morto(item["h"])
+                else:
+                    if len(self.itens) >= linhas_vetores:
+                        break  # item sem vetor: gravação interrompida
+                    codigo = self.codigos.get(item["h"])
+                    trecho = item.get("t")
+                    if trecho is None:
+                        # Formato antigo, sem o número do trecho: as linhas de um documento vinham seguidas
+                        seguida = codigo is not None and self.codigo_doc[-1] == codigo
+                        if codigo is not None and not seguida:
+                            suspeitos.add(item["h"])
+                        trecho = self.itens[-1][4] + 1 if seguida else 0
+                    self._registrar(item["h"], (item["a"], item["p"], item["i"], item["f"], trecho))
+                self._lido_ate += len(linha)
+        
+        if len(self.itens) > antes:
+            if self._ivf is None:
+                self._carregar_ivf()
+            else:
+                self._completar_grupos()
+        return suspeitos
+    
+    def _registrar(self, chave, item):
+        codigo = self.codigos.get(chave)
+        if codigo is None:
+            codigo = self.codigos[chave] = len(self.chave_codigo)
+            self.chave_codigo[codigo] = chave
+        self.itens.append(item)
+        self.codigo_doc.append(codigo)
+    
+    def _marcar_morto(self, chave):
+        codigo = self.codigos.pop(chave, None)
+        if codigo is not None:
+            self.mortos.add(codigo)
+    
+    def tem_documento(self, chave):
+        return chave in self.codigos
+    
+    def localizar(self, linha):
+        """(hash do documento, índice do trecho) de uma linha devolvida pelo buscar"""
+        return self.chave_codigo[self.codigo_doc[linha]], self.itens[linha][4]
+    
+    def remover_documentos(self, chaves):
+        """Tira documentos das buscas (as linhas saem do disco na próxima compactação)"""
+        with self.trava, trava_de_arquivo(self.arquivo_trava):
+            self._sincronizar()
+            chaves = [c for c in chaves if c in self.codigos]
+            if not chaves:
+                return 0
+            self._descartar_sobras()
+            with open(self.arquivo_itens, "a", encoding="utf-8") as f_itens:
+                for chave in chaves:
+                    f_itens.write(json.dumps({"h": chave, "x": 1}) + "\n")
+            self._sincronizar()
+        return len(chaves)
+    
+    def remover_hash(self, hash_documento):
+        """Remove todas as versões (tamanhos de trecho) de um conteúdo que deixou de existir"""
+        return self.remover_documentos([c for c in list(self.codigos) if c.split(":", 1)[0] == hash_documento])
+    
+    def indexar_documento(self, chave, nome_arquivo, trechos):
+        """Acrescenta os trechos de um documento (se ainda não estiver indexado)"""
+        if not trechos or self.tem_documento(chave):
+            return 0
+        vetores = self.embedder.embed([t['texto'] for t in trechos])
+        
+        with self.trava, trava_de_arquivo(self.arquivo_trava):
+            # Outro processo pode ter acrescentado linhas (ou o mesmo documento) desde a última leitura
+            self._sincronizar()
+            if self.tem_documento(chave):
+                return 0
+            self._descartar_sobras()
+            
+            # Textos e vetores vão pro disco antes dos itens: item gravado sempre tem vetor,
+            # então ninguém (nem outro processo lendo sem trava) mapeia linha que não existe
+            itens = []
+            with open(self.arquivo_textos, "ab") as f_textos:
+                posicao = f_textos.tell()
+                for indice, trecho in enumerate(trechos):
+                    dados = trecho['texto'].encode("utf-8")
+                    f_textos.write(dados)
+                    itens.append({"h": chave, "a": nome_arquivo, "p": trecho['pagina'],
+                                  "i": posicao, "f": posicao + len(dados), "t": indice})
+                    posicao += len(dados)
+            with open(self.arquivo_vetores, "ab") as f_vetores:
+                f_vetores.write(vetores.astype(np.float32).tobytes())
+            with open(self.arquivo_itens, "a", encoding="utf-8") as f_itens:
+                f_itens.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in itens)
+            self._sincronizar()
+            
+            if self._ivf is not None:
+                self._salvar_ivf()
+            elif len(self.itens) >= IVF_MIN_VETORES:
+                self._construir_ivf()
+        return len(trechos)
+    
+    def _descartar_sobras(self):
+        # Com a trava de arquivo ninguém mais está gravando: o que passa do que foi lido
+        # (vetor sem item, item pela metade) é resto de um processo que caiu no meio
+        if self._linhas_no_disco() > len(self.itens):
+            with open(self.arquivo_vetores, "r+b") as f:
+                f.truncate(len(self.itens) * 4 * self.dimensao)
+        if os.path.exists(self.arquivo_itens) and os.path.getsize(self.arquivo_itens) > self._lido_ate:
+            with open(self.arquivo_itens, "r+b") as f:
+                f.truncate(self._lido_ate)
+    
+    def _matriz(self, total=None):
+        total = len(self.itens) if total is None else total
+        if total == 0:
+            return None
+        return np.memmap(self.arquivo_vetores, dtype=np.float32, mode="r", shape=(total, self.dimensao))
+    
+    def texto(self, linha):
+        _, _, inicio, fim, _ = self.itens[linha]
+        with open(self.arquivo_textos, "rb") as f:
+            f.seek(inicio)
+            return f.read(fim - inicio).decode("utf-8")
+    
+    # ---------- Compactação ----------
+    def _recuperar_compactacao(self):
+        # Se caiu entre as duas trocas de pasta, a versão nova já está completa
+        # (quem está compactando segura a trava de uso exclusiva, então aqui ninguém está no meio)
+        nova, velha = self.pasta + ".nova", self.pasta + ".velha"
+        if not os.path.exists(self.pasta) and os.path.exists(nova):
+            os.replace(nova, self.pasta)
+        for sobra in (nova, velha):
+            if os.path.exists(sobra):
+                shutil.rmtree(sobra, ignore_errors=True)
+    
+    def _linhas_vivas(self):
+        codigos = np.array(self.codigo_doc, dtype=np.int32)
+        return np.flatnonzero(~np.isin(codigos, np.fromiter(self.mortos, dtype=np.int32, count=len(self.mortos))))
+    
+    def _compactar_se_precisar(self):
+        # Só na abertura e só sem outro processo usando a pasta: ninguém guardou número de linha
+        if not self.mortos:
+            return
+        vivas = self._linhas_vivas()
+        if len(vivas) and len(self.itens) - len(vivas) < VETORES_COMPACTAR * len(self.itens):
+            return
+        try:
+            with self.trava, trava_de_arquivo(self.arquivo_trava):
+                self._compactar(vivas)
+        except OSError as e:
+            print(f"⚠️  Não consegui compactar o índice vetorial: {e}")
+    
+    def _compactar(self, vivas):
+        """Reescreve os arquivos só com as linhas de documentos vivos (numa pasta nova, trocada no fim)"""
+        nova, velha = self.pasta + ".nova", self.pasta + ".velha"
+        shutil.rmtree(nova, ignore_errors=True)
+        os.makedirs(nova)
+        matriz = self._matriz()
+        with open(self.arquivo_textos, "rb") as f_velho, \
+             open(os.path.join(nova, "textos.bin"), "wb") as f_textos, \
+             open(os.path.join(nova, "itens.jsonl"), "w", encoding="utf-8") as f_itens, \
+             open(os.path.join(nova, "vetores.f32"), "wb") as f_vetores:
+            for inicio in range(0, len(vivas), self.BLOCO):
+                bloco = vivas[inicio:inicio + self.BLOCO]
+                f_vetores.write(np.asarray(matriz[bloco], dtype=np.float32).tobytes())
+                for linha in bloco.tolist():
+                    arquivo, pagina, ini_texto, fim_texto, trecho = self.itens[linha]
+                    f_velho.seek(ini_texto)
+                    dados = f_velho.read(fim_texto - ini_texto)
+                    posicao = f_textos.tell()
+                    f_textos.write(dados)
+                    chave = self.chave_codigo[self.codigo_doc[linha]]
+                    item = {"h": chave, "a": arquivo, "p": pagina, "i": posicao, "f": posicao + len(dados), "t": trecho}
+                    f_itens.write(json.dumps(item, ensure_ascii=False) + "\n")
+        if self._ivf is not None and len(vivas):
+            np.savez(os.path.join(nova, "ivf.npz"), centroides=self._ivf["centroides"], grupos=self._ivf["grupos"][vivas])
+        del matriz
+        
+        removidas = len(self.itens) - len(vivas)
+        os.replace(self.pasta, velha)
+        os.replace(nova, self.pasta)
+        shutil.rmtree(velha, ignore_errors=True)
+        
+        # Recarrega do zero a partir dos arquivos novos
+        self._zerar()
+        self._sincronizar()
+        print(f"🧹 Índice vetorial compactado: {removidas} linhas de documentos antigos removidas")
+    
+    # ---------- IVF ----------
+    def _carregar_ivf(self):
+        try:
+            dados = np.load(self.arquivo_ivf)
+            ivf = {"centroides": dados["centroides"], "grupos": dados["grupos"]}
+        except (FileNotFoundError, OSError, KeyError):
+            ivf = None
+        if ivf is not None and len(ivf["grupos"]) <= len(self.itens):
+            self._ivf = ivf
+            if self._completar_grupos():
+                self._salvar_ivf()
+        elif len(self.itens) >= IVF_MIN_VETORES:
+            self._construir_ivf()
+    
+    def _completar_grupos(self):
+        # Linhas que chegaram depois dos grupos (de outro processo, ou que faltou salvar) só são distribuídas
+        grupos = self._ivf["grupos"]
+        if len(grupos) >= len(self.itens):
+            return False
+        matriz = self._matriz()
+        resto = [self._atribuir(np.asarray(matriz[i:i + self.BLOCO])) for i in range(len(grupos), len(self.itens), self.BLOCO)]
+        self._ivf["grupos"] = np.concatenate([grupos] + resto)
+        return True
+    
+    def _salvar_ivf(self):
+        temporario = arquivo_temporario(self.arquivo_ivf)
+        with open(temporario, "wb") as f:
+            np.savez(f, **self._ivf)
+        os.replace(temporario, self.arquivo_ivf)
+    
+    def _atribuir(self, vetores):
+        return np.argmax(vetores @ self._ivf["centroides"].T, axis=1).astype(np.int32)
+    
+    def _construir_ivf(self, iteracoes=10):
+        """k-means esférico numa amostra e depois distribui todas as linhas, bloco a bloco"""
+        matriz = self._matriz()
+        total = len(matriz)
+        num_grupos = max(1, int(math.sqrt(total)))
+        gerador = np.random.default_rng(0)
+        amostra = np.sort(gerador.choice(total, size=min(total, num_grupos * 40), replace=False))
+        pontos = np.asarray(matriz[amostra])
+        centroides = pontos[gerador.choice(len(pontos), size=num_grupos, replace=False)].copy()
+        
+        for _ in range(iteracoes):
+            rotulos = np.argmax(pontos @ centroides.T, axis=1)
+            for g in range(num_grupos):
+                membros = pontos[rotulos == g]
+                if len(membros):
+                    centroides[g] = membros.sum(axis=0)
+            centroides /= np.maximum(np.linalg.norm(centroides, axis=1, keepdims=True), 1e-9)
+        
+        self._ivf = {"centroides": centroides, "grupos": np.empty(total, dtype=np.int32)}
+        for inicio in range(0, total, self.BLOCO):
+            bloco = np.asarray(matriz[inicio:inicio + self.BLOCO])
+            self._ivf["grupos"][inicio:inicio + len(bloco)] = self._atribuir(bloco)
+        self._salvar_ivf()
+    
+    # ---------- Consulta ----------
+    def buscar(self, consulta, top_k=10, chaves=None):
+        """[(similaridade, linha)] mais parecidas com a consulta; chaves filtra por documento"""
+        q = self.embedder.embed([consulta])[0]
+        
+        # Foto do índice: quantas linhas, de quem é cada uma e os grupos - outra thread (ou outro
+        # processo) pode estar acrescentando documentos enquanto esta busca roda
+        with self.trava:
+            self._sincronizar()
+            total = len(self.itens)
+            if total == 0:
+                return []
+            matriz = self._matriz(total)
+            codigos = np.array(self.codigo_doc[:total], dtype=np.int32)
+            grupos = self._ivf["grupos"] if self._ivf is not None else None
+            centroides = self._ivf["centroides"] if self._ivf is not None else None
+            if chaves is not None:
+                permitidos = np.array([self.codigos[c] for c in chaves if c in self.codigos], dtype=np.int32)
+                if len(permitidos) == 0:
+                    return []
+                excluir = False
+            elif self.mortos:
+                permitidos = np.fromiter(self.mortos, dtype=np.int32, count=len(self.mortos))
+                excluir = True
+            else:
+                permitidos = None
+        
+        def filtro(linhas_codigos):
+            return np.isin(linhas_codigos, permitidos, invert=excluir)
+        
+        if grupos is not None and len(grupos) == total:
+            # Só olha as linhas dos grupos mais próximos da consulta
+            grupos_proximos = np.argsort(centroides @ q)[-IVF_SONDAGENS:]
+            linhas = np.flatnonzero(np.isin(grupos, grupos_proximos))
+            if permitidos is not None:
+                linhas = linhas[filtro(codigos[linhas])]
+            pontuacoes = np.asarray(matriz[linhas]) @ q
+            return heapq.nlargest(top_k, self._top(pontuacoes, linhas, top_k))
+        
+        # Varredura completa, um bloco de cada vez pra memória não explodir
+        melhores = []
+        for inicio in range(0, total, self.BLOCO):
+            bloco = np.asarray(matriz[inicio:inicio + self.BLOCO])
+            linhas = np.arange(inicio, inicio + len(bloco))
+            if permitidos is not None:
+                selecao = filtro(codigos[inicio:inicio + len(bloco)])
+                bloco, linhas = bloco[selecao], linhas[selecao]
+            melhores.extend(self._top(bloco @ q, linhas, top_k))
+        return heapq.nlargest(top_k, melhores)
+    
+    @staticmethod
+    def _top(pontuacoes, linhas, top_k):
+        if len(pontuacoes) > top_k:
+            escolhidos = np.argpartition(-pontuacoes, top_k)[:top_k]
+        else:
+            escolhidos = np.arange(len(pontuacoes))
+        return [(float(pontuacoes[i]), int(linhas[i])) for i in escolhidos]
+
+_indice_vetorial = None
+
+def obter_indice_vetorial(cliente=None):
+    """Índice vetorial compartilhado (um por processo); None se o numpy não estiver instalado"""
+    global _indice_vetorial
+    if np is None or not USAR_VETORES:
+        return None
+    if _indice_vetorial is None:
+        if EMBEDDER_PADRAO == "openai":
+            if cliente is None:
+                return None
+            embedder = EmbedderOpenAI(cliente)
+        else:
+            embedder = EMBEDDERS[EMBEDDER_PADRAO]()
+        # Documento vivo = conteúdo que ainda está no cache de extrações, com o tamanho de trecho atual
+        cache = obter_cache_extracao()
+        with cache.trava:
+            hashes = {registro["hash"] for registro in cache.indice.values()}
+        sufixo = f":{TAMANHO_TRECHO}:{SOBREPOSICAO_TRECHO}"
+        vivo = lambda chave: chave.endswith(sufixo) and chave.split(":", 1)[0] in hashes
+        _indice_vetorial = IndiceVetorial(embedder, vivo=vivo)
+    return _indice_vetorial
+
+# Tudo que é montado a partir de um documento carregado fica aqui, criado só quando precisa
+# Assim o modo com IA monta o índice uma vez e usa em todas as perguntas
+class RecursosDocumento:
+    def __init__(self, dados_arquivo):
+        self.dados = dados_arquivo
+        self.nome_arquivo = dados_arquivo['nome_arquivo']
+        self._analisador = None
+        self._trechos = None
+        self._bm25 = None
+        # Várias threads podem pedir a mesma coisa ao mesmo tempo (modo em lote)
+        self.trava = threading.RLock()
+    
+    @property
+    def analisador(self):
+        with self.trava:
+            if self._analisador is None:
+                self._analisador = AnalisadorTexto(paginas=self.dados['paginas'], chave=self.dados.get('hash'))
+            return self._analisador
+    
+    @property
+    def trechos(self):
+        with self.trava:
+            if self._trechos is None:
+                self._trechos = dividir_em_trechos(self.dados['paginas'])
+            return self._trechos
+    
+    @property
+    def bm25(self):
+        with self.trava:
+            if self._bm25 is None:
+                indice = IndiceBM25()
+                for trecho in self.trechos:
+                    indice.adicionar(trecho['texto'])
+                self._bm25 = indice
+            return self._bm25
+    
+    def memoria_estimada(self):
+        """Estimativa grosseira (em bytes) do que este documento ocupa com tudo montado"""
+        return self.dados['estatisticas'].get('total_caracteres', 0) * BYTES_POR_CARACTERE
+    
+    def preparar(self, analise=True):
+        """Monta logo os índices de recuperação (e a análise), em vez de esperar a primeira pergunta"""
+        self.bm25
+        self.vetores_prontos()
+        if analise:
+            self.analisador
+        return self
+    
+    def chave_vetorial(self):
+        # Se mudar o tamanho dos trechos, os vetores antigos não batem mais - por isso entra na chave
+        if not self.dados.get('hash'):
+            return None
+        return f"{self.dados['hash']}:{TAMANHO_TRECHO}:{SOBREPOSICAO_TRECHO}"
+    
+    def vetores_prontos(self, cliente=None):
+        """Garante que os trechos deste documento estão no índice vetorial (se der pra usar)"""
+        chave = self.chave_vetorial()
+        indice = obter_indice_vetorial(cliente)
+        if indice is None or not chave:
+            return None
+        try:
+            indice.indexar_documento(chave, self.nome_arquivo, self.trechos)
+        except Exception as e:
+            print(f"⚠️  Busca semântica indisponível: {e}")
+            return None
+        return indice
+    
+    def melhores_trechos(self, pergunta, top_k=10):
+        """[(pontuação, índice_do_trecho)] mais relevantes pra pergunta"""
+        lexicos = self.bm25.buscar(pergunta, top_k * 2)
+        indice = self.vetores_prontos()
+        if indice is None:
+            return lexicos[:top_k]
+        
+        # Cada linha do índice vetorial guarda o número do trecho; confiro dono e limite pra um
+        # índice antigo ou bagunçado não derrubar a pergunta
+        chave = self.chave_vetorial()
+        semanticos = []
+        for pontuacao, linha in indice.buscar(pergunta, top_k * 2, chaves=[chave]):
+            dono, indice_trecho = indice.localizar(linha)
+            if dono == chave and 0 <= indice_trecho < len(self.trechos):
+                semanticos.append((pontuacao, indice_trecho))
+        
+        # Junta os dois rankings com reciprocal rank fusion (não precisa calibrar as escalas)
+        fusao = {}
+        for ranking in (lexicos, semanticos):
+            for posicao, (_, indice_trecho) in enumerate(sorted(ranking, reverse=True)):
+                fusao[indice_trecho] = fusao.get(indice_trecho, 0.0) + 1.0 / (60 + posicao)
+        return heapq.nlargest(top_k, ((p, t) for t, p in fusao.items()))
+    
+    def selecionar_contexto(self, pergunta, limite=LIMITE_CONTEXTO_TOKENS):
+        """Monta o contexto com os trechos mais relevantes que couberem no limite (em tokens)"""
+        candidatos = (
+            (indice, f"[Página {self.trechos[indice]['pagina']}] ", self.trechos[indice]['texto'])
+            for _, indice in self.melhores_trechos(pergunta, top_k=20)
+        )
+        documento = self.chave_vetorial()
+        escolhidos = empacotar_trechos(candidatos, limite,
+                                       chave_contagem=(lambda indice: (documento, indice)) if documento else None)
+        
+        if not escolhidos:
+            # Nenhum termo da pergunta aparece - volta pro começo e fim do documento
+            return montar_contexto_inicio_fim(self.dados['paginas'], limite)
+        
+        # Mantém a ordem do documento pra leitura ficar natural
+        partes = []
+        for indice in sorted(escolhidos):
+            trecho = self.trechos[indice]
+            partes.append(f"[Página {trecho['pagina']}] {trecho['texto']}")
+        return "\n\n".join(partes)
+
+# Guarda os documentos já carregados (e seus índices) pra reaproveitar entre perguntas/jobs
+# Com limite_mb vira um LRU: passou do orçamento, sai o documento usado há mais tempo
+class PoolDocumentos:
+    def __init__(self, limite_mb=None):
+        self.documentos = OrderedDict()  # do usado há mais tempo pro mais recente
+        self.assinaturas = {}  # nome -> (tamanho, mtime) de quando foi carregado
+        self.trava = threading.Lock()
+        self.travas_arquivo = {}  # uma trava por arquivo, pra não carregar o mesmo duas vezes
+        self.carregados = 0
+        self.despejados = 0
+        self.limite_bytes = limite_mb * 1024 * 1024 if limite_mb else None
+    
+    def memoria_estimada(self):
+        with self.trava:
+            return sum(r.memoria_estimada() for r in self.documentos.values())
+    
+    def _despejar(self):
+        # Chamado com a trava; sempre fica pelo menos o documento mais recente
+        total = sum(r.memoria_estimada() for r in self.documentos.values())
+        while self.limite_bytes and total > self.limite_bytes and len(self.documentos) > 1:
+            nome, recursos = self.documentos.popitem(last=False)
+            self.assinaturas.pop(nome, None)
+            total -= recursos.memoria_estimada()
+            self.despejados += 1
+    
+    @staticmethod
+    def assinatura(nome_arquivo):
+        try:
+            info = os.stat(os.path.join(PASTA_INPUTS, nome_arquivo))
+        except OSError:
+            return None
+        return (info.st_size, info.st_mtime_ns)
+    
+    def pronto(self, nome_arquivo):
+        """True se o arquivo já está carregado e continua igual ao do disco"""
+        with self.trava:
+            return nome_arquivo in self.documentos and self.assinaturas.get(nome_arquivo) == self.assinatura(nome_arquivo)
+    
+    def obter(self, nome_arquivo, levantar=False):
+        """RecursosDocumento do arquivo, carregando só na primeira vez (ou se mudou); None se falhar
+        (com levantar=True o erro sobe, em vez de ser impresso)"""
+        assinatura = self.assinatura(nome_arquivo)
+        with self.trava:
+            recursos = self.documentos.get(nome_arquivo)
+            if recursos is not None and self.assinaturas.get(nome_arquivo) == assinatura:
+                self.documentos.move_to_end(nome_arquivo)
+                return recursos
+            trava_arquivo = self.travas_arquivo.setdefault(nome_arquivo, threading.Lock())
+        
+        with trava_arquivo:
+            recursos = self.documentos.get(nome_arquivo)
+            if recursos is None or self.assinaturas.get(nome_arquivo) != assinatura:
+                dados = GerenciadorArquivos.carregar_arquivo(nome_arquivo, levantar=levantar)
+                if dados is None:
+                    return None
+                recursos = RecursosDocumento(dados)
+                with self.trava:
+                    self.documentos[nome_arquivo] = recursos
+                    self.documentos.move_to_end(nome_arquivo)
+                    self.assinaturas[nome_arquivo] = assinatura
+                    self.carregados += 1
+                    self._despejar()
+            return recursos
+    
+    def descartar(self, nome_arquivo):
+        """Tira um arquivo do pool (ex.: mudou no disco e precisa recarregar)"""
+        with self.trava:
+            self.assinaturas.pop(nome_arquivo, None)
+            return self.documentos.pop(nome_arquivo, None)
+
+# Vigia a pasta inputs em segundo plano e já deixa os arquivos prontos (extraídos, tokenizados,
+# indexados) antes do usuário escolher. É polling com os.scandir - funciona em qualquer sistema
+class IngestorBackground:
+    def __init__(self, pool, intervalo=INTERVALO_VIGIA, workers=WORKERS_INGESTAO):
+        self.pool = pool
+        self.intervalo = intervalo
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestao")
+        self.snapshot = {}  # nome -> (tamanho, mtime)
+        self.trava = threading.Lock()
+        self.na_fila = set()
+        self.processando = set()
+        self.falhas = {}  # nome -> (assinatura, tentativas) dos que deram erro
+        self.repetir = set()  # deram erro mas ainda têm tentativa - entram de novo na próxima varredura
+        self.prontos = 0
+        self.ultimo_erro = None
+        self._parar = threading.Event()
+        self._thread = None
+    
+    @property
+    def rodando(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def iniciar(self):
+        if self.rodando:
+            return
+        self.verificar()  # primeira varredura já na hora, pra listagem funcionar de cara
+        self._thread = threading.Thread(target=self._loop, name="vigia-inputs", daemon=True)
+        self._thread.start()
+    
+    def parar(self):
+        self._parar.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.verificar()
+            except Exception as e:
+                self.ultimo_erro = str(e)
+    
+    def _varrer(self):
+        atual = {}
+        with os.scandir(PASTA_INPUTS) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and entrada.name.lower().endswith((".pdf", ".txt")):
+                    info = entrada.stat()
+                    atual[entrada.name] = (info.st_size, info.st_mtime_ns)
+        return atual
+    
+    def verificar(self):
+        """Compara a pasta com a última varredura e agenda o que é novo/mudou"""
+        atual = self._varrer()
+        with self.trava:
+            anterior = self.snapshot
+            self.snapshot = atual
+            repetir, self.repetir = self.repetir, set()
+            for nome in anterior.keys() - atual.keys():
+                self.falhas.pop(nome, None)
+        
+        for nome in anterior.keys() - atual.keys():
+            self.pool.descartar(nome)
+        for nome, assinatura in atual.items():
+            if anterior.get(nome) != assinatura or nome in repetir:
+                self._agendar(nome)
+    
+    def _agendar(self, nome):
+        with self.trava:
+            if nome in self.na_fila:
+                return
+            self.na_fila.add(nome)
+        try:
+            self.executor.submit(self._ingerir, nome)
+        except RuntimeError:
+            # Executor já foi desligado (programa saindo)
+            with self.trava:
+                self.na_fila.discard(nome)
+    
+    def _ingerir(self, nome):
+        with self.trava:
+            self.na_fila.discard(nome)
+            self.processando.add(nome)
+        try:
+            # Nada de print aqui - o menu está na tela; o erro aparece no status
+            recursos = self.pool.obter(nome, levantar=True)
+            if recursos is None:
+                raise ValueError(f"não consegui carregar {nome}")
+            recursos.preparar()
+            with self.trava:
+                self.prontos += 1
+                self.falhas.pop(nome, None)
+        except Exception as e:
+            self.ultimo_erro = f"{nome}: {e}"
+            assinatura = self.pool.assinatura(nome)
+            with self.trava:
+                anterior = self.falhas.get(nome)
+                tentativas = anterior[1] + 1 if anterior and anterior[0] == assinatura else 1
+                self.falhas[nome] = (assinatura, tentativas)
+                if tentativas < TENTATIVAS_INGESTAO:
+                    self.repetir.add(nome)
+        finally:
+            with self.trava:
+                self.processando.discard(nome)
+    
+    def listar(self):
+        """Mesmo formato do GerenciadorArquivos.listar_arquivos, mas sem ir no disco"""
+        with self.trava:
+            itens = sorted(self.snapshot.items())
+        return [{
+            'nome': nome,
+            'caminho': os.path.join(PASTA_INPUTS, nome),
+            'tamanho_kb': round(tamanho / 1024, 2),
+            'extensao': os.path.splitext(nome)[1].lower()
+        } for nome, (tamanho, _) in itens]
+    
+    def status(self):
+        with self.trava:
+            fila, processando, falhas = len(self.na_fila), len(self.processando), len(self.falhas)
+            nomes = [n for n in self.snapshot
+                     if n not in self.na_fila and n not in self.processando and n not in self.falhas]
+            total = len(self.snapshot)
+        # Com o pool limitado, o que saiu da memória continua pronto no cache em disco
+        em_memoria = sum(1 for nome in nomes if self.pool.pronto(nome))
+        texto = (f"⚙️  Pré-processamento: {len(nomes)}/{total} prontos ({em_memoria} em memória), "
+                 f"{processando} processando, {fila} na fila")
+        if falhas:
+            texto += f", {falhas} com erro"
+        if self.ultimo_erro:
+            texto += f" | último erro: {self.ultimo_erro}"
+        return texto
+
+_ingestor = None
+
+# Corpus: todos os arquivos da pasta inputs num índice só
+# Cada documento continua com o seu BM25; o corpus só soma as estatísticas globais (df, tamanhos)
+# então adicionar ou tirar um arquivo não obriga a reindexar os outros
+class Corpus:
+    def __init__(self, pool=None):
+        # Os RecursosDocumento ficam só no pool, que respeita o POOL_MB: aqui guardo o mínimo de cada
+        # arquivo, e quem foi despejado é recarregado (do cache de extração) quando a busca precisar
+        self.pool = pool or PoolDocumentos()
+        self.documentos = {}  # nome -> hash do conteúdo indexado
+        self.chaves_vetoriais = {}  # nome -> chave no índice vetorial
+        self.assinaturas = {}  # nome -> (tamanho, mtime) de quando foi indexado
+        self.df = Counter()  # em quantos trechos (de todos os arquivos) cada termo aparece
+        self.total_trechos = 0
+        self.total_tamanhos = 0
+        self.nome_arquivo = "corpus (todos os arquivos)"
+        self.trava = threading.RLock()
+    
+    @property
+    def dados(self):
+        # Identidade do corpus = conjunto dos hashes; usado como chave no cache de respostas
+        hashes = sorted(h or n for n, h in self.documentos.items())
+        return {'hash': hashlib.sha256("|".join(hashes).encode()).hexdigest()}
+    
+    def _recursos(self, nome):
+        return self.pool.obter(nome)
+    
+    def _recursos_de_todos(self):
+        """(nome, recursos) de cada arquivo, um por vez - o pool vai despejando os mais antigos"""
+        for nome in sorted(self.documentos):
+            recursos = self._recursos(nome)
+            if recursos is not None:
+                yield nome, recursos
+    
+    def atualizar(self, arquivos=None):
+        """Sincroniza com a pasta: indexa só o que é novo ou mudou e tira o que sumiu.
+        Devolve (adicionados, removidos)."""
+        if arquivos is None:
+            arquivos = GerenciadorArquivos.listar_arquivos()
+        atuais = {}
+        for arq in arquivos:
+            try:
+                info = os.stat(arq['caminho'])
+            except OSError:
+                continue
+            atuais[arq['nome']] = (info.st_size, info.st_mtime_ns)
+        
+        with self.trava:
+            removidos = [n for n in self.documentos if atuais.get(n) != self.assinaturas.get(n)]
+            recalcular = False
+            for nome in removidos:
+                if not self._remover(nome):
+                    recalcular = True
+            if recalcular:
+                self._recalcular_globais()
+            adicionados = []
+            for nome, assinatura in atuais.items():
+                if nome not in self.documentos and self._adicionar(nome, assinatura):
+                    adicionados.append(nome)
+        # Arquivo alterado aparece nas duas listas; pro usuário ele só foi "atualizado"
+        return adicionados, [n for n in removidos if n not in atuais]
+    
+    def _somar(self, bm25, sinal=1):
+        for termo, lista in bm25.postings.items():
+            self.df[termo] += sinal * len(lista)
+            if self.df[termo] <= 0:
+                del self.df[termo]
+        self.total_trechos += sinal * len(bm25)
+        self.total_tamanhos += sinal * bm25.total_tamanhos
+    
+    def _adicionar(self, nome, assinatura):
+        recursos = self._recursos(nome)
+        if recursos is None:
+            return False
+        self._somar(recursos.bm25)
+        recursos.vetores_prontos()
+        self.documentos[nome] = recursos.dados.get('hash')
+        self.chaves_vetoriais[nome] = recursos.chave_vetorial()
+        self.assinaturas[nome] = assinatura
+        return True
+    
+    def _remover(self, nome):
+        """Tira o arquivo das contagens; False se a versão indexada já saiu do pool (aí precisa recalcular)"""
+        hash_indexado = self.documentos.pop(nome)
+        self.chaves_vetoriais.pop(nome, None)
+        self.assinaturas.pop(nome, None)
+        recursos = self.pool.descartar(nome)
+        if recursos is None or recursos.dados.get('hash') != hash_indexado:
+            return False
+        self._somar(recursos.bm25, -1)
+        return True
+    
+    def _recalcular_globais(self):
+        # As contagens de quem saiu não ficam guardadas - refaz a partir dos que ficaram
+        self.df, self.total_trechos, self.total_tamanhos = Counter(), 0, 0
+        for _, recursos in self._recursos_de_todos():
+            self._somar(recursos.bm25)
+    
+    def melhores_trechos(self, pergunta, top_k=10):
+        """[(pontuação, (nome_arquivo, índice_do_trecho))] de qualquer documento"""
+        with self.trava:
+            if not self.total_trechos:
+                return []
+            globais = (self.total_trechos, self.total_tamanhos / self.total_trechos or 1, self.df)
+            lexicos = []
+            quantos_trechos = {}
+            for nome, recursos in self._recursos_de_todos():
+                quantos_trechos[nome] = len(recursos.trechos)
+                for pontuacao, indice in recursos.bm25.buscar(pergunta, top_k * 2, globais):
+                    lexicos.append((pontuacao, (nome, indice)))
+            lexicos = heapq.nlargest(top_k * 2, lexicos)
+            
+            indice_vetorial = obter_indice_vetorial()
+            chaves = {c: n for n, c in self.chaves_vetoriais.items() if c}
+            if indice_vetorial is None or not chaves:
+                return lexicos[:top_k]
+            
+            # Linha do índice vetorial -> (arquivo, trecho), descartando o que não bate com os trechos
+            semanticos = []
+            for pontuacao, linha in indice_vetorial.buscar(pergunta, top_k * 2, chaves=list(chaves)):
+                dono, indice_trecho = indice_vetorial.localizar(linha)
+                nome = chaves.get(dono)
+                if nome is not None and 0 <= indice_trecho < quantos_trechos.get(nome, 0):
+                    semanticos.append((pontuacao, (nome, indice_trecho)))
+        
+        fusao = {}
+        for ranking in (lexicos, sorted(semanticos, reverse=True)):
+            for posicao, (_, alvo) in enumerate(ranking):
+                fusao[alvo] = fusao.get(alvo, 0.0) + 1.0 / (60 + posicao)
+        return heapq.nlargest(top_k, ((p, alvo) for alvo, p in fusao.items()))
+    
+    def selecionar_contexto(self, pergunta, limite=LIMITE_CONTEXTO_TOKENS):
+        """Mesmo do RecursosDocumento, mas os trechos podem vir de qualquer arquivo"""
+        candidatos = []
+        trechos = {}  # segura os trechos de cada arquivo até o fim, mesmo que o pool despeje
+        for _, (nome, indice) in self.melhores_trechos(pergunta, top_k=20):
+            if nome not in trechos:
+                recursos = self._recursos(nome)
+                trechos[nome] = recursos.trechos if recursos is not None else []
+            if indice >= len(trechos[nome]):
+                continue
+            trecho = trechos[nome][indice]
+            candidatos.append(((nome, indice), f"[{nome} - Página {trecho['pagina']}] ", trecho['texto']))
+        
+        def chave_contagem(alvo):
+            documento = self.chaves_vetoriais.get(alvo[0])
+            return (documento, alvo[1]) if documento else None
+        escolhidos = empacotar_trechos(candidatos, limite, chave_contagem=chave_contagem)
+        
+        partes = []
+        for nome, indice in sorted(escolhidos):
+            trecho = trechos[nome][indice]
+            partes.append(f"[{nome} - Página {trecho['pagina']}] {trecho['texto']}")
+        return "\n\n".join(partes)
+    
+    def buscar_palavra(self, palavra):
+        print(f"\n🔍 Buscando '{palavra}' em {len(self.documentos)} arquivos")
+        print("=" * 50)
+        total = 0
+        for nome, recursos in self._recursos_de_todos():
+            analisador = recursos.analisador
+            ocorrencias = analisador.encontrar_ocorrencias(palavra)
+            if not ocorrencias:
+                continue
+            total += len(ocorrencias)
+            print(f"\n📄 {nome}: {len(ocorrencias)} ocorrências")
+            for inicio, fim in ocorrencias[:3]:
+                print(f"   p.{analisador.pagina_do_offset(inicio)}: ...{analisador.contexto(inicio, fim)}...")
+        if not total:
+            print("❌ Palavra não encontrada em nenhum arquivo")
+    
+    def analisar_palavras_chave(self, n=15):
+        print(f"\n🔑 Palavras-chave do corpus ({len(self.documentos)} arquivos)")
+        print("=" * 50)
+        total = Counter()
+        por_arquivo = {}
+        for nome, recursos in self._recursos_de_todos():
+            analise = recursos.analisador.analise
+            contagens = dict(zip(analise.vocabulario, analise.contagens))
+            por_arquivo[nome] = contagens
+            total.update(contagens)
+        if not total:
+            print("❌ Nada para analisar")
+            return
+        for palavra, freq in total.most_common(n):
+            fontes = sorted(((c[palavra], nome) for nome, c in por_arquivo.items() if palavra in c), reverse=True)
+            detalhe = ", ".join(f"{nome}: {qtd}" for qtd, nome in fontes[:3])
+            print(f"   {palavra}: {freq}x  ({detalhe})")
+
 # ========== MODO SEM IA ==========
-def executar_modo_sem_ia(dados_arquivo):
-    if not dados_arquivo or not dados_arquivo.get('texto'):
+def executar_modo_sem_ia(dados_arquivo, recursos=None):
+    if not dados_arquivo or not dados_arquivo.get('paginas'):
         print("❌ Problema ao carregar o arquivo")
         return
     
-    analisador = AnalisadorTexto(dados_arquivo['texto'])
+    # Se veio do pool, o analisador provavelmente já foi montado em segundo plano
+    if recursos is not None:
+        analisador = recursos.analisador
+    else:
+        analisador = AnalisadorTexto(paginas=dados_arquivo['paginas'], chave=dados_arquivo.get('hash'))
     
     while True:
         print(f"\n🎯 Modo Sem IA - {dados_arquivo['nome_arquivo']}")
@@ -444,7 +3616,10 @@ def executar_modo_sem_ia(dados_arquivo):
         print("5 - ⚖️ Comparar palavras")
         print("6 - 📄 Ver metadados")
         print("7 - 💾 Exportar análise")
-        print("8 - 🔙 Voltar")
+        print("8 - 💬 Perguntar (resposta tirada do texto, sem IA)")
+        print("9 - 🔎 Busca aproximada (sem acento, com erro, prefixo*)")
+        print('10 - 🧮 Consulta avançada (AND, OR, NOT, "frase", NEAR/k)')
+        print("11 - 🔙 Voltar")
         
         opcao = input("\nEscolha uma opção: ").strip()
         
@@ -473,140 +3648,660 @@ def executar_modo_sem_ia(dados_arquivo):
         elif opcao == "7":
             analisador.exportar_analise(dados_arquivo['nome_arquivo'])
         elif opcao == "8":
+            pergunta = input("Sua pergunta: ").strip()
+            if pergunta:
+                analisador.responder_extrativo(pergunta)
+        elif opcao == "9":
+            consulta = input("Digite o que buscar (termine com * pra prefixo): ").strip()
+            if consulta:
+                analisador.buscar_aproximada(consulta)
+        elif opcao == "10":
+            consulta = input('Consulta (ex.: firewall AND senha NOT wifi): ').strip()
+            if consulta:
+                analisador.buscar_consulta(consulta)
+        elif opcao == "11":
             break
         else:
             print("❌ Opção inválida")
         
         input("\nPressione Enter para continuar...")
 
-# ========== MODO COM IA ==========
-def gerenciar_chaves(gerenciador_chaves):
-    while True:
-        print(f"\n🔑 Gerenciar Chaves API")
-        print("=" * 40)
-        gerenciador_chaves.mostrar_status()
-        print("\n1 - 📝 Adicionar/Atualizar Chave OpenAI")
-        print("2 - 🗑️  Remover Chave OpenAI")
-        print("3 - 🔙 Voltar")
-        
-        opcao = input("\nEscolha: ").strip()
-        
-        if opcao == "1":
-            print("\n📝 Configurar Chave da OpenAI")
-            print("💡 Obtenha em: https://platform.openai.com/api-keys")
-            
-            chave_atual = gerenciador_chaves.get_chave_openai()
-            if chave_atual:
-                print(f"Chave atual: {chave_atual[:4]}...{chave_atual[-4:]}")
-                confirmar = input("Substituir? (s/N): ").lower()
-                if confirmar != 's':
+# ========== MODO COM IA ==========
+def gerenciar_chaves(gerenciador_chaves):
+    while True:
+        print(f"\n🔑 Gerenciar Chaves API")
+        print("=" * 40)
+        gerenciador_chaves.mostrar_status()
+        print("\n1 - 📝 Adicionar/Atualizar Chave OpenAI")
+        print("2 - 🗑️  Remover Chave OpenAI")
+        print("3 - 🔙 Voltar")
+        
+        opcao = input("\nEscolha: ").strip()
+        
+        if opcao == "1":
+            print("\n📝 Configurar Chave da OpenAI")
+            print("💡 Obtenha em: https://platform.openai.com/api-keys")
+            
+            chave_atual = gerenciador_chaves.get_chave_openai()
+            if chave_atual:
+                print(f"Chave atual: {chave_atual[:4]}...{chave_atual[-4:]}")
+                confirmar = input("Substituir? (s/N): ").lower()
+                if confirmar != 's':
+                    continue
+            
+            nova_chave = input("Digite sua nova chave: ").strip()
+            if nova_chave:
+                gerenciador_chaves.set_chave_openai(nova_chave)
+        
+        elif opcao == "2":
+            if gerenciador_chaves.get_chave_openai():
+                confirmar = input("Tem certeza que quer remover a chave? (s/N): ").lower()
+                if confirmar == 's':
+                    gerenciador_chaves.remover_chave()
+            else:
+                print("❌ Nenhuma chave para remover")
+        
+        elif opcao == "3":
+            break
+        
+        else:
+            print("❌ Opção inválida")
+        
+        input("\nEnter para continuar...")
+
+# Cache das respostas da OpenAI - a mesma pergunta sobre o mesmo PDF não precisa pagar de novo
+# Uso SQLite porque dá LRU/TTL fácil sem reescrever um JSON inteiro a cada resposta
+class CacheRespostas:
+    def __init__(self, arquivo=None, ttl=CACHE_RESPOSTAS_TTL, maximo=CACHE_RESPOSTAS_MAX,
+                 aproximado=CACHE_RESPOSTAS_APROXIMADO):
+        self.arquivo = arquivo or os.path.join(PASTA_CACHE, "respostas.sqlite")
+        os.makedirs(os.path.dirname(self.arquivo), exist_ok=True)
+        self.ttl = ttl
+        self.maximo = maximo
+        self.aproximado = aproximado
+        self.acertos = 0
+        self.falhas = 0
+        self.trava = threading.Lock()
+        self.conexao = sqlite3.connect(self.arquivo, check_same_thread=False)
+        self.conexao.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            "chave TEXT PRIMARY KEY, resposta TEXT NOT NULL, criado REAL NOT NULL, acesso REAL NOT NULL)"
+        )
+        self.conexao.execute("CREATE INDEX IF NOT EXISTS idx_acesso ON respostas(acesso)")
+        self.conexao.commit()
+    
+    @staticmethod
+    def normalizar_pergunta(pergunta):
+        return re.sub(r'\s+', ' ', pergunta).strip().lower()
+    
+    def chave(self, documento, contexto, pergunta, modelo, temperatura, max_tokens, conversa=None):
+        """Hash de tudo que muda a resposta: documento, contexto, pergunta, parâmetros do modelo
+        e a conversa anterior (se tiver)"""
+        if self.aproximado:
+            pergunta = self.normalizar_pergunta(pergunta)
+        partes = [documento, contexto, pergunta, modelo, temperatura, max_tokens]
+        if conversa:
+            partes.append(conversa)
+        partes = json.dumps(partes, ensure_ascii=False)
+        return hashlib.sha256(partes.encode("utf-8")).hexdigest()
+    
+    def buscar(self, chave):
+        agora = time.time()
+        with self.trava:
+            linha = self.conexao.execute(
+                "SELECT resposta, criado FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha and agora - linha[1] <= self.ttl:
+                self.conexao.execute("UPDATE respostas SET acesso = ? WHERE chave = ?", (agora, chave))
+                self.conexao.commit()
+                self.acertos += 1
+                metricas.contar('cache_respostas.acertos')
+                return linha[0]
+            if linha:
+                # Venceu - tira logo pra não ocupar espaço
+                self.conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self.conexao.commit()
+            self.falhas += 1
+            metricas.contar('cache_respostas.falhas')
+            return None
+    
+    def guardar(self, chave, resposta):
+        agora = time.time()
+        with self.trava:
+            self.conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resposta, criado, acesso) VALUES (?, ?, ?, ?)",
+                (chave, resposta, agora, agora)
+            )
+            # Passou do máximo? Sai quem foi usado há mais tempo
+            self.conexao.execute(
+                "DELETE FROM respostas WHERE chave IN ("
+                "SELECT chave FROM respostas ORDER BY acesso DESC LIMIT -1 OFFSET ?)", (self.maximo,)
+            )
+            self.conexao.commit()
+    
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        with self.trava:
+            guardadas = self.conexao.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+        return {
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': self.acertos / total if total else 0.0,
+            'respostas_guardadas': guardadas
+        }
+    
+    def mostrar_estatisticas(self):
+        stats = self.estatisticas()
+        print(f"\n💾 Cache de respostas: {stats['acertos']} acertos, {stats['falhas']} falhas "
+              f"({stats['taxa_acerto']:.0%}) - {stats['respostas_guardadas']} guardadas")
+
+_cache_respostas = None
+
+def obter_cache_respostas():
+    global _cache_respostas
+    if _cache_respostas is None:
+        _cache_respostas = CacheRespostas()
+    return _cache_respostas
+
+def montar_prompt(contexto, pergunta):
+    return f"""
+        Com base no seguinte documento, responda de forma precisa:
+
+        DOCUMENTO:
+        {contexto}
+
+        PERGUNTA: {pergunta}
+
+        Responda em português, sendo direto e baseado apenas no conteúdo do documento.
+        Se a informação não estiver no documento, diga claramente.
+        """
+
+# Memória da conversa: as últimas trocas vão inteiras e as mais antigas viram um resumo
+# que vai sendo atualizado aos poucos (só o turno que saiu da janela entra nele)
+class MemoriaConversa:
+    def __init__(self, orcamento=MEMORIA_TOKENS, literais=MEMORIA_TURNOS_LITERAIS, resumidor=None):
+        self.orcamento = orcamento
+        self.literais = literais
+        self.resumidor = resumidor  # função (resumo, pergunta, resposta) -> novo resumo
+        self.resumo = ""
+        self.turnos = []  # [(pergunta, resposta)] mais recentes, na íntegra
+    
+    @property
+    def orcamento_resumo(self):
+        return self.orcamento // 3
+    
+    def vazia(self):
+        return not self.resumo and not self.turnos
+    
+    def limpar(self):
+        self.resumo = ""
+        self.turnos = []
+    
+    def _tokens(self):
+        contador = obter_contador_tokens()
+        return contador.contar(self.resumo) + sum(contador.contar(p) + contador.contar(r) for p, r in self.turnos)
+    
+    def adicionar(self, pergunta, resposta):
+        self.turnos.append((pergunta, resposta))
+        # Tira da janela o que passou do número de turnos ou do orçamento, do mais velho pro mais novo
+        while self.turnos and (len(self.turnos) > self.literais or self._tokens() > self.orcamento):
+            antiga_pergunta, antiga_resposta = self.turnos.pop(0)
+            self._resumir(antiga_pergunta, antiga_resposta)
+    
+    def _resumir(self, pergunta, resposta):
+        novo = None
+        if self.resumidor:
+            try:
+                novo = self.resumidor(self.resumo, pergunta, resposta)
+            except Exception as e:
+                print(f"\n⚠️  Não consegui resumir com a IA, vou resumir localmente: {e}")
+        if not novo:
+            novo = self.resumo_local(self.resumo, pergunta, resposta)
+        # Garante o teto: se estourar, perde o começo do resumo (o mais antigo)
+        self.resumo = obter_contador_tokens().cortar(novo.strip(), self.orcamento_resumo, do_fim=True)
+    
+    @staticmethod
+    def resumo_local(resumo, pergunta, resposta):
+        # Sem IA: fica a pergunta e a primeira frase da resposta
+        primeira = TokenizadorRegex.dividir_sentencas(resposta)
+        primeira = primeira[0] if primeira else resposta
+        return f"{resumo} P: {pergunta} R: {primeira[:300]}".strip()
+    
+    def mensagens(self):
+        """A conversa anterior no formato de mensagens do chat"""
+        mensagens = []
+        if self.resumo:
+            mensagens.append({"role": "system", "content": f"Resumo da conversa até aqui: {self.resumo}"})
+        for pergunta, resposta in self.turnos:
+            mensagens.append({"role": "user", "content": pergunta})
+            mensagens.append({"role": "assistant", "content": resposta})
+        return mensagens
+    
+    def consulta(self, pergunta):
+        """Texto usado pra buscar os trechos: perguntas de seguimento ("e o segundo?") quase não
+        têm termos próprios, então vai junto a pergunta anterior"""
+        if not self.turnos:
+            return pergunta
+        return f"{self.turnos[-1][0]} {pergunta}"
+    
+    def estado(self):
+        """O que vai pro histórico pra dar pra continuar a conversa depois"""
+        return {'resumo': self.resumo, 'literais': len(self.turnos)}
+    
+    @classmethod
+    def retomar(cls, historico, arquivo, resumidor=None):
+        """Reconstrói a memória a partir das últimas conversas desse arquivo no histórico"""
+        # Reconstrói sem chamar a API; o resumidor só entra nas próximas perguntas
+        memoria = cls()
+        ultima = historico.ultimas(1, arquivo=arquivo)
+        if not ultima:
+            return memoria
+        estado = ultima[-1].get("memoria")
+        if estado:
+            # Já tem o resumo salvo - só precisa das trocas que ainda estavam inteiras
+            memoria.resumo = estado.get("resumo", "")
+            conversas = historico.ultimas(estado.get("literais", 0), arquivo=arquivo) if estado.get("literais") else []
+        else:
+            # Histórico antigo, sem memória salva: pega as últimas e resume localmente
+            conversas = historico.ultimas(memoria.literais * 3, arquivo=arquivo)
+        for conversa in conversas:
+            memoria.adicionar(conversa.get("pergunta", ""), conversa.get("resposta", ""))
+        memoria.resumidor = resumidor
+        return memoria
+
+def resumidor_com_ia(cliente, limitador=None):
+    """Atualiza o resumo com um turno novo numa chamada curta (não reescreve a conversa toda)"""
+    def resumir(resumo, pergunta, resposta):
+        prompt = (
+            f"Resumo atual da conversa:\n{resumo or '(vazio)'}\n\n"
+            f"Nova troca:\nPERGUNTA: {pergunta}\nRESPOSTA: {resposta}\n\n"
+            "Atualize o resumo incluindo a nova troca. Mantenha fatos, nomes e números importantes, "
+            "em português, em no máximo 120 palavras. Responda só com o resumo."
+        )
+        parametros = dict(
+            model=MODELO_IA,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=250,
+            temperature=0
+        )
+        with metricas.medir('openai.resumo'):
+            if limitador is not None:
+                retorno = limitador.completar(cliente, parametros)
+            else:
+                retorno = cliente.chat.completions.create(**parametros)
+        return retorno.choices[0].message.content
+    return resumir
+
+def preparar_requisicao(recursos, pergunta, cache=None, memoria=None):
+    """Escolhe o contexto, monta os parâmetros da chamada e já olha no cache"""
+    anteriores = memoria.mensagens() if memoria else []
+    # O documento fica com o que sobrar da janela do modelo depois das instruções,
+    # da conversa anterior e da pergunta
+    contador = obter_contador_tokens()
+    orcamento = contador.orcamento_contexto(anteriores + [{"role": "user", "content": montar_prompt("", pergunta)}])
+    consulta = memoria.consulta(pergunta) if memoria else pergunta
+    contexto = recursos.selecionar_contexto(consulta, orcamento)
+    parametros = dict(
+        model=MODELO_IA,
+        messages=anteriores + [{"role": "user", "content": montar_prompt(contexto, pergunta)}],
+        max_tokens=MAX_TOKENS_RESPOSTA,
+        temperature=TEMPERATURA
+    )
+    chave = None
+    guardada = None
+    if cache is not None:
+        documento = recursos.dados.get('hash') or recursos.nome_arquivo
+        chave = cache.chave(documento, contexto, pergunta, MODELO_IA, TEMPERATURA, MAX_TOKENS_RESPOSTA, anteriores)
+        guardada = cache.buscar(chave)
+    return {'parametros': parametros, 'chave': chave, 'guardada': guardada}
+
+def responder_pergunta(cliente, recursos, pergunta, cache=None, ao_receber=None, memoria=None, limitador=None):
+    """Monta o contexto, olha no cache e só chama a API se precisar.
+    Se passar ao_receber, a resposta vem em streaming e cada pedaço é entregue pra essa função.
+    Com limitador (LimitadorSincrono), a chamada respeita o rate limit e é repetida em erro temporário.
+    Devolve um dict com a resposta, se veio do cache e os tempos (primeiro token e total)."""
+    inicio = time.perf_counter()
+    # Prepara o contexto - só os trechos que têm a ver com a pergunta
+    requisicao = preparar_requisicao(recursos, pergunta, cache, memoria)
+    
+    guardada = requisicao['guardada']
+    if guardada is not None:
+        if ao_receber:
+            ao_receber(guardada)
+        decorrido = time.perf_counter() - inicio
+        return {'resposta': guardada, 'do_cache': True, 'tempo_primeiro_token': decorrido, 'tempo_total': decorrido}
+    
+    parametros = requisicao['parametros']
+    tempo_primeiro_token = None
+    
+    def criar(**extras):
+        if limitador is not None:
+            return limitador.completar(cliente, parametros, **extras)
+        return cliente.chat.completions.create(**extras, **parametros)
+    
+    uso = None
+    with metricas.medir('openai.completar'):
+        if ao_receber:
+            partes = []
+            # Só a abertura do stream é repetida - depois que começou a imprimir não dá pra voltar
+            for pedaco in criar(stream=True):
+                uso = getattr(pedaco, 'usage', None) or uso
+                if not pedaco.choices:
                     continue
-            
-            nova_chave = input("Digite sua nova chave: ").strip()
-            if nova_chave:
-                gerenciador_chaves.set_chave_openai(nova_chave)
-        
-        elif opcao == "2":
-            if gerenciador_chaves.get_chave_openai():
-                confirmar = input("Tem certeza que quer remover a chave? (s/N): ").lower()
-                if confirmar == 's':
-                    gerenciador_chaves.remover_chave()
-            else:
-                print("❌ Nenhuma chave para remover")
-        
-        elif opcao == "3":
-            break
-        
+                delta = pedaco.choices[0].delta.content
+                if delta:
+                    if tempo_primeiro_token is None:
+                        tempo_primeiro_token = time.perf_counter() - inicio
+                    partes.append(delta)
+                    ao_receber(delta)
+            resposta_texto = "".join(partes).strip()
         else:
-            print("❌ Opção inválida")
-        
-        input("\nEnter para continuar...")
+            resposta = criar()
+            uso = getattr(resposta, 'usage', None)
+            resposta_texto = resposta.choices[0].message.content.strip()
+    metricas.contar('openai.chamadas')
+    contar_tokens_api(parametros, resposta_texto, uso)
+    
+    tempo_total = time.perf_counter() - inicio
+    if requisicao['chave'] is not None and resposta_texto:
+        cache.guardar(requisicao['chave'], resposta_texto)
+    return {
+        'resposta': resposta_texto,
+        'do_cache': False,
+        'tempo_primeiro_token': tempo_primeiro_token if tempo_primeiro_token is not None else tempo_total,
+        'tempo_total': tempo_total
+    }
+
+# Balde de tokens pro rate limit: enche a uma taxa fixa e cada chamada tira um tanto
+class BaldeTokens:
+    def __init__(self, capacidade, por_segundo):
+        self.capacidade = capacidade
+        self.por_segundo = por_segundo
+        self.disponivel = capacidade
+        self.ultimo = time.monotonic()
+        self.trava = asyncio.Lock()
+        self.trava_sincrona = threading.Lock()
+    
+    def _tirar(self, quantidade):
+        """Tira do balde se tiver; senão devolve quantos segundos faltam"""
+        agora = time.monotonic()
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.ultimo) * self.por_segundo)
+        self.ultimo = agora
+        if self.disponivel >= quantidade:
+            self.disponivel -= quantidade
+            return 0
+        return (quantidade - self.disponivel) / self.por_segundo
+    
+    async def consumir(self, quantidade=1):
+        # Pedido maior que o balde inteiro nunca seria atendido - limita na capacidade
+        quantidade = min(quantidade, self.capacidade)
+        async with self.trava:
+            while True:
+                espera = self._tirar(quantidade)
+                if not espera:
+                    return
+                await asyncio.sleep(espera)
+    
+    def consumir_bloqueando(self, quantidade=1):
+        """Mesmo que o consumir, pra código síncrono (modo interativo)"""
+        quantidade = min(quantidade, self.capacidade)
+        with self.trava_sincrona:
+            while True:
+                espera = self._tirar(quantidade)
+                if not espera:
+                    return
+                time.sleep(espera)
+
+# Motor assíncrono pra muitas perguntas de uma vez: um cliente só (reaproveita a conexão),
+# limite de chamadas simultâneas, rate limit de RPM/TPM e retry com backoff exponencial + jitter
+class MotorAssincrono:
+    def __init__(self, chave, url_base=None, max_em_voo=MAX_EM_VOO, rpm=LIMITE_RPM, tpm=LIMITE_TPM,
+                 tentativas=TENTATIVAS_API):
+        from openai import AsyncOpenAI
+        # max_retries=0 porque o retry é feito aqui, respeitando o rate limit
+        self.cliente = AsyncOpenAI(api_key=chave, base_url=url_base, max_retries=0)
+        self.semaforo = asyncio.Semaphore(max_em_voo)
+        self.balde_requisicoes = BaldeTokens(rpm, rpm / 60)
+        self.balde_tokens = BaldeTokens(tpm, tpm / 60)
+        self.tentativas = tentativas
+        self.retentativas = 0
+    
+    @staticmethod
+    def _estimar_tokens(parametros):
+        # O que a API conta pro TPM: o prompt + o máximo da resposta
+        contador = obter_contador_tokens(parametros["model"])
+        return contador.contar_mensagens(parametros["messages"]) + parametros.get("max_tokens", 0)
+    
+    @staticmethod
+    def _pode_repetir(erro):
+        import openai
+        if isinstance(erro, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        return isinstance(erro, openai.APIStatusError) and erro.status_code >= 500
+    
+    @staticmethod
+    def _espera_sugerida(erro):
+        resposta = getattr(erro, "response", None)
+        try:
+            return float(resposta.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+    
+    @classmethod
+    def _espera(cls, erro, tentativa):
+        # Full jitter: espera aleatória até o teto exponencial (ou o Retry-After do servidor)
+        return cls._espera_sugerida(erro) or random.uniform(0, min(30.0, 0.5 * 2 ** tentativa))
+    
+    async def completar(self, parametros):
+        for tentativa in range(self.tentativas):
+            await self.balde_requisicoes.consumir(1)
+            await self.balde_tokens.consumir(self._estimar_tokens(parametros))
+            try:
+                async with self.semaforo:
+                    inicio = time.perf_counter()
+                    resposta = await self.cliente.chat.completions.create(**parametros)
+                    if metricas.ativo:
+                        metricas.registrar_tempo('openai.completar', time.perf_counter() - inicio)
+                resposta_texto = resposta.choices[0].message.content.strip()
+                metricas.contar('openai.chamadas')
+                contar_tokens_api(parametros, resposta_texto, getattr(resposta, 'usage', None))
+                return resposta_texto
+            except Exception as e:
+                if not self._pode_repetir(e) or tentativa == self.tentativas - 1:
+                    raise
+                self.retentativas += 1
+                metricas.contar('openai.retentativas')
+                await asyncio.sleep(self._espera(e, tentativa))
+    
+    async def responder(self, recursos, pergunta, cache=None):
+        """Mesmo que o responder_pergunta, mas sem travar o loop de eventos"""
+        inicio = time.perf_counter()
+        # Escolher o contexto é CPU - vai pra uma thread
+        requisicao = await asyncio.to_thread(preparar_requisicao, recursos, pergunta, cache)
+        if requisicao['guardada'] is not None:
+            resposta_texto = requisicao['guardada']
+            do_cache = True
+        else:
+            resposta_texto = await self.completar(requisicao['parametros'])
+            do_cache = False
+            if requisicao['chave'] is not None and resposta_texto:
+                await asyncio.to_thread(cache.guardar, requisicao['chave'], resposta_texto)
+        return {'resposta': resposta_texto, 'do_cache': do_cache, 'tempo_total': time.perf_counter() - inicio}
+    
+    async def fechar(self):
+        await self.cliente.close()
+
+# As mesmas regras (RPM/TPM, retry com backoff + jitter) pro cliente síncrono do modo interativo.
+# Um por processo: o limite é da conta, não da conversa
+class LimitadorSincrono:
+    def __init__(self, rpm=LIMITE_RPM, tpm=LIMITE_TPM, tentativas=TENTATIVAS_API):
+        self.balde_requisicoes = BaldeTokens(rpm, rpm / 60)
+        self.balde_tokens = BaldeTokens(tpm, tpm / 60)
+        self.tentativas = tentativas
+        self.retentativas = 0
+    
+    def chamar(self, funcao, tokens=0):
+        """funcao() respeitando o rate limit; erros temporários (429, 5xx, conexão) são repetidos"""
+        for tentativa in range(self.tentativas):
+            self.balde_requisicoes.consumir_bloqueando(1)
+            self.balde_tokens.consumir_bloqueando(tokens)
+            try:
+                return funcao()
+            except Exception as e:
+                if not MotorAssincrono._pode_repetir(e) or tentativa == self.tentativas - 1:
+                    raise
+                self.retentativas += 1
+                metricas.contar('openai.retentativas')
+                time.sleep(MotorAssincrono._espera(e, tentativa))
+    
+    def completar(self, cliente, parametros, **extras):
+        return self.chamar(lambda: cliente.chat.completions.create(**extras, **parametros),
+                           MotorAssincrono._estimar_tokens(parametros))
+
+_limitador_sincrono = None
+
+def obter_limitador_sincrono():
+    global _limitador_sincrono
+    if _limitador_sincrono is None:
+        _limitador_sincrono = LimitadorSincrono()
+    return _limitador_sincrono
+
+def erro_da_api(erro):
+    """True se o erro veio da OpenAI (chave, rede, limite), e não do processamento local"""
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(erro, openai.OpenAIError)
+
+def imprimir_pedaco(texto):
+    print(texto, end="", flush=True)
+
+def montar_contexto_inicio_fim(paginas, limite=LIMITE_CONTEXTO_TOKENS):
+    """Pega o começo e o fim do documento (limite em tokens) andando pelas páginas"""
+    contador = obter_contador_tokens()
+    if sum(contador.contar(texto) + 1 for _, texto in paginas) <= limite:
+        return " ".join(texto for _, texto in paginas)
+    
+    def pegar(ordem, do_fim):
+        partes = []
+        falta = limite // 2
+        for _, texto in ordem:
+            custo = contador.contar(texto)
+            if custo >= falta:
+                partes.append(contador.cortar(texto, falta, do_fim=do_fim))
+                break
+            partes.append(texto)
+            falta -= custo + 1
+        return partes
+    
+    inicio = pegar(paginas, False)
+    fim = pegar(reversed(paginas), True)
+    return " ".join(inicio) + " [...] " + " ".join(reversed(fim))
 
-def executar_modo_com_ia(dados_arquivo, historico, gerenciador_chaves):
+def criar_cliente_openai(gerenciador_chaves):
+    """Cliente da OpenAI pronto pra usar, ou None (já explicando o motivo pro usuário)"""
     # Verifica se openai está instalado
     try:
         from openai import OpenAI
     except ImportError:
         print("❌ Biblioteca OpenAI não encontrada")
         print("💡 Instale com: pip install openai")
-        return
+        return None
     
     # Pega a chave
     chave = gerenciador_chaves.get_chave_openai()
     if not chave:
         print("❌ Chave da OpenAI não configurada")
         print("💡 Configure sua chave primeiro no menu de gerenciamento")
-        return
+        return None
     
     # Tenta conectar
     try:
-        cliente = OpenAI(api_key=chave)
+        # max_retries=0: quem repete (com rate limit) é o LimitadorSincrono
+        return OpenAI(api_key=chave, base_url=gerenciador_chaves.get_url_base(), max_retries=0)
     except Exception as e:
         print(f"❌ Erro ao configurar OpenAI: {e}")
+        return None
+
+def executar_modo_com_ia(dados_arquivo, historico, gerenciador_chaves, recursos=None):
+    cliente = criar_cliente_openai(gerenciador_chaves)
+    if cliente is None:
         return
     
-    print(f"\n🤖 Modo Com IA - {dados_arquivo['nome_arquivo']}")
+    # Índice dos trechos é montado uma vez e serve pra todas as perguntas
+    conversar_com_ia(cliente, recursos or RecursosDocumento(dados_arquivo), historico)
+
+def conversar_com_ia(cliente, recursos, historico):
+    """Loop de perguntas; recursos pode ser um documento ou o corpus inteiro"""
+    print(f"\n🤖 Modo Com IA - {recursos.nome_arquivo}")
     print("=" * 50)
     print("💡 Faça perguntas sobre o documento")
     print("💡 Digite 'sair' para voltar")
     print("💡 Digite 'menu' para voltar ao menu anterior")
+    print("💡 Digite 'nova' para começar outra conversa (esquece as perguntas anteriores)")
+    
+    cache = obter_cache_respostas()
+    limitador = obter_limitador_sincrono()
+    resumidor = resumidor_com_ia(cliente, limitador) if MEMORIA_RESUMIR_COM_IA else None
+    memoria = MemoriaConversa(resumidor=resumidor)
+    if historico.ultimas(1, arquivo=recursos.nome_arquivo):
+        continuar = input("\n🧠 Continuar a conversa anterior sobre este arquivo? (s/n): ").strip().lower()
+        if continuar == "s":
+            memoria = MemoriaConversa.retomar(historico, recursos.nome_arquivo, resumidor)
+            print(f"✅ Retomada: {len(memoria.turnos)} trocas recentes" + (" + resumo" if memoria.resumo else ""))
     
     while True:
         pergunta = input("\n🎯 Sua pergunta: ").strip()
         
-        if pergunta.lower() in ['sair', 'exit', 'quit']:
+        if pergunta.lower() in ['sair', 'exit', 'quit', 'menu']:
             break
         
-        if pergunta.lower() == 'menu':
-            return
+        if pergunta.lower() == 'nova':
+            memoria.limpar()
+            print("🧹 Conversa nova - as perguntas anteriores não entram mais no contexto")
+            continue
         
         if not pergunta:
             print("❌ Pergunta não pode estar vazia")
             continue
         
-        # Prepara o contexto - não pode ser muito grande
-        contexto = dados_arquivo['texto']
-        if len(contexto) > 4000:
-            # Pega começo e fim do texto
-            contexto = contexto[:2000] + " [...] " + contexto[-2000:]
-        
-        prompt = f"""
-        Com base no seguinte documento, responda de forma precisa:
-
-        DOCUMENTO:
-        {contexto}
-
-        PERGUNTA: {pergunta}
-
-        Responda em português, sendo direto e baseado apenas no conteúdo do documento.
-        Se a informação não estiver no documento, diga claramente.
-        """
-        
         try:
             print("⏳ Processando sua pergunta...")
-            resposta = cliente.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=800,
-                temperature=0.3
-            )
+            print(f"\n🤖 Resposta:")
+            # Vai imprimindo conforme chega, não precisa esperar a resposta inteira
+            resultado = responder_pergunta(cliente, recursos, pergunta, cache, ao_receber=imprimir_pedaco,
+                                           memoria=memoria, limitador=limitador)
+            print()
+            memoria.adicionar(pergunta, resultado['resposta'])
             
-            resposta_texto = resposta.choices[0].message.content.strip()
-            print(f"\n🤖 Resposta:\n{resposta_texto}")
+            origem = "💾 do cache" if resultado['do_cache'] else f"1º token em {resultado['tempo_primeiro_token']:.2f}s"
+            print(f"\n⏱️  {origem} - total {resultado['tempo_total']:.2f}s")
             
             # Salva no histórico
             historico.salvar(
-                dados_arquivo['nome_arquivo'], 
+                recursos.nome_arquivo, 
                 pergunta, 
-                resposta_texto, 
-                "Modo com IA"
+                resultado['resposta'], 
+                "Modo com IA",
+                tempos={
+                    'primeiro_token': round(resultado['tempo_primeiro_token'], 3),
+                    'total': round(resultado['tempo_total'], 3),
+                    'cache': resultado['do_cache']
+                },
+                memoria=memoria.estado()
             )
             
         except Exception as e:
-            print(f"❌ Erro ao chamar a API: {e}")
-            print("💡 Verifique sua chave da API e conexão com internet")
+            if erro_da_api(e):
+                print(f"\n❌ Erro ao chamar a API: {e}")
+                print("💡 Verifique sua chave da API e conexão com internet")
+            else:
+                print(f"\n❌ Erro ao processar a pergunta: {type(e).__name__}: {e}")
+    
+    cache.mostrar_estatisticas()
 
-def menu_modo_com_ia(gerenciador_chaves, historico):
+def menu_modo_com_ia(gerenciador_chaves, historico, pool):
     while True:
         print(f"\n🤖 Modo Com IA Generativa")
         print("=" * 40)
@@ -630,9 +4325,9 @@ def menu_modo_com_ia(gerenciador_chaves, historico):
             try:
                 escolha = int(input(f"\nEscolha um arquivo (1-{len(arquivos)}): ")) - 1
                 if 0 <= escolha < len(arquivos):
-                    dados = gerenciador.carregar_arquivo(arquivos[escolha]['nome'])
-                    if dados:
-                        executar_modo_com_ia(dados, historico, gerenciador_chaves)
+                    recursos = pool.obter(arquivos[escolha]['nome'])
+                    if recursos:
+                        executar_modo_com_ia(recursos.dados, historico, gerenciador_chaves, recursos)
                 else:
                     print("❌ Escolha inválida")
             except ValueError:
@@ -649,11 +4344,755 @@ def menu_modo_com_ia(gerenciador_chaves, historico):
         
         input("\nPressione Enter para continuar...")
 
+# ========== MODO CORPUS ==========
+def executar_modo_corpus(corpus, historico, gerenciador_chaves):
+    print("\n⏳ Indexando arquivos novos ou alterados...")
+    adicionados, removidos = corpus.atualizar()
+    if not corpus.documentos:
+        return
+    print(f"📚 {len(corpus.documentos)} arquivos no corpus ({len(adicionados)} indexados agora, {len(removidos)} removidos)")
+    
+    while True:
+        print(f"\n📚 Modo Corpus - {len(corpus.documentos)} arquivos")
+        print("=" * 50)
+        print("1 - 🔍 Buscar palavra em todos")
+        print("2 - 🔑 Palavras-chave do corpus")
+        print("3 - 🤖 Perguntar à IA (usa todos os documentos)")
+        print("4 - 🔄 Reindexar mudanças da pasta")
+        print("5 - 🔙 Voltar")
+        
+        opcao = input("\nEscolha uma opção: ").strip()
+        
+        if opcao == "1":
+            palavra = input("Digite a palavra para buscar: ").strip()
+            if palavra:
+                corpus.buscar_palavra(palavra)
+        elif opcao == "2":
+            corpus.analisar_palavras_chave()
+        elif opcao == "3":
+            cliente = criar_cliente_openai(gerenciador_chaves)
+            if cliente is not None:
+                conversar_com_ia(cliente, corpus, historico)
+        elif opcao == "4":
+            adicionados, removidos = corpus.atualizar()
+            print(f"✅ {len(adicionados)} indexados, {len(removidos)} removidos")
+        elif opcao == "5":
+            break
+        else:
+            print("❌ Opção inválida")
+        
+        input("\nPressione Enter para continuar...")
+
+# ========== MODO EM LOTE ==========
+def percentil(valores, p):
+    """Percentil p (0-100) com interpolação linear"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(ordenados) - 1)
+    return ordenados[baixo] + (ordenados[alto] - ordenados[baixo]) * (posicao - baixo)
+
+def ler_jobs(caminho):
+    jobs = []
+    with open(caminho, "r", encoding="utf-8") as f:
+        for num_linha, linha in enumerate(f, 1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                job = json.loads(linha)
+            except ValueError as e:
+                print(f"⚠️  Linha {num_linha} ignorada (JSON inválido): {e}")
+                continue
+            if not job.get("file") or not job.get("question"):
+                print(f"⚠️  Linha {num_linha} ignorada (precisa de 'file' e 'question')")
+                continue
+            job["id"] = job.get("id", num_linha)
+            jobs.append(job)
+    return jobs
+
+async def executar_job(job, pool, motor, cache):
+    """Roda uma pergunta do lote e devolve o resultado (nunca levanta exceção)"""
+    inicio = time.perf_counter()
+    resultado = {"id": job["id"], "file": job["file"], "question": job["question"]}
+    modo = job.get("modo") or ("ia" if motor is not None else "busca")
+    resultado["modo"] = modo
+    try:
+        # Carregar e buscar é CPU/disco - roda em thread pra não travar as chamadas à API
+        recursos = await asyncio.to_thread(pool.obter, job["file"])
+        if recursos is None:
+            raise ValueError(f"não consegui carregar {job['file']}")
+        
+        if modo == "ia":
+            if motor is None:
+                raise ValueError("modo 'ia' precisa da chave da OpenAI configurada")
+            resposta = await motor.responder(recursos, job["question"], cache)
+            resultado["resposta"] = resposta["resposta"]
+            resultado["do_cache"] = resposta["do_cache"]
+        elif modo == "busca":
+            resultado.update(await asyncio.to_thread(buscar_para_lote, recursos, job["question"]))
+        else:
+            raise ValueError(f"modo desconhecido: {modo}")
+    except Exception as e:
+        resultado["erro"] = str(e)
+    resultado["latencia"] = round(time.perf_counter() - inicio, 4)
+    return resultado
+
+def buscar_para_lote(recursos, pergunta, aproximada=False):
+    analisador = recursos.analisador
+    if aproximada:
+        ocorrencias, candidatos = analisador.encontrar_aproximadas(pergunta)
+    else:
+        ocorrencias, candidatos = analisador.encontrar_ocorrencias(pergunta), None
+    resultado = {
+        "ocorrencias": len(ocorrencias),
+        "trechos": [
+            {"pagina": analisador.pagina_do_offset(inicio), "contexto": analisador.contexto(inicio, fim)}
+            for inicio, fim in ocorrencias[:6]
+        ]
+    }
+    if candidatos is not None:
+        resultado["candidatos"] = {palavra: achadas for palavra, achadas in candidatos}
+    return resultado
+
+async def _executar_lote(jobs, arquivo_saida, concorrencia, gerenciador_chaves):
+    # Sem chave (ou sem a biblioteca) o lote ainda roda os jobs de busca
+    motor = None
+    chave = gerenciador_chaves.get_chave_openai() if gerenciador_chaves else ""
+    if chave:
+        try:
+            motor = MotorAssincrono(chave, gerenciador_chaves.get_url_base())
+        except Exception as e:
+            print(f"⚠️  Sem OpenAI, só os jobs de busca vão funcionar: {e}")
+    
+    pool = PoolDocumentos()
+    cache = obter_cache_respostas()
+    limite = asyncio.Semaphore(concorrencia)
+    latencias = []
+    erros = 0
+    
+    async def com_limite(job):
+        async with limite:
+            return await executar_job(job, pool, motor, cache)
+    
+    print(f"🚚 Rodando {len(jobs)} jobs com concorrência {concorrencia}...")
+    inicio = time.perf_counter()
+    try:
+        with open(arquivo_saida, "w", encoding="utf-8") as saida:
+            for tarefa in asyncio.as_completed([com_limite(job) for job in jobs]):
+                resultado = await tarefa
+                saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                latencias.append(resultado["latencia"])
+                if "erro" in resultado:
+                    erros += 1
+    finally:
+        if motor is not None:
+            await motor.fechar()
+    decorrido = time.perf_counter() - inicio
+    
+    return {
+        "jobs": len(jobs),
+        "erros": erros,
+        "retentativas": motor.retentativas if motor else 0,
+        "documentos": pool.carregados,
+        "segundos": round(decorrido, 3),
+        "docs_por_segundo": round(pool.carregados / decorrido, 3) if decorrido else 0.0,
+        "perguntas_por_segundo": round(len(jobs) / decorrido, 3) if decorrido else 0.0,
+        "latencia_p50": round(percentil(latencias, 50), 4),
+        "latencia_p95": round(percentil(latencias, 95), 4)
+    }
+
+def executar_lote(arquivo_jobs, arquivo_saida, concorrencia=4, gerenciador_chaves=None):
+    """Responde um JSONL de {file, question} sem menus e grava os resultados em JSONL"""
+    jobs = ler_jobs(arquivo_jobs)
+    if not jobs:
+        print("❌ Nenhum job válido no arquivo")
+        return None
+    
+    resumo = asyncio.run(_executar_lote(jobs, arquivo_saida, concorrencia, gerenciador_chaves))
+    print(f"\n✅ Resultados em: {arquivo_saida}")
+    print(f"📊 {resumo['jobs']} perguntas ({resumo['erros']} com erro, {resumo['retentativas']} retentativas) em {resumo['segundos']}s")
+    print(f"   {resumo['docs_por_segundo']} docs/s | {resumo['perguntas_por_segundo']} perguntas/s")
+    print(f"   latência p50 {resumo['latencia_p50']}s | p95 {resumo['latencia_p95']}s")
+    return resumo
+
+# ========== BENCHMARK ==========
+# Mede carregar -> analisar -> buscar -> montar prompt -> responder com documentos sintéticos
+# A chamada da OpenAI é trocada por um cliente falso local, então dá pra rodar offline
+def gerar_texto_sintetico(paginas, palavras_por_pagina, semente=42):
+    """Páginas de texto ASCII com vocabulário em distribuição de Zipf (parecido com texto real)"""
+    gerador = random.Random(semente)
+    silabas = ["ca", "de", "fi", "go", "lu", "ma", "no", "pe", "ri", "sa", "te", "vo", "xi", "zu", "bra", "cor"]
+    vocabulario = sorted({"".join(gerador.choice(silabas) for _ in range(gerador.randint(2, 5))) for _ in range(5000)})
+    pesos = [1 / (i + 1) for i in range(len(vocabulario))]
+    resultado = []
+    for _ in range(paginas):
+        palavras = gerador.choices(vocabulario, weights=pesos, k=palavras_por_pagina)
+        sentencas = []
+        for inicio in range(0, len(palavras), 12):
+            sentenca = " ".join(palavras[inicio:inicio + 12])
+            sentencas.append(sentenca[:1].upper() + sentenca[1:] + ".")
+        resultado.append(" ".join(sentencas))
+    return resultado, vocabulario
+
+def escrever_pdf_sintetico(caminho, paginas, largura_linha=90):
+    """PDF mínimo feito na mão (Helvetica, uma página por item) - o PyPDF2 lê sem problema"""
+    objetos = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    ids_paginas = []
+    for texto in paginas:
+        linhas = []
+        atual = ""
+        for palavra in texto.split():
+            if len(atual) + len(palavra) + 1 > largura_linha:
+                linhas.append(atual)
+                atual = palavra
+            else:
+                atual = f"{atual} {palavra}" if atual else palavra
+        if atual:
+            linhas.append(atual)
+        comandos = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for linha in linhas:
+            escapada = linha.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            comandos.append(f"({escapada}) Tj T*")
+        comandos.append("ET")
+        conteudo = "\n".join(comandos)
+        objetos.append(f"<< /Length {len(conteudo.encode('latin-1'))} >>\nstream\n{conteudo}\nendstream")
+        id_conteudo = len(objetos)
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {id_conteudo} 0 R >>")
+        ids_paginas.append(len(objetos))
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in ids_paginas)}] /Count {len(ids_paginas)} >>"
+    
+    saida = bytearray(b"%PDF-1.4\n")
+    posicoes = []
+    for numero, objeto in enumerate(objetos, 1):
+        posicoes.append(len(saida))
+        saida += f"{numero} 0 obj\n{objeto}\nendobj\n".encode("latin-1")
+    inicio_xref = len(saida)
+    saida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for posicao in posicoes:
+        saida += f"{posicao:010d} 00000 n \n".encode("latin-1")
+    saida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode("latin-1")
+    with open(caminho, "wb") as f:
+        f.write(saida)
+
+# Cliente que imita o da OpenAI (só o chat.completions.create), pra medir sem rede
+class ClienteFalso:
+    def __init__(self, resposta="Resposta simulada.", latencia=0.0):
+        self.resposta = resposta
+        self.latencia = latencia
+        self.chat = self
+        self.completions = self
+    
+    def create(self, **parametros):
+        if self.latencia:
+            time.sleep(self.latencia)
+        mensagem = type("Mensagem", (), {"content": self.resposta})()
+        escolha = type("Escolha", (), {"message": mensagem})()
+        return type("Resposta", (), {"choices": [escolha]})()
+
+def _resumir_tempos(tempos):
+    return {
+        "repeticoes": len(tempos),
+        "min_ms": round(min(tempos) * 1000, 3),
+        "media_ms": round(sum(tempos) / len(tempos) * 1000, 3),
+        "p50_ms": round(percentil(tempos, 50) * 1000, 3),
+        "p95_ms": round(percentil(tempos, 95) * 1000, 3),
+        "max_ms": round(max(tempos) * 1000, 3)
+    }
+
+def medir_etapa(funcao, repeticoes=5, aquecimento=1):
+    """Roda funcao() algumas vezes (descartando o aquecimento) e mede tempo e pico de memória"""
+    for _ in range(aquecimento):
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    
+    # Memória numa rodada à parte - o tracemalloc deixa tudo mais lento e estragaria o tempo
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    resultado = _resumir_tempos(tempos)
+    resultado["pico_memoria_kb"] = round(pico / 1024, 1)
+    return resultado
+
+def executar_benchmark(paginas=50, palavras_por_pagina=400, repeticoes=5, aquecimento=1,
+                       arquivo_saida="benchmark_resultados.json", comparar_com=None):
+    global PASTA_INPUTS, _cache_extracao, _indice_vetorial
+    pasta_temp = tempfile.mkdtemp(prefix="bench_chatbot_")
+    pasta_original, cache_original, vetorial_original = PASTA_INPUTS, _cache_extracao, _indice_vetorial
+    try:
+        # Tudo numa pasta temporária pra não mexer nos inputs nem nos caches de verdade
+        # (extrações e índice vetorial - o montar_prompt e o responder_fake indexam o documento)
+        PASTA_INPUTS = pasta_temp
+        _cache_extracao = CacheExtracao(pasta=os.path.join(pasta_temp, "cache"))
+        _indice_vetorial = IndiceVetorial(EmbedderHashing(), pasta=os.path.join(pasta_temp, "vetores")) \
+            if np is not None and USAR_VETORES else None
+        
+        print(f"🧪 Gerando documentos sintéticos: {paginas} páginas x {palavras_por_pagina} palavras")
+        textos, vocabulario = gerar_texto_sintetico(paginas, palavras_por_pagina)
+        escrever_pdf_sintetico(os.path.join(pasta_temp, "bench.pdf"), textos)
+        with open(os.path.join(pasta_temp, "bench.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(textos))
+        
+        gerador = random.Random(7)
+        consultas = [gerador.choice(vocabulario[:500]) for _ in range(50)]
+        perguntas = [" ".join(gerador.sample(vocabulario[:2000], 6)) + "?" for _ in range(20)]
+        
+        dados = GerenciadorArquivos.carregar_arquivo("bench.pdf")
+        recursos = RecursosDocumento(dados)
+        analisador = recursos.analisador
+        cliente = ClienteFalso()
+        contador = itertools.count()
+        
+        etapas = {
+            "carregar_pdf": lambda: GerenciadorArquivos.carregar_arquivo("bench.pdf", usar_cache=False),
+            "carregar_pdf_cache": lambda: GerenciadorArquivos.carregar_arquivo("bench.pdf"),
+            "carregar_txt": lambda: GerenciadorArquivos.carregar_arquivo("bench.txt", usar_cache=False),
+            "analisador_init": lambda: AnalisadorTexto(paginas=dados['paginas']),
+            "buscar_palavra": lambda: [analisador.encontrar_ocorrencias(c) for c in consultas],
+            "indice_trechos": lambda: RecursosDocumento(dados).bm25,
+            "montar_prompt": lambda: montar_prompt(recursos.selecionar_contexto(perguntas[next(contador) % len(perguntas)]), "?"),
+            "responder_fake": lambda: responder_pergunta(cliente, recursos, perguntas[next(contador) % len(perguntas)])
+        }
+        
+        resultados = {}
+        for nome, funcao in etapas.items():
+            print(f"   ⏱️  {nome}...", end=" ", flush=True)
+            resultados[nome] = medir_etapa(funcao, repeticoes, aquecimento)
+            print(f"p50 {resultados[nome]['p50_ms']} ms | pico {resultados[nome]['pico_memoria_kb']} KB")
+    finally:
+        PASTA_INPUTS, _cache_extracao, _indice_vetorial = pasta_original, cache_original, vetorial_original
+        shutil.rmtree(pasta_temp, ignore_errors=True)
+    
+    relatorio = {
+        "versao_formato": 1,
+        "data": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {
+            "paginas": paginas,
+            "palavras_por_pagina": palavras_por_pagina,
+            "repeticoes": repeticoes,
+            "aquecimento": aquecimento
+        },
+        "etapas": resultados
+    }
+    with open(arquivo_saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Resultados salvos em: {arquivo_saida}")
+    
+    if comparar_com:
+        comparar_benchmarks(comparar_com, relatorio)
+    return relatorio
+
+def comparar_benchmarks(arquivo_anterior, atual):
+    """Mostra a variação do p50 de cada etapa em relação a um resultado salvo antes"""
+    try:
+        with open(arquivo_anterior, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+    except Exception as e:
+        print(f"❌ Não consegui ler {arquivo_anterior}: {e}")
+        return
+    print(f"\n📊 Comparando com {arquivo_anterior} (p50):")
+    for nome, etapa in atual["etapas"].items():
+        antes = anterior.get("etapas", {}).get(nome)
+        if not antes or not antes["p50_ms"]:
+            print(f"   {nome}: {etapa['p50_ms']} ms (novo)")
+            continue
+        variacao = (etapa["p50_ms"] - antes["p50_ms"]) / antes["p50_ms"]
+        print(f"   {nome}: {antes['p50_ms']} -> {etapa['p50_ms']} ms ({variacao:+.1%})")
+
+# ========== SERVIDOR HTTP ==========
+# Um processo só, com os documentos quentes no pool, atendendo vários clientes ao mesmo tempo.
+# HTTP/1.1 simples em cima do asyncio.start_server (sem dependência nova); o que é CPU vai pra thread
+class ErroHTTP(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+MOTIVOS_HTTP = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                408: "Request Timeout", 413: "Payload Too Large", 414: "URI Too Long",
+                431: "Request Header Fields Too Large",
+                500: "Internal Server Error", 503: "Service Unavailable"}
+
+class ServidorHTTP:
+    def __init__(self, pool, motor=None, cache=None):
+        self.pool = pool
+        self.motor = motor
+        self.cache = cache
+        self.atendidas = 0
+        self.rotas = {
+            ("GET", "/arquivos"): self.arquivos,
+            ("GET", "/buscar"): self.buscar,
+            ("GET", "/palavras-chave"): self.palavras_chave,
+            ("GET", "/estatisticas"): self.estatisticas,
+            ("POST", "/perguntar"): self.perguntar,
+            ("GET", "/saude"): self.saude
+        }
+    
+    # ----- HTTP -----
+    async def tratar_conexao(self, leitor, escritor):
+        try:
+            while True:
+                try:
+                    linha = await asyncio.wait_for(leitor.readline(), timeout=SERVIDOR_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    # Linha maior que o buffer do StreamReader (64 KB) - o resto dela ainda está no socket
+                    await self._responder(escritor, 414, {"erro": "linha de requisição grande demais"}, False)
+                    break
+                if not linha.strip():
+                    break
+                manter = await self._tratar_requisicao(linha, leitor, escritor)
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+    
+    async def _tratar_requisicao(self, linha, leitor, escritor):
+        inicio = time.perf_counter()
+        manter = False
+        rota = "?"
+        try:
+            try:
+                metodo, alvo, versao = linha.decode("latin-1").split()
+            except ValueError:
+                raise ErroHTTP(400, "linha de requisição inválida")
+            cabecalhos = await self._esperar(self._ler_cabecalhos(leitor), "cabeçalhos")
+            conexao = cabecalhos.get("connection", "").lower()
+            manter = conexao == "keep-alive" or (versao == "HTTP/1.1" and conexao != "close")
+            
+            try:
+                tamanho = int(cabecalhos.get("content-length") or 0)
+            except ValueError:
+                tamanho = -1
+            if tamanho < 0:
+                manter = False  # não dá pra saber onde o corpo termina
+                raise ErroHTTP(400, "Content-Length inválido")
+            if tamanho > SERVIDOR_MAX_CORPO:
+                manter = False
+                raise ErroHTTP(413, "corpo grande demais")
+            corpo = await self._esperar(leitor.readexactly(tamanho), "corpo") if tamanho else b""
+            
+            url = urlsplit(alvo)
+            rota = url.path.rstrip("/") or "/"
+            funcao = self.rotas.get((metodo, rota))
+            if funcao is None:
+                if any(caminho == rota for _, caminho in self.rotas):
+                    raise ErroHTTP(405, f"método {metodo} não aceito em {rota}")
+                raise ErroHTTP(404, f"rota {rota} não existe")
+            parametros = {chave: valores[-1] for chave, valores in parse_qs(url.query).items()}
+            status, resposta = 200, await funcao(parametros, corpo)
+        except ErroHTTP as e:
+            status, resposta = e.status, {"erro": str(e)}
+        except Exception as e:
+            status, resposta = 500, {"erro": str(e)}
+        
+        await self._responder(escritor, status, resposta, manter)
+        if metricas.ativo:
+            metricas.registrar_tempo(f"http.{rota.strip('/') or 'raiz'}", time.perf_counter() - inicio)
+        return manter
+    
+    async def _responder(self, escritor, status, resposta, manter):
+        dados = json.dumps(resposta, ensure_ascii=False).encode("utf-8")
+        escritor.write(
+            f"HTTP/1.1 {status} {MOTIVOS_HTTP.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(dados)}\r\n"
+            f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode("latin-1") + dados
+        )
+        await escritor.drain()
+        self.atendidas += 1
+        metricas.contar(f"http.status_{status}")
+    
+    @staticmethod
+    async def _esperar(leitura, parte):
+        try:
+            return await asyncio.wait_for(leitura, timeout=SERVIDOR_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ErroHTTP(408, f"demorou demais pra mandar os {parte}")
+    
+    @staticmethod
+    async def _ler_cabecalhos(leitor):
+        # Limita quantidade e tamanho - senão um cliente pode ficar mandando cabeçalho pra sempre
+        cabecalhos = {}
+        total = 0
+        while True:
+            try:
+                cabecalho = await leitor.readline()
+            except ValueError:
+                raise ErroHTTP(431, "cabeçalho grande demais")  # linha maior que o buffer do StreamReader
+            if cabecalho in (b"\r\n", b"\n", b""):
+                return cabecalhos
+            total += len(cabecalho)
+            if total > SERVIDOR_MAX_BYTES_CABECALHOS or len(cabecalhos) >= SERVIDOR_MAX_CABECALHOS:
+                raise ErroHTTP(431, "cabeçalhos demais")
+            nome, _, valor = cabecalho.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip()
+    
+    # ----- Ajudantes -----
+    @staticmethod
+    def _obrigatorio(parametros, nome):
+        valor = (parametros.get(nome) or "").strip()
+        if not valor:
+            raise ErroHTTP(400, f"falta o parâmetro '{nome}'")
+        return valor
+    
+    async def _recursos(self, nome_arquivo):
+        # Não deixa sair da pasta inputs com "../"
+        if os.path.basename(nome_arquivo) != nome_arquivo:
+            raise ErroHTTP(400, "nome de arquivo inválido")
+        if not os.path.isfile(os.path.join(PASTA_INPUTS, nome_arquivo)):
+            raise ErroHTTP(404, f"arquivo {nome_arquivo} não encontrado")
+        recursos = await asyncio.to_thread(self.pool.obter, nome_arquivo)
+        if recursos is None:
+            raise ErroHTTP(500, f"não consegui carregar {nome_arquivo}")
+        return recursos
+    
+    # ----- Rotas -----
+    async def arquivos(self, parametros, corpo):
+        arquivos = await asyncio.to_thread(GerenciadorArquivos.listar_arquivos)
+        return {"arquivos": [
+            {**arquivo, "carregado": self.pool.pronto(arquivo['nome'])} for arquivo in arquivos
+        ]}
+    
+    async def buscar(self, parametros, corpo):
+        recursos = await self._recursos(self._obrigatorio(parametros, "arquivo"))
+        termo = self._obrigatorio(parametros, "termo")
+        aproximada = parametros.get("aproximada", "").lower() in ("1", "true", "sim")
+        resultado = await asyncio.to_thread(buscar_para_lote, recursos, termo, aproximada)
+        return {"arquivo": recursos.nome_arquivo, "termo": termo, **resultado}
+    
+    async def palavras_chave(self, parametros, corpo):
+        recursos = await self._recursos(self._obrigatorio(parametros, "arquivo"))
+        try:
+            n = max(1, min(int(parametros.get("n", 15)), 200))
+        except ValueError:
+            raise ErroHTTP(400, "'n' precisa ser um número")
+        
+        def calcular():
+            analise = recursos.analisador.analise
+            return {
+                "arquivo": recursos.nome_arquivo,
+                "mais_frequentes": analise.mais_comuns(n),
+                "termos_tecnicos": analise.mais_comuns(5, filtro=lambda p: len(p) > 8)
+            }
+        return await asyncio.to_thread(calcular)
+    
+    async def estatisticas(self, parametros, corpo):
+        recursos = await self._recursos(self._obrigatorio(parametros, "arquivo"))
+        
+        def calcular():
+            analisador = recursos.analisador
+            analise = analisador.analise
+            por_sentenca = analise.palavras_por_sentenca
+            return {
+                "arquivo": recursos.nome_arquivo,
+                "metadados": recursos.dados['metadados'],
+                "sentencas": len(analisador.sentencas),
+                "palavras_uteis": analise.total_palavras,
+                "palavras_unicas": analise.palavras_unicas,
+                "densidade_lexica": analise.densidade_lexica,
+                "media_letras": analise.media_letras,
+                "hapax": analise.hapax,
+                "media_palavras_sentenca": sum(por_sentenca) / len(por_sentenca) if por_sentenca else 0.0,
+                "maior_sentenca": max(por_sentenca, default=0),
+                "menor_sentenca": min(por_sentenca, default=0)
+            }
+        return await asyncio.to_thread(calcular)
+    
+    async def perguntar(self, parametros, corpo):
+        if self.motor is None:
+            raise ErroHTTP(503, "OpenAI não configurada neste servidor")
+        try:
+            pedido = json.loads(corpo or b"{}")
+        except ValueError:
+            raise ErroHTTP(400, "corpo precisa ser JSON")
+        if not isinstance(pedido, dict):
+            raise ErroHTTP(400, "corpo precisa ser um objeto JSON")
+        arquivo = str(pedido.get("arquivo") or "").strip()
+        pergunta = str(pedido.get("pergunta") or "").strip()
+        if not arquivo or not pergunta:
+            raise ErroHTTP(400, "o corpo precisa ter 'arquivo' e 'pergunta'")
+        recursos = await self._recursos(arquivo)
+        resposta = await self.motor.responder(recursos, pergunta, self.cache)
+        return {"arquivo": recursos.nome_arquivo, "pergunta": pergunta, **resposta}
+    
+    async def saude(self, parametros, corpo):
+        # As threads de carga mexem no pool enquanto isso - lê a lista com a trava
+        with self.pool.trava:
+            carregados = list(self.pool.documentos)
+        return {
+            "documentos_carregados": carregados,
+            "memoria_estimada_mb": round(self.pool.memoria_estimada() / 1024 / 1024, 1),
+            "limite_mb": round(self.pool.limite_bytes / 1024 / 1024, 1) if self.pool.limite_bytes else None,
+            "despejados": self.pool.despejados,
+            "requisicoes": self.atendidas,
+            "ia": self.motor is not None
+        }
+
+async def _servir(host, porta, gerenciador_chaves, limite_mb):
+    motor = None
+    chave = gerenciador_chaves.get_chave_openai() if gerenciador_chaves else ""
+    if chave:
+        try:
+            motor = MotorAssincrono(chave, gerenciador_chaves.get_url_base())
+        except Exception as e:
+            print(f"⚠️  Sem OpenAI, o /perguntar vai responder 503: {e}")
+    
+    servidor_http = ServidorHTTP(PoolDocumentos(limite_mb), motor, obter_cache_respostas() if motor else None)
+    servidor = await asyncio.start_server(servidor_http.tratar_conexao, host, porta)
+    print(f"🌐 Servidor no ar em http://{host}:{porta} (pool até {limite_mb} MB) - Ctrl+C pra parar")
+    print("   GET /arquivos | GET /buscar?arquivo=&termo=[&aproximada=1] | GET /palavras-chave?arquivo=&n=")
+    print("   GET /estatisticas?arquivo= | POST /perguntar {\"arquivo\", \"pergunta\"} | GET /saude")
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        if motor is not None:
+            await motor.fechar()
+
+def executar_servidor(host=SERVIDOR_HOST, porta=SERVIDOR_PORTA, gerenciador_chaves=None, limite_mb=SERVIDOR_POOL_MB):
+    try:
+        asyncio.run(_servir(host, porta, gerenciador_chaves, limite_mb))
+    except KeyboardInterrupt:
+        print("\n👋 Servidor parado")
+
+# ========== MÉTRICAS ==========
+def menu_metricas():
+    while True:
+        metricas.mostrar()
+        print(f"\n📈 Métricas ({'ligadas' if metricas.ativo else 'desligadas'})")
+        print("1 - " + ("⏸️  Desligar" if metricas.ativo else "▶️  Ligar"))
+        print("2 - 💾 Exportar (JSON + Prometheus)")
+        print("3 - " + ("⏹️  Parar cProfile e salvar" if metricas.perfil else "🔬 Iniciar cProfile"))
+        print("4 - 🗑️  Zerar")
+        print("5 - ↩️  Voltar")
+        
+        opcao = input("\nEscolha: ").strip()
+        
+        if opcao == "1":
+            metricas.ativo = not metricas.ativo
+        elif opcao == "2":
+            try:
+                print(f"✅ Salvo em: {', '.join(metricas.exportar())}")
+            except Exception as e:
+                print(f"❌ Erro ao exportar: {e}")
+        elif opcao == "3":
+            if metricas.perfil:
+                print(f"✅ Perfil salvo em: {metricas.parar_perfil()}")
+            else:
+                metricas.iniciar_perfil()
+                print("🔬 cProfile ligado - use o programa e volte aqui pra parar")
+        elif opcao == "4":
+            metricas.zerar()
+        elif opcao == "5":
+            break
+        else:
+            print("❌ Opção inválida")
+
 # ========== PROGRAMA PRINCIPAL ==========
-def main():
-    historico = HistoricoConversas()
+def _inteiro_positivo(valor):
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"precisa ser um número inteiro (veio {valor})")
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"precisa ser pelo menos 1 (veio {valor})")
+    return numero
+
+def ler_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Chatbot para Análise de PDFs")
+    parser.add_argument("--lote", metavar="JOBS.jsonl",
+                        help="roda sem menus: um JSON por linha com {\"file\", \"question\"} (e \"modo\": ia|busca opcional)")
+    parser.add_argument("--saida", default="resultados_lote.jsonl", help="onde gravar os resultados do lote")
+    parser.add_argument("--concorrencia", type=_inteiro_positivo, default=4, help="quantos jobs ao mesmo tempo no lote")
+    parser.add_argument("--baixar-nltk", action="store_true", help="baixa os dados do NLTK (precisa de internet) e sai")
+    parser.add_argument("--nltk", action="store_true", help="usa o NLTK na análise (sentenças e palavras) em vez do regex")
+    parser.add_argument("--compactar-historico", action="store_true",
+                        help="reescreve o histórico sem linhas quebradas e sai")
+    parser.add_argument("--manter", type=_inteiro_positivo, metavar="N",
+                        help="com --compactar-historico, fica só com as N conversas mais recentes")
+    parser.add_argument("--servidor", action="store_true", help="sobe a API HTTP em vez dos menus")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--porta", type=int, default=SERVIDOR_PORTA)
+    parser.add_argument("--pool-mb", type=int, default=SERVIDOR_POOL_MB,
+                        help="memória (estimada) pros documentos carregados no servidor")
+    parser.add_argument("--metricas", action="store_true", help="liga as métricas desde o começo")
+    parser.add_argument("--perfil", action="store_true",
+                        help="roda tudo dentro do cProfile e salva o .prof ao sair (liga as métricas junto)")
+    parser.add_argument("--benchmark", action="store_true", help="mede cada etapa com documentos sintéticos e sai")
+    parser.add_argument("--bench-paginas", type=int, default=50)
+    parser.add_argument("--bench-palavras", type=int, default=400, help="palavras por página")
+    parser.add_argument("--bench-repeticoes", type=int, default=5)
+    parser.add_argument("--bench-aquecimento", type=int, default=1)
+    parser.add_argument("--bench-saida", default="benchmark_resultados.json")
+    parser.add_argument("--bench-comparar", metavar="ANTERIOR.json", help="mostra a diferença pra um resultado anterior")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global USAR_NLTK
+    args = ler_argumentos(argv)
+    if args.baixar_nltk:
+        if setup_nltk():
+            print("✅ Dados do NLTK baixados. Rode com --nltk pra usar na análise")
+        return
+    if args.nltk:
+        USAR_NLTK = True
+        if _recursos_nltk() is None:
+            print("⚠️  NLTK ou os dados dele não estão instalados - sigo com o regex (rode --baixar-nltk)")
+    
+    if args.compactar_historico:
+        total = HistoricoConversas().compactar(args.manter)
+        print(f"🧹 Histórico compactado: {total} conversas em {ARQUIVO_HISTORICO}")
+        return
+    
+    if args.benchmark:
+        executar_benchmark(args.bench_paginas, args.bench_palavras, args.bench_repeticoes,
+                           args.bench_aquecimento, args.bench_saida, args.bench_comparar)
+        return
+    
+    if args.metricas or args.perfil:
+        metricas.ativo = True
+    if args.perfil:
+        metricas.iniciar_perfil()
+        atexit.register(metricas.parar_perfil)
+    
     gerenciador_chaves = GerenciadorChaves()
     
+    if args.lote:
+        executar_lote(args.lote, args.saida, args.concorrencia, gerenciador_chaves)
+        if metricas.ativo:
+            print(f"📈 Métricas em: {', '.join(metricas.exportar())}")
+        return
+    
+    if args.servidor:
+        executar_servidor(args.host, args.porta, gerenciador_chaves, args.pool_mb)
+        if metricas.ativo:
+            print(f"📈 Métricas em: {', '.join(metricas.exportar())}")
+        return
+    
+    global _ingestor
+    historico = HistoricoConversas()
+    # Um pool só pra tudo: o que o vigia prepara em segundo plano é o que os menus usam
+    pool = PoolDocumentos(POOL_MB)
+    corpus = Corpus(pool)
+    if VIGIAR_PASTA:
+        _ingestor = IngestorBackground(pool)
+        _ingestor.iniciar()
+    
     print("🚀 Chatbot para Análise de PDFs")
     print("==========================================")
     print("Desenvolvido com Python + OpenAI")
@@ -662,18 +5101,33 @@ def main():
     while True:
         print("\n📋 Menu Principal")
         print("========================")
+        if _ingestor is not None:
+            print(_ingestor.status())
         print("1 - 🤖 Modo com IA Generativa")
         print("2 - 🎯 Modo sem IA (Análise)")
         print("3 - 📁 Listar arquivos")
         print("4 - 📝 Ver histórico")
-        print("5 - ❌ Sair")
+        print("5 - 📚 Modo Corpus (todos os arquivos)")
+        print("6 - 📈 Métricas")
+        print("7 - ❌ Sair")
         
         opcao = input("\nEscolha uma opção: ").strip()
         
-        if opcao == "5":
+        if opcao == "7":
             print("\n👋 Obrigado por usar o Chatbot! Até mais!")
+            if _ingestor is not None:
+                _ingestor.parar()
+            if metricas.ativo:
+                print(f"📈 Métricas salvas em: {', '.join(metricas.exportar())}")
             break
         
+        elif opcao == "6":
+            menu_metricas()
+        
+        elif opcao == "5":
+            # O corpus fica vivo entre as visitas ao menu, aí só reindexa o que mudou
+            executar_modo_corpus(corpus, historico, gerenciador_chaves)
+        
         elif opcao == "4":
             historico.mostrar()
         
@@ -698,16 +5152,16 @@ def main():
             try:
                 escolha = int(input(f"\nEscolha (1-{len(arquivos)}): ")) - 1
                 if 0 <= escolha < len(arquivos):
-                    dados = gerenciador.carregar_arquivo(arquivos[escolha]['nome'])
-                    if dados:
-                        executar_modo_sem_ia(dados)
+                    recursos = pool.obter(arquivos[escolha]['nome'])
+                    if recursos:
+                        executar_modo_sem_ia(recursos.dados, recursos)
                 else:
                     print("❌ Escolha inválida")
             except ValueError:
                 print("❌ Por favor, digite um número válido")
         
         elif opcao == "1":
-            menu_modo_com_ia(gerenciador_chaves, historico)
+            menu_modo_com_ia(gerenciador_chaves, historico, pool)
         
         else:
             print("❌ Opção inválida, tente novamente")